@@ -2,12 +2,71 @@
 
 import os
 import re
+import csv
 import json
+import time
+import sys
+import hashlib
+import gzip
+import zlib
+import queue
+import struct
+import zipfile
+import resource
+import socket
+import threading
+import http.client
+from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import click
+import requests
+import numpy as np
 # You may need to install https://github.com/yjcyxky/biominer-app-util firstly.
 from biominer_app_util.cli import render_app
 from subprocess import Popen, PIPE
 
+CROMWELL_JAR = '/venv/share/cromwell/cromwell.jar'
+CROMWELL_CONF = '/venv/cromwell-local.conf'
+HISAT2_INDEX_FILES = ["GRCh38.d1.vd1.fa.1.ht2", "GRCh38.d1.vd1.fa.2.ht2", "GRCh38.d1.vd1.fa.3.ht2",
+                      "GRCh38.d1.vd1.fa.4.ht2", "GRCh38.d1.vd1.fa.5.ht2", "GRCh38.d1.vd1.fa.6.ht2",
+                      "GRCh38.d1.vd1.fa.7.ht2", "GRCh38.d1.vd1.fa.8.ht2"]
+# Cromwell reports these states once a workflow will not change anymore.
+TERMINAL_STATES = ["Succeeded", "Failed", "Aborted"]
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "rseqc")
+# The task wrapper saves the resource usage of a task into its execution directory.
+TASK_USAGE_FILE = "rusage.json"
+PIPELINE_PROFILE_FILE = "pipeline_profile.json"
+# The marker of a preliminary run on the subsampled reads, it's read by the report.
+SUBSAMPLE_FILE = "subsample.json"
+# The report service started by `rseqc.py serve`, the report command is a client of it.
+DEFAULT_REPORT_SERVICE = "unix://" + os.path.join(DEFAULT_CACHE_DIR, "report.sock")
+REPORT_POLL_INTERVAL = 1
+# Cromwell uses these values when a task doesn't declare its runtime requirements.
+DEFAULT_TASK_CPU = 1
+DEFAULT_TASK_MEMORY = 2 * 1024 ** 3
+MEMORY_UNITS = {"": 1, "B": 1, "K": 1000, "KB": 1000, "KI": 1024, "KIB": 1024,
+                "M": 1000 ** 2, "MB": 1000 ** 2, "MI": 1024 ** 2, "MIB": 1024 ** 2,
+                "G": 1000 ** 3, "GB": 1000 ** 3, "GI": 1024 ** 3, "GIB": 1024 ** 3,
+                "T": 1000 ** 4, "TB": 1000 ** 4, "TI": 1024 ** 4, "TIB": 1024 ** 4}
+# The reference files up to this size are hashed in full, the bigger ones are keyed by their stat.
+FULL_HASH_SIZE = 64 * 1024 * 1024
+PREFLIGHT_CHUNK_SIZE = 4 * 1024 * 1024
+# The preflight checks the first reads of every file, the truncations after them are found by the workflow.
+PREFLIGHT_MAX_READS = 4000000
+# R1 and R2 are compared by the digests of the read ids of every block of reads.
+PREFLIGHT_PAIR_BLOCK = 100000
+# The quality and the base codes used by the quick look, see FastqStats.
+PHRED_OFFSET = 33
+MAX_PHRED = 94
+BASE_CODES = np.full(256, 4, dtype=np.int64)
+for code, base in enumerate(b"ACGT"):
+    BASE_CODES[base] = BASE_CODES[base + 32] = code
+GC_N_WEIGHTS = np.where(BASE_CODES == 4, 1000, (BASE_CODES == 1) | (BASE_CODES == 2)).astype(np.int64)
+# Like FastQC, the duplication is estimated from the first 100000 distinct sequences.
+DUPLICATION_LIMIT = 100000
+DUPLICATION_LEVELS = ["1", "2", "3", "4", "5", "6", "7", "8", "9", ">10", ">50", ">100", ">500", ">1k", ">5k", ">10k+"]
+
 
 def read_json(json_file):
     with open(json_file, "r") as f:
@@ -19,18 +78,1320 @@ def write_json(data, json_file):
         json.dump(data, f)
 
 
+def check_fastq_pair(r1, r2):
+    if not re.match(r'.*_R1.(fastq|fq).gz', r1):
+        raise Exception(
+            "The R1 fastq file must be with suffixes of _R1.fastq.gz or _R1.fq.gz")
+
+    if not re.match(r'.*_R2.(fastq|fq).gz', r2):
+        raise Exception(
+            "The R2 fastq file must be with suffixes of _R2.fastq.gz or _R2.fq.gz")
+
+
+def check_hisat2_index(hisat2_index):
+    for item in HISAT2_INDEX_FILES:
+        if not os.path.exists(os.path.join(hisat2_index, item)):
+            raise Exception("Cannot find %s in %s, you need to download hisat2 index files." % (item, hisat2_index))
+
+
+def is_bgzf(fpath):
+    """bgzip files are a series of small gzip members with their sizes in the headers."""
+    with open(fpath, "rb") as f:
+        header = f.read(18)
+    return len(header) == 18 and header[:4] == b"\x1f\x8b\x08\x04" and header[10:14] == b"\x06\x00BC"
+
+
+def read_bgzf_members(f, fpath):
+    offset = 0
+    while True:
+        header = f.read(18)
+        if not header:
+            return
+        if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04" or header[10:14] != b"\x06\x00BC":
+            raise Exception("%s is corrupted near byte %d: not a bgzf block." % (fpath, offset))
+        size = struct.unpack("<H", header[16:18])[0] + 1
+        member = header + f.read(size - 18)
+        if len(member) < size:
+            raise Exception("%s is truncated, the gzip stream ends unexpectedly." % fpath)
+        yield offset, member
+        offset += size
+
+
+def read_gzip_chunks(fpath, stop, chunk_size=PREFLIGHT_CHUNK_SIZE, threads=1):
+    """Decompress a gzip file chunk by chunk.
+
+    zlib verifies the CRC32 and the size of every gzip member, a corrupted or truncated
+    file raises an exception with the offset of the bad chunk. The members of a bgzip
+    file are independent, so they are decompressed by a pool of threads.
+    """
+    if threads > 1 and is_bgzf(fpath):
+        def decompress(batch):
+            try:
+                return b"".join([zlib.decompress(member, 16 + zlib.MAX_WBITS) for _, member in batch])
+            except zlib.error as e:
+                raise Exception("%s is corrupted near byte %d: %s" % (fpath, batch[0][0], e))
+
+        with open(fpath, "rb") as f, ThreadPoolExecutor(max_workers=threads) as executor:
+            futures, batch, batch_size = [], [], 0
+            for offset, member in read_bgzf_members(f, fpath):
+                batch.append((offset, member))
+                batch_size += len(member)
+                if batch_size < chunk_size:
+                    continue
+                futures.append(executor.submit(decompress, batch))
+                batch, batch_size = [], 0
+                # Keep a few chunks in flight to bound the memory.
+                if len(futures) > threads * 2:
+                    yield futures.pop(0).result()
+                if stop.is_set():
+                    return
+            if batch:
+                futures.append(executor.submit(decompress, batch))
+            for future in futures:
+                yield future.result()
+        return
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    started, offset = False, 0
+    with open(fpath, "rb") as f:
+        while not stop.is_set():
+            data = f.read(chunk_size)
+            if not data:
+                break
+
+            output = []
+            while data:
+                started = True
+                try:
+                    output.append(decompressor.decompress(data))
+                except zlib.error as e:
+                    raise Exception("%s is corrupted near byte %d: %s" % (fpath, offset, e))
+
+                if decompressor.eof:
+                    # Another gzip member follows.
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    started = False
+                else:
+                    data = b""
+            offset += chunk_size
+            yield b"".join(output)
+
+    if not stop.is_set() and started and not decompressor.eof:
+        raise Exception("%s is truncated, the gzip stream ends unexpectedly." % fpath)
+
+
+def read_gzip_lines(fpath, stop, chunk_size=PREFLIGHT_CHUNK_SIZE, threads=1):
+    """Yield the complete lines in every decompressed chunk of a gzip file."""
+    rest = b""
+    for chunk in read_gzip_chunks(fpath, stop, chunk_size, threads):
+        block = rest + chunk
+        end = block.rfind(b"\n")
+        if end < 0:
+            rest = block
+            continue
+        rest = block[end + 1:]
+        yield block[:end].split(b"\n")
+
+    if rest and not stop.is_set():
+        yield [rest]
+
+
+def duplication_slot(level):
+    for slot, threshold in enumerate([10000, 5000, 1000, 500, 100, 50, 10]):
+        if level >= threshold:
+            return 15 - slot
+    return level - 1
+
+
+class FastqStats:
+    """Accumulate the statistics of FastQC from the reads of a fastq file.
+
+    The reads of a chunk are concatenated into one flat array, the position of every base
+    in its read is computed once, so every statistic of a chunk is a bincount or a reduceat.
+    """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.reads = 0
+        self.quality = np.zeros((0, MAX_PHRED), dtype=np.int64)
+        self.bases = np.zeros((0, 5), dtype=np.int64)
+        self.lengths = np.zeros(1, dtype=np.int64)
+        self.read_quality = np.zeros(MAX_PHRED, dtype=np.int64)
+        self.gc = np.zeros(101, dtype=np.int64)
+        self.sequences = dict()
+        self.count_at_limit = None
+
+    def add(self, seqs, quals):
+        n = len(seqs)
+        lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=n)
+        if not np.array_equal(lengths, np.fromiter(map(len, quals), dtype=np.int64, count=n)):
+            raise Exception("The sequence and the quality of some reads in %s have different lengths." % self.fpath)
+
+        seq = np.frombuffer(b"".join(seqs), dtype=np.uint8)
+        quality = np.frombuffer(b"".join(quals), dtype=np.uint8).astype(np.intp) - PHRED_OFFSET
+        if quality.size > 0 and (quality.min() < 0 or quality.max() >= MAX_PHRED):
+            raise Exception("The qualities of %s are not encoded by Sanger / Illumina 1.9 (phred+33)." % self.fpath)
+
+        width = int(lengths.max()) if n > 0 else 0
+        if width > self.quality.shape[0]:
+            self.quality = np.vstack([self.quality, np.zeros((width - self.quality.shape[0], MAX_PHRED), dtype=np.int64)])
+            self.bases = np.vstack([self.bases, np.zeros((width - self.bases.shape[0], 5), dtype=np.int64)])
+
+        # The quality and the base of every position are counted by one bincount.
+        codes = quality * 5 + BASE_CODES[seq]
+        starts = np.cumsum(lengths) - lengths
+        if n > 0 and lengths.min() == width:
+            codes = (codes.reshape(n, width) + np.arange(width) * (MAX_PHRED * 5)).ravel()
+        else:
+            codes += (np.arange(codes.size) - np.repeat(starts, lengths)) * (MAX_PHRED * 5)
+        counts = np.bincount(codes, minlength=width * MAX_PHRED * 5).reshape(width, MAX_PHRED, 5)
+        self.quality[:width] += counts.sum(axis=2)
+        self.bases[:width] += counts.sum(axis=1)
+
+        length_counts = np.bincount(lengths)
+        if length_counts.size > self.lengths.size:
+            self.lengths = np.concatenate([self.lengths, np.zeros(length_counts.size - self.lengths.size, dtype=np.int64)])
+        self.lengths[:length_counts.size] += length_counts
+
+        # The sums of every read, empty reads are skipped because reduceat needs increasing offsets.
+        not_empty = lengths > 0
+        offsets = starts[not_empty]
+        if offsets.size > 0:
+            read_lengths = lengths[not_empty]
+            self.read_quality += np.bincount(np.add.reduceat(quality, offsets) // read_lengths, minlength=MAX_PHRED)
+            # G/C and N are summed together, a read has less than 1000 G/C bases.
+            gc_n = np.add.reduceat(GC_N_WEIGHTS[seq], offsets)
+            called = read_lengths - gc_n // 1000
+            gc = gc_n[called > 0] % 1000
+            self.gc += np.bincount(np.rint(gc * 100 / called[called > 0]).astype(np.int64), minlength=101)
+
+        # Long reads are truncated to 50bp as FastQC does, the errors at the ends inflate the diversity.
+        keys = seqs if width <= 75 else [seq[:50] if len(seq) > 75 else seq for seq in seqs]
+        sequences = self.sequences
+        counts = Counter(keys)
+        if self.count_at_limit is None and len(sequences) + len(counts) > DUPLICATION_LIMIT:
+            # The limit is reached in this chunk, so the sequences are admitted in the order they are seen.
+            for i, key in enumerate(keys):
+                if key in sequences:
+                    sequences[key] += 1
+                elif len(sequences) < DUPLICATION_LIMIT:
+                    sequences[key] = 1
+                elif self.count_at_limit is None:
+                    self.count_at_limit = self.reads + i
+        elif self.count_at_limit is None:
+            for key, count in counts.items():
+                sequences[key] = sequences.get(key, 0) + count
+        else:
+            for key in counts.keys() & sequences.keys():
+                sequences[key] += counts[key]
+        self.reads += n
+
+    def duplication(self):
+        """Return the total deduplicated percentage and the (deduplicated, total) percentages per level."""
+        count_at_limit = self.count_at_limit or self.reads
+        levels = np.bincount(np.fromiter(self.sequences.values(), dtype=np.int64, count=len(self.sequences)))
+        deduplicated, total = np.zeros(len(DUPLICATION_LEVELS)), np.zeros(len(DUPLICATION_LEVELS))
+        for level in np.nonzero(levels)[0]:
+            count = float(levels[level])
+            # The sequences with the same level which were not seen before the limit are extrapolated.
+            if count_at_limit < self.reads and self.reads - count >= count_at_limit:
+                i = np.arange(count_at_limit, dtype=np.float64)
+                not_seen = np.prod((self.reads - i - level) / (self.reads - i))
+                count = count / (1 - not_seen)
+            slot = duplication_slot(level)
+            deduplicated[slot] += count
+            total[slot] += count * level
+
+        if total.sum() == 0:
+            return 100.0, deduplicated, total
+        return (deduplicated.sum() / total.sum() * 100, deduplicated / deduplicated.sum() * 100,
+                total / total.sum() * 100)
+
+    def gc_deviation(self):
+        """The percentage of reads which deviate from a normal distribution of the GC content."""
+        total = self.gc.sum()
+        if total == 0:
+            return 0
+        gc = np.arange(101)
+        mode = gc[self.gc >= self.gc.max() * 0.9].mean()
+        stdev = np.sqrt((self.gc * (gc - mode) ** 2).sum() / max(total - 1, 1))
+        if stdev == 0:
+            return 0
+        theoretical = np.exp(-0.5 * ((gc - mode) / stdev) ** 2)
+        theoretical = theoretical / theoretical.sum() * total
+        return np.abs(theoretical - self.gc).sum() / total * 100
+
+    @staticmethod
+    def status(value, warn, fail, lower=False):
+        if (value < fail) if lower else (value > fail):
+            return "fail"
+        if (value < warn) if lower else (value > warn):
+            return "warn"
+        return "pass"
+
+    def write_fastqc_data(self, fpath):
+        """Write the statistics in the format of the fastqc_data.txt of FastQC."""
+        sections = []
+
+        bases = self.bases.sum(axis=0)
+        gc_content = int(bases[1:3].sum() * 100 / max(bases[:4].sum(), 1))
+        lengths = np.nonzero(self.lengths)[0]
+        min_length, max_length = (int(lengths.min()), int(lengths.max())) if lengths.size else (0, 0)
+        sections.append(("Basic Statistics", "pass", ["#Measure\tValue"] + [
+            "Filename\t%s" % os.path.basename(self.fpath),
+            "File type\tConventional base calls",
+            "Encoding\tSanger / Illumina 1.9",
+            "Total Sequences\t%d" % self.reads,
+            "Sequences flagged as poor quality\t0",
+            "Sequence length\t%s" % (min_length if min_length == max_length else "%d-%d" % (min_length, max_length)),
+            "%%GC\t%d" % gc_content
+        ]))
+
+        counts = self.quality.sum(axis=1)
+        cumulative = np.cumsum(self.quality, axis=1)
+        quantiles = [np.argmax(cumulative >= counts[:, None] * q, axis=1) for q in [0.5, 0.25, 0.75, 0.1, 0.9]]
+        mean = (self.quality * np.arange(MAX_PHRED)).sum(axis=1) / np.maximum(counts, 1)
+        status = "fail" if (quantiles[1] < 5).any() or (quantiles[0] < 20).any() else \
+            "warn" if (quantiles[1] < 10).any() or (quantiles[0] < 25).any() else "pass"
+        sections.append(("Per base sequence quality", status, [
+            "#Base\tMean\tMedian\tLower Quartile\tUpper Quartile\t10th Percentile\t90th Percentile"] + [
+            "%d\t%s\t%d\t%d\t%d\t%d\t%d" % ((i + 1, mean[i]) + tuple(q[i] for q in quantiles))
+            for i in range(len(counts))]))
+
+        scores = np.nonzero(self.read_quality)[0]
+        mode = int(np.argmax(self.read_quality))
+        sections.append(("Per sequence quality scores", self.status(mode, 27, 20, lower=True),
+                         ["#Quality\tCount"] + ["%d\t%d" % (q, self.read_quality[q])
+                                                for q in range(scores.min(), scores.max() + 1)]
+                         if scores.size else ["#Quality\tCount"]))
+
+        called = np.maximum(self.bases[:, :4].sum(axis=1), 1)[:, None]
+        content = self.bases[:, :4] * 100.0 / called
+        difference = max(np.abs(content[:, 0] - content[:, 3]).max(initial=0),
+                         np.abs(content[:, 1] - content[:, 2]).max(initial=0))
+        sections.append(("Per base sequence content", self.status(difference, 10, 20), ["#Base\tG\tA\tT\tC"] + [
+            "%d\t%s\t%s\t%s\t%s" % (i + 1, c[2], c[0], c[3], c[1]) for i, c in enumerate(content)]))
+
+        sections.append(("Per sequence GC content", self.status(self.gc_deviation(), 15, 30),
+                         ["#GC Content\tCount"] + ["%d\t%d" % (gc, count) for gc, count in enumerate(self.gc)]))
+
+        n_content = self.bases[:, 4] * 100.0 / np.maximum(self.bases.sum(axis=1), 1)
+        sections.append(("Per base N content", self.status(n_content.max(initial=0), 5, 20),
+                         ["#Base\tN-Count"] + ["%d\t%s" % (i + 1, n) for i, n in enumerate(n_content)]))
+
+        status = "fail" if self.lengths[0] > 0 else "warn" if min_length != max_length else "pass"
+        sections.append(("Sequence Length Distribution", status, ["#Length\tCount"] + [
+            "%d\t%d" % (length, self.lengths[length]) for length in range(min_length, max_length + 1)]))
+
+        deduplicated_percentage, deduplicated, total = self.duplication()
+        sections.append(("Sequence Duplication Levels", self.status(deduplicated_percentage, 70, 50, lower=True),
+                         ["#Total Deduplicated Percentage\t%s" % deduplicated_percentage,
+                          "#Duplication Level\tPercentage of deduplicated\tPercentage of total"] + [
+                             "%s\t%s\t%s" % (level, deduplicated[i], total[i])
+                             for i, level in enumerate(DUPLICATION_LEVELS)]))
+
+        overrepresented = sorted([(count, seq) for seq, count in self.sequences.items()
+                                  if count > self.reads * 0.001], reverse=True)
+        status = "pass" if len(overrepresented) == 0 else \
+            "fail" if overrepresented[0][0] > self.reads * 0.01 else "warn"
+        sections.append(("Overrepresented sequences", status, [] if len(overrepresented) == 0 else [
+            "#Sequence\tCount\tPercentage\tPossible Source"] + [
+            "%s\t%d\t%s\tNo Hit" % (seq.decode(errors="replace"), count, count * 100.0 / self.reads)
+            for count, seq in overrepresented]))
+
+        with open(fpath, "w") as f:
+            f.write("##FastQC\t0.11.9\n")
+            for name, status, lines in sections:
+                f.write(">>%s\t%s\n" % (name, status))
+                f.write("".join([line + "\n" for line in lines]))
+                f.write(">>END_MODULE\n")
+        return dict((name, status) for name, status, _ in sections)
+
+
+def quicklook_fastq(fpath, stop, threads=1, max_reads=None):
+    stats = FastqStats(fpath)
+    pending = []
+    for lines in read_gzip_lines(fpath, stop, threads=threads):
+        if pending:
+            lines = pending + lines
+        count = len(lines) // 4 * 4
+        if max_reads:
+            count = min(count, (max_reads - stats.reads) * 4)
+        records, pending = lines[:count], lines[count:]
+        stats.add(records[1::4], records[3::4])
+        if max_reads and stats.reads >= max_reads:
+            break
+    return stats
+
+
+def prefetch(generator, size=4):
+    """Run a generator in a thread, so the two mates are decompressed at the same time."""
+    items = queue.Queue(size)
+    done = object()
+
+    def produce():
+        try:
+            for item in generator:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def subsample_fastq_pair(r1, r2, pairs, output_dir, seed):
+    """Draw a reservoir sample of read pairs from R1 and R2 in one pass.
+
+    One random number is drawn for every read pair, so the sample only depends on the seed.
+    Only the selected reads are copied, the sampled pairs keep their order in the input files.
+    """
+    rng = np.random.default_rng(seed)
+    stop = threading.Event()
+    mates = [prefetch(read_gzip_lines(r1, stop)), prefetch(read_gzip_lines(r2, stop))]
+    buffers, finished = [[], []], [False, False]
+    reservoir, seen = dict(), 0
+
+    def record(lines, i):
+        return b"\n".join(lines[i * 4:i * 4 + 4]) + b"\n"
+
+    try:
+        while not all(finished):
+            # Read the mate which is behind, so the buffers differ by one chunk at most.
+            mate = min([mate for mate in [0, 1] if not finished[mate]], key=lambda mate: len(buffers[mate]))
+            lines = next(mates[mate], None)
+            if lines is None:
+                finished[mate] = True
+            else:
+                buffers[mate].extend(lines)
+
+            count = min(len(buffers[0]), len(buffers[1])) // 4
+            index = np.arange(seen, seen + count)
+            # Fill the reservoir first, then replace a random slot with the probability of pairs / (index + 1).
+            slots = np.where(index < pairs, index, rng.integers(0, index + 1) if count > 0 else index)
+            for i in np.nonzero(slots < pairs)[0]:
+                reservoir[slots[i]] = (seen + i, record(buffers[0], i), record(buffers[1], i))
+            buffers = [buffers[0][count * 4:], buffers[1][count * 4:]]
+            seen += count
+            for mate in [0, 1]:
+                if finished[mate] and any(buffers[1 - mate]):
+                    raise Exception("%s and %s have different numbers of reads, %s ends after %s reads."
+                                    % (r1, r2, [r1, r2][mate], seen))
+    finally:
+        stop.set()
+
+    if any(line for line in buffers[0] + buffers[1]):
+        raise Exception("%s and %s have different numbers of reads." % (r1, r2))
+
+    os.makedirs(output_dir, exist_ok=True)
+    sampled = sorted(reservoir.values())
+    # Keep the file names, the names of the fastqc results are derived from them.
+    outputs = [os.path.join(output_dir, os.path.basename(r1)), os.path.join(output_dir, os.path.basename(r2))]
+    for mate, fpath in enumerate(outputs):
+        # A fixed mtime keeps the output identical between runs, so the results can be cached.
+        with gzip.GzipFile(fpath, "wb", compresslevel=1, mtime=0) as f:
+            f.writelines([item[mate + 1] for item in sampled])
+
+    return outputs, {
+        "pairs": len(sampled),
+        "total_pairs": seen,
+        "seed": seed,
+        "read1": os.path.abspath(r1),
+        "read2": os.path.abspath(r2)
+    }
+
+
+class PairChecker:
+    """Collect the read id digests of R1 and R2 from two threads and stop both at the first mismatch."""
+
+    def __init__(self, r1, r2):
+        self.fpaths = [r1, r2]
+        self.digests = [dict(), dict()]
+        self.finished = [None, None]
+        self.error = None
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.stop.set()
+
+    def add_block(self, mate, index, digest, first_id):
+        with self.lock:
+            other = self.digests[1 - mate].pop(index, None)
+            if other is None:
+                self.digests[mate][index] = (digest, first_id)
+                return
+        if other[0] != digest:
+            first = index * PREFLIGHT_PAIR_BLOCK
+            ids = (first_id, other[1]) if mate == 0 else (other[1], first_id)
+            self.fail("The read ids of %s and %s are not paired between read %d and read %d (%s vs %s)."
+                      % (self.fpaths[0], self.fpaths[1], first + 1, first + PREFLIGHT_PAIR_BLOCK,
+                         ids[0].decode(errors="replace"), ids[1].decode(errors="replace")))
+
+    def check_count(self, mate, reads, finished=False):
+        other = self.finished[1 - mate]
+        if finished:
+            self.finished[mate] = reads
+        if (other is not None and reads > other) or (finished and other is not None and reads != other):
+            self.fail("%s has %s%s reads, but %s has %s reads." % (
+                self.fpaths[mate], reads, "" if finished else " or more", self.fpaths[1 - mate], other))
+
+
+def scan_fastq(fpath, mate, checker, max_reads=0):
+    """Check the format of every read of a gzipped fastq file and count them.
+
+    Only the first max_reads reads are checked if it's not 0, the file is not read to its end.
+    """
+    stats = {"reads": 0, "complete": True}
+    pending, digest, block_index, block_reads, first_id = [], hashlib.blake2b(), 0, 0, None
+    for lines in read_gzip_lines(fpath, checker.stop):
+        if pending:
+            lines = pending + lines
+        count = len(lines) // 4 * 4
+        records, pending = lines[:count], lines[count:]
+        headers, seqs, pluses, quals = records[0::4], records[1::4], records[2::4], records[3::4]
+        if max_reads and stats["reads"] + len(headers) >= max_reads:
+            keep = max_reads - stats["reads"]
+            headers, seqs, pluses, quals = headers[:keep], seqs[:keep], pluses[:keep], quals[:keep]
+            stats["complete"] = False
+        if len(headers) == 0:
+            continue
+
+        # Joined lines are checked in one pass instead of a python loop over the reads.
+        if (b"\n" + b"\n".join(headers)).count(b"\n@") != len(headers) \
+                or (b"\n" + b"\n".join(pluses)).count(b"\n+") != len(pluses):
+            bad = [i for i in range(len(headers)) if not headers[i].startswith(b"@")
+                   or not pluses[i].startswith(b"+")][0]
+            raise Exception("The read %d of %s is not a valid fastq record: %s"
+                            % (stats["reads"] + bad + 1, fpath, headers[bad][:100].decode(errors="replace")))
+
+        lengths = list(map(len, seqs))
+        if lengths != list(map(len, quals)):
+            bad = [i for i in range(len(seqs)) if len(seqs[i]) != len(quals[i])][0]
+            raise Exception("The sequence and the quality of the read %d of %s have different lengths: %s"
+                            % (stats["reads"] + bad + 1, fpath, headers[bad][:100].decode(errors="replace")))
+
+        stats["reads"] += len(headers)
+
+        while headers:
+            part, headers = headers[:PREFLIGHT_PAIR_BLOCK - block_reads], headers[PREFLIGHT_PAIR_BLOCK - block_reads:]
+            # Drop the comment and the mate suffix (/1, /2) of the read ids.
+            ids = (b"\n".join([header.split(None, 1)[0] for header in part]) + b"\n") \
+                .replace(b"/1\n", b"\n").replace(b"/2\n", b"\n")
+            first_id = first_id or ids[:ids.find(b"\n")]
+            digest.update(ids)
+            block_reads += len(part)
+            if block_reads == PREFLIGHT_PAIR_BLOCK:
+                checker.add_block(mate, block_index, digest.digest(), first_id)
+                digest, block_index, block_reads, first_id = hashlib.blake2b(), block_index + 1, 0, None
+        checker.check_count(mate, stats["reads"])
+        if not stats["complete"]:
+            break
+
+    if checker.stop.is_set():
+        return stats
+    if stats["complete"] and any(pending):
+        raise Exception("%s ends with an incomplete fastq record." % fpath)
+    if block_reads > 0:
+        checker.add_block(mate, block_index, digest.digest(), first_id)
+    checker.check_count(mate, stats["reads"], finished=True)
+    return stats
+
+
+def preflight_fastq_pair(r1, r2, max_reads=0):
+    """Stream R1 and R2 in two threads (zlib releases the GIL) before the pipeline is launched.
+
+    Returns the number of read pairs, which is complete if the files are read to their ends,
+    raises an exception at the first corrupted, truncated or unpaired record.
+    """
+    start = time.time()
+    checker = PairChecker(r1, r2)
+    results = [None, None]
+
+    def scan(mate):
+        try:
+            results[mate] = scan_fastq(checker.fpaths[mate], mate, checker, max_reads)
+        except Exception as e:
+            checker.fail(str(e))
+
+    threads = [threading.Thread(target=scan, args=(mate,), daemon=True) for mate in [0, 1]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if checker.error:
+        raise Exception(checker.error)
+
+    return {
+        "reads": results[0]["reads"],
+        "complete": results[0]["complete"] and results[1]["complete"],
+        "elapsed": time.time() - start
+    }
+
+
+def read_sample_sheet(sample_sheet):
+    """Read a sample sheet with the columns of sample, read1 and read2.
+
+    Relative fastq paths are resolved against the directory of the sample sheet.
+    """
+    sheet_dir = os.path.dirname(os.path.abspath(sample_sheet))
+    samples = []
+    with open(sample_sheet, "r") as f:
+        dialect = csv.Sniffer().sniff(f.readline(), delimiters=",\t")
+        f.seek(0)
+        for row in csv.DictReader(f, dialect=dialect):
+            missing = [key for key in ["sample", "read1", "read2"] if not row.get(key)]
+            if missing:
+                raise Exception("The sample sheet %s must contain the columns of sample, read1 and read2, "
+                                "but %s is missing in %s." % (sample_sheet, ", ".join(missing), row))
+
+            sample = {
+                "sample": row["sample"].strip(),
+                "read1": os.path.join(sheet_dir, row["read1"].strip()),
+                "read2": os.path.join(sheet_dir, row["read2"].strip())
+            }
+            if sample["sample"] in [item["sample"] for item in samples]:
+                raise Exception("Duplicated sample %s in %s." % (sample["sample"], sample_sheet))
+
+            for read in [sample["read1"], sample["read2"]]:
+                if not os.path.isfile(read):
+                    raise Exception("Cannot find %s for the sample %s." % (read, sample["sample"]))
+            samples.append(sample)
+
+    if len(samples) == 0:
+        raise Exception("No samples found in %s." % sample_sheet)
+
+    return samples
+
+
+def render_workflow(wdl_dir, output_workflow_dir, project_name, r1, r2, hisat2_index, fastq_screen_conf, gtf):
+    """Render the workflow for one sample and return the paths of the inputs, workflow and tasks files."""
+    data_dict = {
+        "project_name": project_name,
+        "read1": r1,
+        "read2": r2,
+        "idx": hisat2_index,
+        "fastq_screen_conf": fastq_screen_conf,
+        "gtf": gtf
+    }
+
+    os.makedirs(output_workflow_dir, exist_ok=True)
+    render_app(wdl_dir, output_dir=output_workflow_dir,
+               project_name=project_name, sample=data_dict)
+
+    inputs_fpath = os.path.join(output_workflow_dir, "inputs")
+    workflow_fpath = os.path.join(output_workflow_dir, "workflow.wdl")
+    tasks_path = os.path.join(output_workflow_dir, "tasks.zip")
+    return inputs_fpath, workflow_fpath, tasks_path
+
+
+def call_cromwell(inputs_fpath, workflow_fpath, workflow_root, tasks_path, metadata_fpath, job_limit=None):
+    # cmd = ['cromwell', 'run', workflow_fpath, "-i", inputs_fpath,
+    #        "-p", tasks_path, "--workflow-root", workflow_root]
+    cmd = ['java', '-Dconfig.file=%s' % CROMWELL_CONF] + job_limit_options(job_limit) + ['-jar', CROMWELL_JAR, 'run', workflow_fpath, "-i", inputs_fpath, "-p", tasks_path, "--workflow-root", workflow_root,
+           "--metadata-output", metadata_fpath]
+    print('Run workflow and output results to %s.' % workflow_root)
+    proc = Popen(cmd, stdin=PIPE)
+    proc.communicate()
+    return proc.returncode
+
+
+def job_limit_options(job_limit):
+    """Every job takes at least one core, so cromwell runs at most as many jobs as the cores."""
+    if not job_limit:
+        return []
+    return ['-Dbackend.providers.Local.config.concurrent-job-limit=%s' % job_limit]
+
+
+def read_bgzf_trailers(f, fpath):
+    """The CRC32 and ISIZE trailers of the members of a bgzip file, found by the sizes in
+    the headers without reading the members."""
+    size, offset = os.fstat(f.fileno()).st_size, 0
+    while offset < size:
+        f.seek(offset)
+        header = f.read(18)
+        if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04" or header[10:14] != b"\x06\x00BC":
+            raise Exception("%s is corrupted near byte %d: not a bgzf block." % (fpath, offset))
+        offset += struct.unpack("<H", header[16:18])[0] + 1
+        f.seek(offset - 8)
+        trailer = f.read(8)
+        if len(trailer) < 8:
+            raise Exception("%s is truncated, the gzip stream ends unexpectedly." % fpath)
+        yield trailer
+
+
+def fingerprint_file(fpath, block_size=1 << 20):
+    """Fingerprint a fastq file by its size and the sha256 of its content.
+
+    An edit of a gzip member only changes the CRC32 at the end of this member. The members
+    of a bgzip file are found by their headers, so its head, middle and tail blocks and the
+    CRC32 and ISIZE trailers of all its members are hashed, without reading the whole file.
+    The members of any other gzip file (e.g. concatenated gzip files) can only be found by
+    decompressing it, so such a file, or an uncompressed one, is hashed in full.
+    """
+    size = os.path.getsize(fpath)
+    sha256 = hashlib.sha256(str(size).encode())
+    with open(fpath, "rb") as f:
+        if not is_bgzf(fpath):
+            for block in iter(lambda: f.read(block_size), b""):
+                sha256.update(block)
+            return sha256.hexdigest()
+
+        for offset in sorted(set([0, max(size // 2 - block_size // 2, 0), max(size - block_size, 0)])):
+            f.seek(offset)
+            sha256.update(f.read(block_size))
+        for trailer in read_bgzf_trailers(f, fpath):
+            sha256.update(trailer)
+    return sha256.hexdigest()
+
+
+def fingerprint_stat(fpath):
+    """Fingerprint a file by its real path, size and modification time.
+
+    The uncompressed reference files (e.g. the hisat2 index) can be changed in the middle
+    without touching the sampled blocks, so they are keyed by their stat instead.
+    """
+    stat = os.stat(fpath)
+    return "%s:%s:%s" % (os.path.realpath(fpath), stat.st_size, stat.st_mtime_ns)
+
+
+def fingerprint_reference(fpath):
+    """Hash a small reference file (e.g. the gtf or a config file) in full, key a big one by its stat."""
+    if os.path.getsize(fpath) > FULL_HASH_SIZE:
+        return fingerprint_stat(fpath)
+
+    sha256 = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def fastq_screen_databases(fastq_screen_conf):
+    """The files of the bowtie2 indexes of the DATABASE lines of a fastq_screen config file.
+
+    The relative paths of the indexes are resolved against the directory of the config file.
+    """
+    conf_dir = os.path.dirname(os.path.abspath(fastq_screen_conf))
+    databases = dict()
+    with open(fastq_screen_conf, "r") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 3 or fields[0] != "DATABASE":
+                continue
+
+            prefix = os.path.join(conf_dir, fields[2])
+            index_dir, basename = os.path.split(prefix)
+            files = sorted(os.path.join(index_dir, fname) for fname in os.listdir(index_dir)
+                           if fname.startswith(basename + ".")) if os.path.isdir(index_dir) else []
+            databases[fields[1]] = files
+    return databases
+
+
+def fingerprint_dir(dirpath):
+    """Fingerprint all files in a directory by their relative paths and whole contents."""
+    sha256 = hashlib.sha256()
+    for root, dirs, files in os.walk(dirpath):
+        dirs.sort()
+        for fname in sorted(files):
+            fpath = os.path.join(root, fname)
+            sha256.update(os.path.relpath(fpath, dirpath).encode())
+            with open(fpath, "rb") as f:
+                sha256.update(f.read())
+    return sha256.hexdigest()
+
+
+def link_tree(src_dir, dest_dir):
+    """Reproduce the tree of src_dir in dest_dir with hard links, fall back to symbolic links across devices."""
+    for root, dirs, files in os.walk(src_dir):
+        target_root = os.path.join(dest_dir, os.path.relpath(root, src_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for fname in files:
+            src = os.path.join(root, fname)
+            dest = os.path.join(target_root, fname)
+            if os.path.lexists(dest):
+                continue
+
+            try:
+                os.link(src, dest)
+            except OSError:
+                os.symlink(os.path.realpath(src), dest)
+
+
+def parse_cromwell_time(value):
+    """Convert a timestamp of Cromwell metadata (e.g. 2022-06-01T08:00:00.123Z) to seconds since epoch."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def make_pipeline_profile(metadata, sample):
+    """Summarize the start/end, cpu time and peak memory of every task of a workflow.
+
+    The timings come from the Cromwell metadata, the cpu time and the peak memory are
+    recorded by the task wrapper (see task_wrapper) into the execution directory of a task.
+    """
+    tasks = []
+    for name, attempts in metadata.get("calls", {}).items():
+        for attempt in attempts:
+            start = parse_cromwell_time(attempt.get("start"))
+            end = parse_cromwell_time(attempt.get("end"))
+            runtime = attempt.get("runtimeAttributes", {})
+            task = {
+                "task": name.split(".")[-1],
+                "shard": attempt.get("shardIndex", -1),
+                "attempt": attempt.get("attempt", 1),
+                "status": attempt.get("executionStatus"),
+                "cached": attempt.get("callCaching", {}).get("hit", False),
+                "start": attempt.get("start"),
+                "end": attempt.get("end"),
+                "wall_time": end - start if start and end else None,
+                "cpu": int(runtime["cpu"]) if "cpu" in runtime else None,
+                "memory": parse_memory(runtime["memory"]) if "memory" in runtime else None,
+                "cpu_time": None,
+                "max_rss": None
+            }
+
+            usage_fpath = os.path.join(attempt.get("callRoot", ""), "execution", TASK_USAGE_FILE)
+            if attempt.get("callRoot") and os.path.exists(usage_fpath):
+                usage = read_json(usage_fpath)
+                task["cpu_time"] = usage.get("cpu_time")
+                task["max_rss"] = usage.get("max_rss")
+            tasks.append(task)
+
+    return {
+        "sample": sample,
+        "workflow_id": metadata.get("id"),
+        "workflow_name": metadata.get("workflowName"),
+        "status": metadata.get("status"),
+        "start": metadata.get("start"),
+        "end": metadata.get("end"),
+        "tasks": sorted(tasks, key=lambda task: task["start"] or "")
+    }
+
+
+def save_pipeline_profile(metadata, sample):
+    """Save the profile into the workflow root, so it's collected with the results of the workflow."""
+    profile_fpath = os.path.join(metadata["workflowRoot"], PIPELINE_PROFILE_FILE)
+    write_json(make_pipeline_profile(metadata, sample), profile_fpath)
+    return profile_fpath
+
+
+def read_process_table():
+    """Return {pid: (ppid, rss)} of all processes, rss is in bytes."""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    processes = dict()
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % pid, "r") as f:
+                # The command name may contain spaces, so the fields are counted after it.
+                fields = f.read().rsplit(")", 1)[1].split()
+            processes[int(pid)] = (int(fields[1]), int(fields[21]) * page_size)
+        except (OSError, IndexError, ValueError):
+            continue
+    return processes
+
+
+def process_tree_rss(root_pid):
+    processes = read_process_table()
+    children = dict()
+    for pid, (ppid, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+
+    rss, stack = 0, [root_pid]
+    while len(stack) > 0:
+        pid = stack.pop()
+        rss += processes.get(pid, (0, 0))[1]
+        stack.extend(children.get(pid, []))
+    return rss
+
+
+class ResultCache:
+    """Map the fingerprint of the inputs of a sample to the results of a succeeded workflow.
+
+    Every entry is a json file named by the key, it records the workflow root and the
+    directory of the results relative to the workflow root.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(r1, r2, hisat2_index, fastq_screen_conf, gtf, wdl_dir, subsample=None):
+        manifest = {
+            "read1": fingerprint_file(r1),
+            "read2": fingerprint_file(r2),
+            "hisat2_index": dict((item, fingerprint_stat(os.path.join(hisat2_index, item)))
+                                 for item in HISAT2_INDEX_FILES),
+            "fastq_screen_conf": fingerprint_reference(fastq_screen_conf),
+            "fastq_screen_databases": dict((name, [fingerprint_stat(fpath) for fpath in files])
+                                           for name, files in fastq_screen_databases(fastq_screen_conf).items()),
+            "gtf": fingerprint_reference(gtf),
+            "workflow": fingerprint_dir(wdl_dir) if os.path.exists(wdl_dir) else None
+        }
+        if subsample:
+            manifest["subsample"] = subsample
+        return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, key):
+        entry_fpath = os.path.join(self.cache_dir, "%s.json" % key)
+        if not os.path.exists(entry_fpath):
+            return None
+
+        entry = read_json(entry_fpath)
+        if not os.path.isdir(os.path.join(entry["workflow_root"], entry["result_dir"])):
+            # The results were removed after they were cached.
+            os.remove(entry_fpath)
+            return None
+
+        return entry
+
+    def store(self, key, workflow_root, result_dir, sample):
+        write_json({
+            "key": key,
+            "workflow_root": os.path.abspath(workflow_root),
+            "result_dir": result_dir,
+            "sample": sample,
+            "created": time.time()
+        }, os.path.join(self.cache_dir, "%s.json" % key))
+
+    def restore(self, entry, workflow_root):
+        """Link the cached results into workflow_root, return the directory of the results."""
+        src_dir = os.path.join(entry["workflow_root"], entry["result_dir"])
+        dest_dir = os.path.join(workflow_root, entry["result_dir"])
+        if os.path.realpath(src_dir) != os.path.realpath(dest_dir):
+            link_tree(src_dir, dest_dir)
+        return dest_dir
+
+
+class CromwellServer:
+    """A long-lived cromwell instance in server mode, all workflows submitted to it share one JVM.
+
+    The workflow root of the Local backend is pointed to `workflow_root`, so the results
+    have the same layout as `cromwell run --workflow-root`.
+    """
+
+    def __init__(self, workflow_root, port=8000, job_limit=None):
+        self.workflow_root = workflow_root
+        self.port = port
+        self.job_limit = job_limit
+        self.url = "http://127.0.0.1:%s" % port
+        self.proc = None
+
+    def start(self, timeout=300):
+        cmd = ['java', '-Dconfig.file=%s' % CROMWELL_CONF] + job_limit_options(self.job_limit) + [
+               '-Dwebservice.port=%s' % self.port,
+               '-Dwebservice.interface=127.0.0.1',
+               '-Dbackend.providers.Local.config.root=%s' % self.workflow_root,
+               '-jar', CROMWELL_JAR, 'server']
+        print('Start cromwell server on %s and output results to %s.' % (self.url, self.workflow_root))
+        self.proc = Popen(cmd, stdin=PIPE)
+
+        started = time.time()
+        while time.time() - started < timeout:
+            if self.proc.poll() is not None:
+                raise Exception("Cromwell server exited unexpectedly with code %s." % self.proc.returncode)
+
+            try:
+                requests.get("%s/engine/v1/version" % self.url, timeout=5).raise_for_status()
+                return
+            except requests.RequestException:
+                time.sleep(2)
+
+        self.stop()
+        raise Exception("Cromwell server is not ready in %s seconds." % timeout)
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            self.proc.wait()
+
+    def submit(self, inputs_fpath, workflow_fpath, tasks_path):
+        with open(workflow_fpath, "rb") as workflow, open(inputs_fpath, "rb") as inputs, \
+                open(tasks_path, "rb") as tasks:
+            files = {
+                "workflowSource": workflow,
+                "workflowInputs": inputs,
+                "workflowDependencies": tasks
+            }
+            response = requests.post("%s/api/workflows/v1" % self.url, files=files, timeout=60)
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def status(self, workflow_id):
+        response = requests.get("%s/api/workflows/v1/%s/status" % (self.url, workflow_id), timeout=60)
+        response.raise_for_status()
+        return response.json()["status"]
+
+    def running_calls(self, workflow_id):
+        """Return the names of the calls which are not done yet, the workflow name prefix is stripped."""
+        response = requests.get("%s/api/workflows/v1/%s/metadata" % (self.url, workflow_id),
+                                params={"includeKey": "executionStatus", "expandSubWorkflows": "false"},
+                                timeout=60)
+        response.raise_for_status()
+        calls = dict()
+        for name, attempts in response.json().get("calls", {}).items():
+            # Keep the status of the last attempt of every shard
+            for attempt in attempts:
+                calls[(name.split(".")[-1], attempt.get("shardIndex", -1))] = attempt.get("executionStatus")
+        return [name for (name, shard), status in calls.items() if status not in ["Done", "Failed", "Aborted"]]
+
+    def metadata(self, workflow_id):
+        response = requests.get("%s/api/workflows/v1/%s/metadata" % (self.url, workflow_id),
+                                params={"expandSubWorkflows": "false"}, timeout=300)
+        response.raise_for_status()
+        return response.json()
+
+
+def parse_memory(value):
+    """Convert a WDL memory string such as "8 GB" or "500M" to bytes."""
+    matched = re.match(r'^\s*([\d.]+)\s*([A-Za-z]*)\s*$', str(value))
+    if not matched or matched.group(2).upper() not in MEMORY_UNITS:
+        raise ValueError("Cannot parse the memory requirement %s." % value)
+    return int(float(matched.group(1)) * MEMORY_UNITS[matched.group(2).upper()])
+
+
+def parse_wdl_requirements(workflow_fpath, tasks_path, inputs_fpath=None):
+    """Read the cpu and memory of every task from the runtime sections of the rendered workflow.
+
+    The runtime values can be literals or the inputs of a task, inputs are resolved
+    from the inputs file first and then from their defaults in the task.
+    Returns a dict of {task_name: {"cpu": cores, "memory": bytes}}.
+    """
+    sources = []
+    with open(workflow_fpath, "r") as f:
+        sources.append(f.read())
+    if os.path.exists(tasks_path):
+        with zipfile.ZipFile(tasks_path) as tasks_zip:
+            for name in tasks_zip.namelist():
+                if name.endswith(".wdl"):
+                    sources.append(tasks_zip.read(name).decode("utf-8"))
+    inputs = read_json(inputs_fpath) if inputs_fpath and os.path.exists(inputs_fpath) else {}
+
+    requirements = dict()
+    for source in sources:
+        for task in re.finditer(r'\btask\s+(\w+)\s*\{', source):
+            name = task.group(1)
+            next_task = re.search(r'\btask\s+\w+\s*\{', source[task.end():])
+            body = source[task.end():task.end() + next_task.start()] if next_task else source[task.end():]
+            defaults = dict(re.findall(r'(?:Int|String|Float)\??\s+(\w+)\s*=\s*"?([^"\n]+?)"?\s*$',
+                                       body, re.MULTILINE))
+            for key, value in inputs.items():
+                if key.endswith(".%s.%s" % (name, key.split(".")[-1])):
+                    defaults[key.split(".")[-1]] = value
+
+            runtime = re.search(r'\bruntime\s*\{(.*?)\n\s*\}', body, re.DOTALL)
+            attrs = dict(re.findall(r'(\w+)\s*:\s*"?([^"\n]+?)"?\s*$', runtime.group(1), re.MULTILINE)) \
+                if runtime else {}
+
+            def resolve(attr, default, parse):
+                value = attrs.get(attr)
+                if value is None:
+                    return default
+                value = str(value).strip().strip("${}")
+                value = defaults.get(value, value)
+                try:
+                    return parse(value)
+                except ValueError:
+                    return default
+
+            requirements[name] = {
+                "cpu": resolve("cpu", DEFAULT_TASK_CPU, lambda x: max(int(float(x)), 1)),
+                "memory": resolve("memory", DEFAULT_TASK_MEMORY, parse_memory)
+            }
+    return requirements
+
+
+def parse_wdl_stages(workflow_fpath):
+    """Group the calls of the rendered workflow into stages of calls which can run at the same time.
+
+    A call is in the stage after the last of the calls whose outputs it takes, so the calls
+    of a stage are independent (e.g. fastqc, fastq_screen and hisat2 all take the fastq files).
+    Returns a dict of {call_name: (task_name, stage)}.
+    """
+    with open(workflow_fpath, "r") as f:
+        source = f.read()
+
+    calls = dict()
+    for call in re.finditer(r'\bcall\s+([\w.]+)(?:\s+as\s+(\w+))?', source):
+        task = call.group(1).split(".")[-1]
+        body = ""
+        block = re.match(r'\s*\{', source[call.end():])
+        if block:
+            depth, start = 0, call.end() + block.end() - 1
+            for end in range(start, len(source)):
+                depth += {"{": 1, "}": -1}.get(source[end], 0)
+                if depth == 0:
+                    body = source[start:end]
+                    break
+        calls[call.group(2) or task] = (task, body)
+
+    stages = dict()
+
+    def stage(name, path):
+        if name not in stages:
+            task, body = calls[name]
+            inputs = set(re.findall(r'\b(\w+)\.\w+', body)) & set(calls)
+            inputs = inputs - path - set([name])
+            stages[name] = (task, max([stage(item, path | set([name]))[1] + 1 for item in inputs] or [0]))
+        return stages[name]
+
+    for name in calls:
+        stage(name, set())
+    return stages
+
+
+def total_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class LocalScheduler:
+    """Pack the workflows of many samples onto one node without oversubscribing it.
+
+    The independent calls of a workflow run at the same time, so every running workflow
+    reserves its running calls plus the stage (see parse_wdl_stages) of the calls not
+    started yet which needs the most. The reservation shrinks after the heavy steps (e.g.
+    hisat2) finish and another sample can be started while the running ones are in
+    single-threaded steps.
+    """
+
+    def __init__(self, server, cores, memory, concurrency, poll_interval=30):
+        self.server = server
+        self.cores = cores
+        self.memory = memory
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.table_lines = 0
+
+    @staticmethod
+    def reservation(sample, calls=None):
+        """The cpu and memory of the running calls and of the biggest stage of the other calls.
+
+        Without the stages of the workflow all calls are taken as one stage.
+        """
+        requirements = sample["requirements"]
+        stages = sample.get("stages") or dict((name, (name, 0)) for name in requirements)
+        if calls is None:
+            calls = set(stages)
+        running = set(sample.get("running_tasks", []))
+
+        cores, memory = Counter(), Counter()
+        for name in calls:
+            task, stage = stages.get(name, (name, 0))
+            if task not in requirements:
+                continue
+            # The running calls overlap with any stage which comes next.
+            key = "running" if name in running else stage
+            cores[key] += requirements[task]["cpu"]
+            memory[key] += requirements[task]["memory"]
+        if len(cores) == 0:
+            return DEFAULT_TASK_CPU, DEFAULT_TASK_MEMORY
+
+        pending = [key for key in cores if key != "running"]
+        return (cores["running"] + max([cores[key] for key in pending] or [0]),
+                memory["running"] + max([memory[key] for key in pending] or [0]))
+
+    def reserved(self, running):
+        return (sum(sample["reserved"][0] for sample in running),
+                sum(sample["reserved"][1] for sample in running))
+
+    def fits(self, sample, running):
+        if len(running) >= self.concurrency:
+            return False
+        if len(running) == 0:
+            # A sample which needs more than the whole node still needs to be run.
+            return True
+
+        cores, memory = self.reservation(sample)
+        reserved_cores, reserved_memory = self.reserved(running)
+        return reserved_cores + cores <= self.cores and reserved_memory + memory <= self.memory
+
+    def print_table(self, samples):
+        lines = ["%-24s %-12s %6s %10s %10s  %s" % ("Sample", "Status", "Cores", "Memory", "Elapsed", "Running tasks")]
+        for sample in samples:
+            start = sample.get("start")
+            elapsed = (sample.get("end") or time.time()) - start if start else 0
+            cores, memory = sample.get("reserved", (0, 0))
+            lines.append("%-24s %-12s %6s %9.1fG %9dm  %s" % (
+                sample["sample"][:24], sample.get("status", "Pending"), cores, memory / 1024 ** 3,
+                elapsed // 60, ", ".join(sorted(sample.get("running_tasks", [])))))
+        reserved_cores, reserved_memory = self.reserved([s for s in samples if s.get("status") not in
+                                                         TERMINAL_STATES + ["Cached", "SubmitFailed"]
+                                                         and "reserved" in s])
+        lines.append("Reserved %s/%s cores, %.1f/%.1fG memory." % (reserved_cores, self.cores,
+                                                                    reserved_memory / 1024 ** 3,
+                                                                    self.memory / 1024 ** 3))
+        if sys.stdout.isatty() and self.table_lines > 0:
+            # Redraw the table in place
+            sys.stdout.write("\x1b[%dA\x1b[J" % self.table_lines)
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+        self.table_lines = len(lines)
+
+    def run(self, samples):
+        pending = [sample for sample in samples if sample.get("status") != "Cached"]
+        running = []
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and self.fits(pending[0], running):
+                sample = pending.pop(0)
+                try:
+                    sample["workflow_id"] = self.server.submit(sample["inputs"], sample["workflow"], sample["tasks"])
+                    sample["status"] = "Submitted"
+                    sample["start"] = time.time()
+                    sample["reserved"] = self.reservation(sample)
+                    running.append(sample)
+                except requests.RequestException as e:
+                    sample["status"] = "SubmitFailed"
+                    sample["error"] = str(e)
+
+            self.print_table(samples)
+            if len(running) == 0:
+                continue
+
+            time.sleep(self.poll_interval)
+            for sample in list(running):
+                try:
+                    sample["status"] = self.server.status(sample["workflow_id"])
+                    if sample["status"] not in TERMINAL_STATES:
+                        sample["running_tasks"] = self.server.running_calls(sample["workflow_id"])
+                except requests.RequestException as e:
+                    sample["error"] = str(e)
+                    continue
+
+                if sample["status"] in TERMINAL_STATES:
+                    sample["end"] = time.time()
+                    sample["running_tasks"] = []
+                    sample["reserved"] = (0, 0)
+                    running.remove(sample)
+                elif sample["status"] == "Running" and len(sample["running_tasks"]) > 0:
+                    # Only the tasks which are not done yet are still reserved.
+                    sample["reserved"] = self.reservation(sample, self.remaining_tasks(sample))
+
+        self.print_table(samples)
+        return samples
+
+    @staticmethod
+    def remaining_tasks(sample):
+        """The running tasks and the tasks which have not been started yet."""
+        done = sample.setdefault("done_tasks", set())
+        for name in sample.get("seen_tasks", set()) - set(sample["running_tasks"]):
+            done.add(name)
+        sample["seen_tasks"] = sample.get("seen_tasks", set()) | set(sample["running_tasks"])
+        return set(sample.get("stages") or sample["requirements"]) - done
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class ReportServiceClient:
+    def __init__(self, address, timeout=10):
+        self.address = address
+        self.timeout = timeout
+
+    def connection(self):
+        if self.address.startswith("unix://"):
+            return UnixHTTPConnection(self.address[len("unix://"):], timeout=self.timeout)
+        return http.client.HTTPConnection(self.address.replace("http://", "").rstrip("/"), timeout=self.timeout)
+
+    def request(self, method, path, data=None):
+        conn = self.connection()
+        try:
+            body = json.dumps(data) if data is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            result = json.loads(response.read().decode("utf-8"))
+        finally:
+            conn.close()
+
+        if response.status >= 400:
+            raise Exception("The report service returns %s: %s" % (response.status, result.get("error")))
+        return result
+
+    def is_alive(self):
+        try:
+            self.request("GET", "/health")
+            return True
+        except (OSError, http.client.HTTPException, ValueError):
+            return False
+
+    def submit(self, job):
+        return self.request("POST", "/jobs", job)
+
+    def wait(self, job_id, poll_interval=REPORT_POLL_INTERVAL):
+        while True:
+            job = self.request("GET", "/jobs/%s" % job_id)
+            if job["status"] in TERMINAL_STATES:
+                return job
+            time.sleep(poll_interval)
+
+
 @click.group()
 def rseqc():
     pass
 
 
 @rseqc.command(help="Run the pipeline for RNA-Seq data.")
-@click.option('--r1', required=True,
+@click.option('--r1', required=False,
               type=click.Path(exists=True, file_okay=True, dir_okay=False),
               help="The fastq file with suffixes of _R1.fastq.gz or _R1.fq.gz.")
-@click.option('--r2', required=True,
+@click.option('--r2', required=False,
               type=click.Path(exists=True, file_okay=True, dir_okay=False),
               help="The fastq file with suffixes of _R2.fastq.gz or _R2.fq.gz.")
+@click.option('--sample-sheet', required=False,
+              type=click.Path(exists=True, file_okay=True, dir_okay=False),
+              help="A csv/tsv file with the columns of sample, read1 and read2. All samples will be submitted to one cromwell server instead of --r1/--r2.")
+@click.option('--concurrency', required=False, default=4, show_default=True,
+              type=click.IntRange(min=1),
+              help="How many samples can be run at the same time when --sample-sheet is specified.")
+@click.option('--cores', required=False, default=os.cpu_count(), show_default=True,
+              type=click.IntRange(min=1),
+              help="How many cores of this node can be used, cromwell runs at most this many jobs at the same time.")
+@click.option('--memory', required=False, default=None, type=click.FloatRange(min=0),
+              help="How much memory (GB) of this node can be used when --sample-sheet is specified. [default: all memory]")
+@click.option('--port', required=False, default=8000, show_default=True,
+              type=int,
+              help="The port of the cromwell server when --sample-sheet is specified.")
+@click.option('--cache-dir', required=False, default=DEFAULT_CACHE_DIR, show_default=True,
+              type=click.Path(file_okay=False, dir_okay=True),
+              help="A directory to record the results of succeeded samples, the samples with the same inputs will not be processed again.")
+@click.option('--no-cache', is_flag=True, default=False,
+              help="Process all samples even if their results are cached.")
+@click.option('--skip-preflight', is_flag=True, default=False,
+              help="Don't check the gzip streams and the pairing of the fastq files before running the workflow.")
+@click.option('--preflight-reads', required=False, default=PREFLIGHT_MAX_READS, show_default=True,
+              type=click.IntRange(min=0),
+              help="Only check the first N reads of every fastq file before running the workflow, 0 means all reads.")
+@click.option('--subsample', required=False, default=None, type=click.IntRange(min=1),
+              help="Only run the workflow on N read pairs drawn from every sample for a preliminary report.")
+@click.option('--seed', required=False, default=20220101, show_default=True, type=int,
+              help="The random seed of --subsample.")
 @click.option('--hisat2-index', '-i', required=True,
               type=click.Path(exists=True, dir_okay=True, file_okay=False),
               help="The index for the reference genome.")
@@ -43,53 +1404,259 @@ def rseqc():
 @click.option('--fastq-screen-conf', '-s', required=True,
               type=click.Path(exists=True, file_okay=True, dir_okay=False),
               help="The config file for fastq-screen, the reference genomes must be located in the same directory with config file.")
-def workflow(r1, r2, hisat2_index, fastq_screen_conf, gtf, output_dir):
-    if not re.match(r'.*_R1.(fastq|fq).gz', r1):
-        raise Exception(
-            "The R1 fastq file must be with suffixes of _R1.fastq.gz or _R1.fq.gz")
+def workflow(r1, r2, sample_sheet, concurrency, cores, memory, port, cache_dir, no_cache, skip_preflight,
+             preflight_reads, subsample, seed,
+             hisat2_index, fastq_screen_conf, gtf, output_dir):
+    if sample_sheet and (r1 or r2):
+        raise Exception("--sample-sheet cannot be used with --r1/--r2.")
 
-    if not re.match(r'.*_R2.(fastq|fq).gz', r2):
-        raise Exception(
-            "The R2 fastq file must be with suffixes of _R2.fastq.gz or _R2.fq.gz")
+    if not sample_sheet and not (r1 and r2):
+        raise Exception("You need to specify --r1 and --r2, or --sample-sheet.")
+
+    if sample_sheet:
+        samples = read_sample_sheet(sample_sheet)
+    else:
+        samples = [{"sample": "rseqc", "read1": r1, "read2": r2}]
+
+    for sample in samples:
+        check_fastq_pair(sample["read1"], sample["read2"])
 
     wdl_dir = '/venv/workflow'
     if not os.path.exists(wdl_dir):
         print("Cannot find the workflow, please contact the administrator.")
 
-    for item in ["GRCh38.d1.vd1.fa.1.ht2", "GRCh38.d1.vd1.fa.2.ht2", "GRCh38.d1.vd1.fa.3.ht2",
-              "GRCh38.d1.vd1.fa.4.ht2", "GRCh38.d1.vd1.fa.5.ht2", "GRCh38.d1.vd1.fa.6.ht2",
-              "GRCh38.d1.vd1.fa.7.ht2", "GRCh38.d1.vd1.fa.8.ht2"]:
-        if not os.path.exists(os.path.join(hisat2_index, item)):
-            raise Exception("Cannot find %s in %s, you need to download hisat2 index files." % (item, hisat2_index))
-
-    project_name = "rseqc"
-    data_dict = {
-        "project_name": project_name,
-        "read1": r1,
-        "read2": r2,
-        "idx": hisat2_index,
-        "fastq_screen_conf": fastq_screen_conf,
-        "gtf": gtf
-    }
+    check_hisat2_index(hisat2_index)
 
     output_workflow_dir = os.path.join(os.path.dirname(output_dir), "workflow")
-    os.makedirs(output_workflow_dir, exist_ok=True)
 
-    render_app(wdl_dir, output_dir=output_workflow_dir,
-               project_name=project_name, sample=data_dict)
+    cache = ResultCache(cache_dir)
+    for sample in samples:
+        sample["cache_key"] = cache.make_key(sample["read1"], sample["read2"], hisat2_index,
+                                             fastq_screen_conf, gtf, wdl_dir,
+                                             {"pairs": subsample, "seed": seed} if subsample else None)
+        entry = None if no_cache else cache.lookup(sample["cache_key"])
+        if entry:
+            sample["status"] = "Cached"
+            sample["result_dir"] = cache.restore(entry, output_dir)
+            print('Skip %s, the results are linked from %s.' % (sample["sample"], entry["workflow_root"]))
 
-    def call_cromwell(inputs_fpath, workflow_fpath, workflow_root, tasks_path):
-        # cmd = ['cromwell', 'run', workflow_fpath, "-i", inputs_fpath,
-        #        "-p", tasks_path, "--workflow-root", workflow_root]
-        cmd = ['java', '-Dconfig.file=/venv/cromwell-local.conf', '-jar', '/venv/share/cromwell/cromwell.jar', 'run', workflow_fpath, "-i", inputs_fpath, "-p", tasks_path, "--workflow-root", workflow_root]
-        print('Run workflow and output results to %s.' % workflow_root)
-        proc = Popen(cmd, stdin=PIPE)
-        proc.communicate()
+    preflight = dict()
+    if not skip_preflight:
+        errors = []
+        pending = [sample for sample in samples if sample.get("status") != "Cached"]
 
-    inputs_fpath = os.path.join(output_workflow_dir, "inputs")
-    workflow_fpath = os.path.join(output_workflow_dir, "workflow.wdl")
-    tasks_path = os.path.join(output_workflow_dir, "tasks.zip")
-    call_cromwell(inputs_fpath, workflow_fpath, output_dir, tasks_path)
+        def check(sample):
+            try:
+                return sample, preflight_fastq_pair(sample["read1"], sample["read2"], preflight_reads), None
+            except Exception as e:
+                return sample, None, e
+
+        # Every sample is checked by two threads, the samples are checked at the same time.
+        print('Check the fastq files of %s samples.' % len(pending))
+        with ThreadPoolExecutor(max_workers=max(1, min(cores // 2, len(pending)))) as executor:
+            for sample, result, error in executor.map(check, pending):
+                if error is not None:
+                    errors.append("%s: %s" % (sample["sample"], error))
+                    continue
+                preflight[sample["sample"]] = result
+                print('%s: %s read pairs are checked in %.1f seconds%s.' % (
+                    sample["sample"], result["reads"], result["elapsed"],
+                    "" if result["complete"] else " (the first reads of the files)"))
+
+        if len(preflight) > 0:
+            write_json(preflight, os.path.join(output_dir, "preflight.json"))
+        if len(errors) > 0:
+            raise Exception("The fastq files are not valid, no workflow is started.\n%s" % "\n".join(errors))
+
+    for sample in samples:
+        sample["fastq"] = [sample["read1"], sample["read2"]]
+        if not subsample or sample.get("status") == "Cached":
+            continue
+        checked = preflight.get(sample["sample"])
+        if checked and checked["complete"] and checked["reads"] <= subsample:
+            print('%s has %s read pairs only, all of them are used.' % (sample["sample"], checked["reads"]))
+            continue
+
+        print('Draw %s read pairs from %s with the seed %s.' % (subsample, sample["sample"], seed))
+        sample["fastq"], sample["subsample"] = subsample_fastq_pair(
+            sample["read1"], sample["read2"], subsample,
+            os.path.join(os.path.dirname(output_dir), "subsample", sample["sample"]), seed)
+        sample["subsample"]["sample"] = sample["sample"]
+        print('%(pairs)s of %(total_pairs)s read pairs are drawn, the report will be preliminary.' % sample["subsample"])
+
+    if not sample_sheet:
+        if samples[0].get("status") == "Cached":
+            return
+
+        inputs_fpath, workflow_fpath, tasks_path = render_workflow(wdl_dir, output_workflow_dir, "rseqc",
+                                                                   samples[0]["fastq"][0], samples[0]["fastq"][1],
+                                                                   hisat2_index, fastq_screen_conf, gtf)
+        metadata_fpath = os.path.join(output_workflow_dir, "metadata.json")
+        returncode = call_cromwell(inputs_fpath, workflow_fpath, output_dir, tasks_path, metadata_fpath,
+                                   job_limit=cores)
+        if not os.path.exists(metadata_fpath):
+            return
+
+        metadata = read_json(metadata_fpath)
+        profile_fpath = save_pipeline_profile(metadata, samples[0]["sample"])
+        print('The execution profile of the workflow is saved to %s.' % profile_fpath)
+        if samples[0].get("subsample"):
+            write_json(samples[0]["subsample"], os.path.join(metadata["workflowRoot"], SUBSAMPLE_FILE))
+        if returncode == 0:
+            # Only the results of this workflow are cached, not the whole output directory.
+            cache.store(samples[0]["cache_key"], output_dir,
+                        os.path.relpath(metadata["workflowRoot"], output_dir), samples[0]["sample"])
+        return
+
+    for sample in samples:
+        if sample.get("status") == "Cached":
+            continue
+
+        sample["inputs"], sample["workflow"], sample["tasks"] = render_workflow(
+            wdl_dir, os.path.join(output_workflow_dir, sample["sample"]), sample["sample"],
+            sample["fastq"][0], sample["fastq"][1], hisat2_index, fastq_screen_conf, gtf)
+        sample["requirements"] = parse_wdl_requirements(sample["workflow"], sample["tasks"], sample["inputs"])
+        sample["stages"] = parse_wdl_stages(sample["workflow"])
+
+    server = CromwellServer(output_dir, port=port, job_limit=cores)
+    if len([sample for sample in samples if sample.get("status") != "Cached"]) > 0:
+        server.start()
+    try:
+        memory = memory * 1024 ** 3 if memory else (total_memory() or float("inf"))
+        LocalScheduler(server, cores, memory, concurrency).run(samples)
+        for sample in samples:
+            if sample.get("status") not in TERMINAL_STATES:
+                continue
+
+            try:
+                metadata = server.metadata(sample["workflow_id"])
+            except requests.RequestException as e:
+                print('Cannot get the metadata of %s: %s' % (sample["sample"], e))
+                continue
+
+            sample["result_dir"] = metadata["workflowRoot"]
+            sample["profile"] = save_pipeline_profile(metadata, sample["sample"])
+            if sample.get("subsample"):
+                write_json(sample["subsample"], os.path.join(sample["result_dir"], SUBSAMPLE_FILE))
+            if sample["status"] == "Succeeded":
+                cache.store(sample["cache_key"], output_dir,
+                            os.path.relpath(sample["result_dir"], output_dir), sample["sample"])
+    finally:
+        server.stop()
+
+        summary_fpath = os.path.join(output_dir, "workflow_summary.json")
+        write_json([{
+            "sample": sample["sample"],
+            "read1": sample["read1"],
+            "read2": sample["read2"],
+            "workflow_id": sample.get("workflow_id"),
+            "result_dir": sample.get("result_dir"),
+            "profile": sample.get("profile"),
+            "subsample": sample.get("subsample"),
+            "status": sample.get("status", "NotSubmitted"),
+            "error": sample.get("error"),
+            "start": sample.get("start"),
+            "end": sample.get("end")
+        } for sample in samples], summary_fpath)
+        print('The status of all samples is saved to %s.' % summary_fpath)
+
+    failed = [sample["sample"] for sample in samples if sample.get("status") not in ["Succeeded", "Cached"]]
+    if len(failed) > 0:
+        raise Exception("%s of %s samples are not succeeded: %s" % (len(failed), len(samples), ", ".join(failed)))
+
+
+@rseqc.command(help="Compute the FastQC statistics of a pair of fastq files for a quick look before the workflow.")
+@click.option('--r1', required=True, type=click.Path(exists=True, file_okay=True),
+              help="The R1 fastq file.")
+@click.option('--r2', required=True, type=click.Path(exists=True, file_okay=True),
+              help="The R2 fastq file.")
+@click.option('--threads', required=False, default=2, show_default=True, type=click.IntRange(min=1),
+              help="How many threads decompress a bgzip file, gzip files are decompressed by one thread.")
+@click.option('--max-reads', required=False, default=0, show_default=True, type=click.IntRange(min=0),
+              help="Only read the first N reads of every file, 0 means all reads.")
+@click.option('--output-dir', required=True, type=click.Path(exists=True, dir_okay=True, file_okay=False),
+              help="The output directory, fastqc_data.txt files are saved to <output-dir>/<fastq>_fastqc.")
+def quicklook(r1, r2, threads, max_reads, output_dir):
+    check_fastq_pair(r1, r2)
+
+    stop = threading.Event()
+    results, errors = dict(), []
+
+    def scan(fpath):
+        try:
+            results[fpath] = quicklook_fastq(fpath, stop, threads=threads, max_reads=max_reads)
+        except Exception as e:
+            errors.append(str(e))
+            stop.set()
+
+    start = time.time()
+    workers = [threading.Thread(target=scan, args=(fpath,), daemon=True) for fpath in [r1, r2]]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if len(errors) > 0:
+        raise Exception("\n".join(errors))
+
+    summary = dict()
+    for fpath in [r1, r2]:
+        name = re.sub(r'\.(fastq|fq)\.gz$', '', os.path.basename(fpath))
+        report_dir = os.path.join(output_dir, "%s_fastqc" % name)
+        os.makedirs(report_dir, exist_ok=True)
+        summary[name] = results[fpath].write_fastqc_data(os.path.join(report_dir, "fastqc_data.txt"))
+        print('%s reads of %s are checked, the statistics are saved to %s.' % (results[fpath].reads, fpath, report_dir))
+        for section, status in summary[name].items():
+            print('    %-32s %s' % (section, status.upper()))
+
+    write_json(summary, os.path.join(output_dir, "quicklook.json"))
+    print('Finished in %.1f seconds.' % (time.time() - start))
+
+
+@rseqc.command(name="task-wrapper", hidden=True,
+               help="Run the script of a task and record its resource usage, it's used by the cromwell backend.")
+@click.option('--interval', required=False, default=5, show_default=True, type=click.FloatRange(min=0.1),
+              help="How often (seconds) to sample the memory of the task.")
+@click.argument('script', type=click.Path(exists=True, dir_okay=False))
+def task_wrapper(script, interval):
+    # The usage file marks that the script is started, the submit command of the cromwell
+    # backend runs the script with bash itself if the wrapper fails before it.
+    usage_fpath = os.path.join(os.path.dirname(os.path.abspath(script)), TASK_USAGE_FILE)
+    peak_rss = [0]
+    start = time.time()
+    write_json({"start": start}, usage_fpath)
+    proc = Popen(["/usr/bin/env", "bash", script])
+
+    finished = threading.Event()
+
+    def sample_memory():
+        # getrusage only reports the peak of the biggest child, so the memory of
+        # the whole process tree is sampled for the tasks which run pipes.
+        while not finished.wait(interval):
+            try:
+                peak_rss[0] = max(peak_rss[0], process_tree_rss(proc.pid))
+            except Exception:
+                continue
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    returncode = proc.wait()
+    finished.set()
+    sampler.join()
+
+    try:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        write_json({
+            "start": start,
+            "end": time.time(),
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            # ru_maxrss is in kilobytes on linux
+            "max_rss": max(usage.ru_maxrss * 1024, peak_rss[0]),
+            "returncode": returncode
+        }, usage_fpath)
+    except Exception as e:
+        # The profile misses the usage of this task, but the task itself is done.
+        print('Cannot record the resource usage of %s: %s' % (script, e), file=sys.stderr)
+    sys.exit(returncode)
 
 
 @rseqc.command(help="Run the report for RNA-Seq results.")
@@ -102,12 +1669,63 @@ def workflow(r1, r2, hisat2_index, fastq_screen_conf, gtf, output_dir):
 @click.option('--output-dir', '-o', required=True,
               type=click.Path(exists=True, dir_okay=True),
               help="A directory which will store the output report.")
-def report(result_dir, metadata_file, output_dir):
-    cmd = ['quartet-rseqc-report', '-d', result_dir, "-m", metadata_file,
-           "-o", output_dir]
-    print('Run quartet-rseqc-report and output the report to %s.' % output_dir)
-    proc = Popen(cmd, stdin=PIPE)
-    proc.communicate()
+@click.option('--name', '-n', required=False, default="report", show_default=True,
+              help="The name of the report.")
+@click.option('--description', '-D', required=False, default="Quality control report", show_default=True,
+              help="The description of the report.")
+@click.option('--service', required=False, default=DEFAULT_REPORT_SERVICE, show_default=True,
+              envvar="RSEQC_REPORT_SERVICE",
+              help="The address of the report service, the report is rendered by this command if it's not running.")
+def report(result_dir, metadata_file, output_dir, name, description, service):
+    client = ReportServiceClient(service)
+    if client.is_alive():
+        job = client.submit({
+            "result_dir": os.path.abspath(result_dir),
+            "metadata_file": os.path.abspath(metadata_file),
+            "output_dir": os.path.abspath(output_dir),
+            "name": name,
+            "description": description
+        })
+        print('Submit the job %s to the report service %s.' % (job["id"], service))
+        job = client.wait(job["id"])
+        if job["status"] != "Succeeded":
+            raise Exception("The report job %s is %s: %s" % (job["id"], job["status"].lower(), job["error"]))
+        print('The report is saved to %s (%s).' % (job["report"], ", ".join(
+            ["%s: %.1fs" % (key, value) for key, value in sorted(job["timings"].items())])))
+        return
+
+    try:
+        from quartet_rnaseq_report.render import render_report
+    except ImportError:
+        # The report package is not installed with this python, use the jar instead.
+        cmd = ['quartet-rseqc-report', '-d', result_dir, "-m", metadata_file,
+               "-o", output_dir, "-n", name, "-D", description]
+        print('Run quartet-rseqc-report and output the report to %s.' % output_dir)
+        proc = Popen(cmd, stdin=PIPE)
+        proc.communicate()
+        return
+
+    print('Render the report to %s.' % output_dir)
+    report_fpath = render_report(result_dir, metadata_file, output_dir, name=name, description=description)
+    print('The report is saved to %s.' % report_fpath)
+
+
+@rseqc.command(help="Run a report service which keeps the report dependencies loaded between reports.")
+@click.option('--address', '-a', required=False, default=DEFAULT_REPORT_SERVICE, show_default=True,
+              envvar="RSEQC_REPORT_SERVICE",
+              help="A Unix socket (unix:///path/to/socket) or a local port (http://127.0.0.1:8765).")
+@click.option('--workers', '-w', required=False, default=2, show_default=True, type=click.IntRange(min=1),
+              help="How many reports can be rendered at the same time.")
+def serve(address, workers):
+    import logging
+    from quartet_rnaseq_report.service import serve as serve_reports
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    print('Start the report service on %s with %s workers.' % (address, workers))
+    try:
+        serve_reports(address, workers=workers)
+    except KeyboardInterrupt:
+        print('The report service is stopped.')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+""" Benchmark the downsampling of the line graphs on synthetic insert size histograms
+
+Prints the points and the JSON size of the plot data before and after the downsampling,
+the time it takes, and the largest error of the downsampled line (linear interpolation
+between the kept points) relative to the peak of each series.
+
+    python benchmarks/downsample.py --samples 500 --bins 5000 --max-points 500
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import time
+
+import numpy as np
+
+from quartet_rnaseq_report.modules.downsample import downsample_series
+
+
+def make_insert_size_histogram(bins, rng):
+    x = np.arange(1, bins + 1)
+    peak = rng.uniform(200, 400)
+    # The reads of a sample in millions, like the insert size histograms of the module
+    y = rng.poisson(10 ** 6 * np.exp(-((x - peak) / rng.uniform(50, 120)) ** 2)) / 1000000.0
+    return dict(zip(x.tolist(), y.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the downsampling of the line graphs.')
+    parser.add_argument('--samples', type=int, default=500, help='How many series.')
+    parser.add_argument('--bins', type=int, default=5000, help='The points of a series.')
+    parser.add_argument('--max-points', type=int, default=500, help='The points budget of a series.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic series.')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    data = dict(('S%d' % i, make_insert_size_histogram(args.bins, rng)) for i in range(args.samples))
+
+    started = time.perf_counter()
+    downsampled = dict((s_name, downsample_series(series, args.max_points)) for s_name, series in data.items())
+    seconds = time.perf_counter() - started
+
+    errors = list()
+    for s_name, series in data.items():
+        x, y = np.array(list(series.keys()), dtype=float), np.array(list(series.values()))
+        kept = downsampled[s_name]
+        line = np.interp(x, np.array(list(kept.keys()), dtype=float), np.array(list(kept.values())))
+        errors.append(np.abs(line - y).max() / y.max())
+
+    for name, plot_data in [('full resolution', data), ('downsampled', downsampled)]:
+        points = sum(len(series) for series in plot_data.values())
+        size = len(json.dumps(dict((s, list(series.items())) for s, series in plot_data.items())))
+        print('{:<16} {:>10} points {:>8.1f} MB'.format(name, points, size / 1024 ** 2))
+    print('{:.2f} s to downsample, the largest error is {:.1%} of the peak'.format(seconds, max(errors)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+""" Benchmark the FastQC parser of rnaseq_raw_qc on synthetic fastqc_data.txt files
+
+The synthetic reports have all sections of FastQC 0.11.9 for 2x150bp reads, including the
+per tile quality. The parser of the module is compared with the former parser, which keeps
+every section as a list of dicts.
+
+    python benchmarks/fastqc_parser.py --samples 1000
+
+The former parser keeps about 600 KB per report, 5000 reports need more than 3 GB of memory.
+"""
+
+from __future__ import print_function
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from quartet_rnaseq_report.modules.rnaseq_raw_qc.pre_alignment_qc import avg_bp_from_range, parse_fastqc_data
+
+READ_LENGTH = 150
+TILES = [1101 + i for i in range(24)] + [2101 + i for i in range(24)]
+
+
+def base_groups(length):
+    """The positions reported by FastQC: single bases first, then ranges."""
+    groups = [str(i) for i in range(1, 10)]
+    start = 10
+    while start <= length:
+        end = min(start + 4, length)
+        groups.append('{}-{}'.format(start, end) if end > start else str(start))
+        start = end + 1
+    return groups
+
+
+def make_fastqc_data(name, rng):
+    bases = base_groups(READ_LENGTH)
+    lines = ['##FastQC\t0.11.9',
+             '>>Basic Statistics\tpass',
+             '#Measure\tValue',
+             'Filename\t{}.fq.gz'.format(name),
+             'File type\tConventional base calls',
+             'Encoding\tSanger / Illumina 1.9',
+             'Total Sequences\t{}'.format(rng.randint(10 ** 7, 5 * 10 ** 7)),
+             'Sequences flagged as poor quality\t0',
+             'Sequence length\t{}'.format(READ_LENGTH),
+             '%GC\t{}'.format(rng.randint(40, 55)),
+             '>>END_MODULE',
+             '>>Per base sequence quality\tpass',
+             '#Base\tMean\tMedian\tLower Quartile\tUpper Quartile\t10th Percentile\t90th Percentile']
+    for base in bases:
+        mean = 36 - avg_bp_from_range(base) / 50.0 + rng.random()
+        lines.append('\t'.join([base, '%.15f' % mean, '37.0', '35.0', '37.0', '33.0', '37.0']))
+    lines += ['>>END_MODULE', '>>Per tile sequence quality\tpass', '#Tile\tBase\tMean']
+    for tile in TILES:
+        for base in bases:
+            lines.append('{}\t{}\t{:.15f}'.format(tile, base, rng.random() - 0.5))
+    lines += ['>>END_MODULE', '>>Per sequence quality scores\tpass', '#Quality\tCount']
+    lines += ['{}\t{}.0'.format(q, rng.randint(0, 10 ** 6)) for q in range(2, 38)]
+    lines += ['>>END_MODULE', '>>Per base sequence content\tpass', '#Base\tG\tA\tT\tC']
+    lines += ['{}\t25.0\t25.0\t25.0\t25.0'.format(base) for base in bases]
+    lines += ['>>END_MODULE', '>>Per sequence GC content\tpass', '#GC Content\tCount']
+    lines += ['{}\t{}.0'.format(gc_content, rng.randint(0, 10 ** 6)) for gc_content in range(101)]
+    lines += ['>>END_MODULE', '>>Per base N content\tpass', '#Base\tN-Count']
+    lines += ['{}\t0.0'.format(base) for base in bases]
+    lines += ['>>END_MODULE', '>>Sequence Length Distribution\tpass', '#Length\tCount',
+              '{}\t{}.0'.format(READ_LENGTH, rng.randint(10 ** 7, 5 * 10 ** 7)),
+              '>>END_MODULE', '>>Sequence Duplication Levels\twarn',
+              '#Total Deduplicated Percentage\t{:.12f}'.format(rng.uniform(30, 80)),
+              '#Duplication Level\tPercentage of deduplicated\tPercentage of total']
+    lines += ['{}\t{:.12f}\t{:.12f}'.format(level, rng.random(), rng.random()) for level in
+              ['1', '2', '3', '4', '5', '6', '7', '8', '9', '>10', '>50', '>100', '>500', '>1k', '>5k', '>10k+']]
+    lines += ['>>END_MODULE', '>>Overrepresented sequences\twarn',
+              '#Sequence\tCount\tPercentage\tPossible Source']
+    lines += ['{}\t{}\t{:.12f}\tNo Hit'.format(''.join(rng.choice('ACGT') for _ in range(50)),
+                                              rng.randint(10 ** 4, 10 ** 5), rng.random()) for _ in range(20)]
+    lines += ['>>END_MODULE', '>>Adapter Content\tpass',
+              '#Position\tIllumina Universal Adapter\tIllumina Small RNA 3\' Adapter\t'
+              'Nextera Transposase Sequence\tSOLID Small RNA Adapter']
+    lines += ['{}\t0.0\t0.0\t0.0\t0.0'.format(base) for base in bases]
+    lines += ['>>END_MODULE', '']
+    return '\n'.join(lines)
+
+
+def legacy_parse(file_contents):
+    """The former parser: every section of the report as a list of dicts."""
+    fastqc_data = {'statuses': dict()}
+    section = None
+    s_headers = None
+    for l in file_contents.splitlines():
+        if l == '>>END_MODULE':
+            section = None
+            s_headers = None
+        elif l.startswith('>>'):
+            (section, status) = l[2:].split("\t", 1)
+            section = section.lower().replace(' ', '_')
+            fastqc_data['statuses'][section] = status
+        elif section is not None:
+            if l.startswith('#'):
+                s_headers = l[1:].split("\t")
+                if s_headers[0] == 'Total Deduplicated Percentage':
+                    fastqc_data['basic_statistics'].append({
+                        'measure': 'total_deduplicated_percentage', 'value': float(s_headers[1])})
+                else:
+                    s_headers = [s.lower().replace(' ', '_') for s in s_headers]
+                    fastqc_data[section] = list()
+            elif s_headers is not None:
+                row = dict()
+                for (i, v) in enumerate(l.split("\t")):
+                    try:
+                        v = float(v)
+                    except ValueError:
+                        pass
+                    row[s_headers[i]] = v
+                fastqc_data[section].append(row)
+    fastqc_data['basic_statistics'] = {d['measure']: d['value'] for d in fastqc_data['basic_statistics']}
+    return fastqc_data
+
+
+def measure(parser, reports):
+    """Returns the seconds to parse the reports and the megabytes kept by the parsed reports."""
+    gc.collect()
+    started = time.perf_counter()
+    parsed = [parser(report) for report in reports]
+    seconds = time.perf_counter() - started
+    del parsed
+
+    gc.collect()
+    tracemalloc.start()
+    parsed = [parser(report) for report in reports]
+    kept = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del parsed
+    return seconds, kept / 1024 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FastQC parser on synthetic reports.')
+    parser.add_argument('--samples', type=int, default=1000, help='How many reports to parse.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic reports.')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Reports are reused after 100, which keeps the benchmark itself small
+    templates = [make_fastqc_data('S%d' % i, rng) for i in range(min(args.samples, 100))]
+    reports = [templates[i % len(templates)] for i in range(args.samples)]
+    print('{} reports, {:.1f} KB per report'.format(args.samples, len(templates[0]) / 1024))
+
+    for name, fn in [('list of dicts (former)', legacy_parse), ('numpy columns', parse_fastqc_data)]:
+        seconds, megabytes = measure(fn, reports)
+        print('{:<24} {:>8.2f} s {:>10.1f} MB'.format(name, seconds, megabytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+#!/usr/bin/env bash
+# Write the golden outputs of exp2qcdt for examples/exp2qcdt into this directory, it needs
+# exp2qcdt.sh (R and the exp2qcdt package) and the report package, e.g. in the docker image.
+#
+#   bash benchmarks/golden/make_golden.sh
+#
+# PYTHON is the python of the report package (python by default).
+
+set -o errexit
+set -o nounset
+set -o pipefail
+
+GOLDEN_DIR=$(cd "$(dirname "$0")" && pwd)
+EXAMPLE_DIR="${GOLDEN_DIR}/../../../examples/exp2qcdt"
+WORK_DIR=$(mktemp -d)
+trap 'rm -rf "${WORK_DIR}"' EXIT
+
+"${PYTHON:-python}" "${GOLDEN_DIR}/../golden_check.py" --write-fpkm "${WORK_DIR}"
+mkdir -p "${WORK_DIR}/results"
+exp2qcdt.sh -e "${WORK_DIR}/fpkm.csv" -c "${EXAMPLE_DIR}/count.csv" -m "${EXAMPLE_DIR}/metadata.csv" -o "${WORK_DIR}/results"
+for name in logfc_cor_ref_test.txt pca_with_snr.txt; do
+	cp "${WORK_DIR}/results/performance_assessment/${name}" "${GOLDEN_DIR}/${name}"
+done
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+""" Check the assessment engines against the outputs of exp2qcdt on the example batch
+
+The golden files in benchmarks/golden are written by exp2qcdt (R) for the 12 libraries of
+examples/exp2qcdt, see golden/make_golden.sh. The example has no FPKM table, so both
+exp2qcdt and the engines take the CPM of the counts (--write-fpkm) as the FPKM.
+
+    python benchmarks/golden_check.py
+    python benchmarks/golden_check.py --check rc
+    python benchmarks/golden_check.py --write-fpkm /tmp/example
+
+The docker image runs the checks when it's built (see the Dockerfile), the build fails
+if the engines disagree with exp2qcdt.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from quartet_rnaseq_report.assessment.rc import compute_rc
+from quartet_rnaseq_report.assessment.snr import compute_snr
+from quartet_rnaseq_report.reference import DEFAULT_STORE, ReferenceStore
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'examples', 'exp2qcdt')
+# logfc_cor_ref_test.txt has 3 digits
+RC_TOLERANCE = 0.001
+LOGFC_TOLERANCE = 0.002
+# pca_with_snr.txt has 3 digits of the SNR and of PC1/PC2, 2 digits of the ratios
+SNR_TOLERANCE = 0.0015
+PC_TOLERANCE = 0.0015
+RATIO_TOLERANCE = 0.011
+
+
+def write_fpkm(count_fpath, fpath):
+    """ The CPM of the counts as the FPKM table of the example. """
+    counts = pd.read_csv(count_fpath)
+    values = counts.iloc[:, 1:]
+    cpm = (values / values.sum(axis=0) * 1e6).round(6)
+    cpm.insert(0, counts.columns[0], counts.iloc[:, 0])
+    cpm.to_csv(fpath, index=False)
+    return fpath
+
+
+def check_rc(count_fpath, meta_fpath, store, golden_fpath):
+    golden = pd.read_csv(golden_fpath, sep='\t')
+    engine = compute_rc(count_fpath, meta_fpath, store)
+    print('RC {} / {} (exp2qcdt), genes {} / {}'.format(engine['cor'].iloc[0], golden['cor'].iloc[0],
+                                                      engine['gene_num'].iloc[0], golden['gene_num'].iloc[0]))
+    joined = engine.merge(golden, on=['gene', 'compare'], suffixes=('', '_golden'))
+    diff = np.abs(joined['meanlogFC_test'] - joined['meanlogFC_test_golden'])
+    print('  max |logFC difference| {:.3g} on {} genes'.format(diff.max(), len(joined)))
+    errors = list()
+    if abs(float(engine['cor'].iloc[0]) - float(golden['cor'].iloc[0])) > RC_TOLERANCE:
+        errors.append('the RC differs from exp2qcdt')
+    if engine['gene_num'].iloc[0] != golden['gene_num'].iloc[0] or len(joined) != len(golden):
+        errors.append('the genes differ from exp2qcdt')
+    if diff.max() > LOGFC_TOLERANCE:
+        errors.append('the fold-changes differ from exp2qcdt')
+    return errors
+
+
+def check_snr(fpkm_fpath, count_fpath, meta_fpath, golden_fpath):
+    golden = pd.read_csv(golden_fpath, sep='\t')
+    engine = compute_snr(fpkm_fpath, count_fpath, meta_fpath)
+    ratios = ['PC1_ratio', 'PC2_ratio', 'PC3_ratio']
+    print('SNR {} / {} (exp2qcdt), PC ratios {} / {}, genes {} / {}'.format(
+        engine['SNR'].iloc[0], golden['SNR'].iloc[0], engine[ratios].iloc[0].tolist(),
+        golden[ratios].iloc[0].tolist(), engine['gene_num'].iloc[0], golden['gene_num'].iloc[0]))
+    errors = list()
+    if abs(float(engine['SNR'].iloc[0]) - float(golden['SNR'].iloc[0])) > SNR_TOLERANCE:
+        errors.append('the SNR differs from exp2qcdt')
+    if not np.allclose(engine[ratios].iloc[0].values.astype(float), golden[ratios].iloc[0].values.astype(float),
+                       atol=RATIO_TOLERANCE):
+        errors.append('the PC ratios differ from exp2qcdt')
+    if engine['gene_num'].iloc[0] != golden['gene_num'].iloc[0]:
+        errors.append('the genes differ from exp2qcdt')
+    for pc in ['PC1', 'PC2']:
+        values = engine.set_index('library')[pc].sort_index()
+        other = golden.set_index('library')[pc].sort_index()
+        if list(values.index) != list(other.index):
+            errors.append('the libraries differ from exp2qcdt')
+            break
+        # The signs of the components of prcomp are arbitrary, see snr.py
+        diff = min(np.abs(values.values - other.values).max(), np.abs(values.values + other.values).max())
+        print('  max |{} difference| (up to a sign) {:.3g}'.format(pc, diff))
+        if diff > PC_TOLERANCE:
+            errors.append('{} differs from exp2qcdt'.format(pc))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the assessment engines against exp2qcdt.')
+    parser.add_argument('--example-dir', default=EXAMPLE_DIR, help='The count.csv and metadata.csv of the example.')
+    parser.add_argument('--golden-dir', default=GOLDEN_DIR, help='The outputs of exp2qcdt for the example.')
+    parser.add_argument('--store', default=DEFAULT_STORE, help='The reference store.')
+    parser.add_argument('--check', action='append', choices=['rc', 'snr'],
+                        help='Only run this check (rc: logfc_cor_ref_test.txt, snr: pca_with_snr.txt).')
+    parser.add_argument('--write-fpkm', metavar='DIR', help='Only write the fpkm.csv of the example to DIR.')
+    args = parser.parse_args()
+
+    count_fpath = os.path.join(args.example_dir, 'count.csv')
+    meta_fpath = os.path.join(args.example_dir, 'metadata.csv')
+    if args.write_fpkm:
+        print(write_fpkm(count_fpath, os.path.join(args.write_fpkm, 'fpkm.csv')))
+        return
+
+    directory = tempfile.mkdtemp()
+    fpkm_fpath = os.path.join(directory, 'fpkm.csv')
+    checks = [('rc', 'logfc_cor_ref_test.txt', lambda fpath: check_rc(count_fpath, meta_fpath,
+                                                                     ReferenceStore(args.store), fpath)),
+              ('snr', 'pca_with_snr.txt', lambda fpath: check_snr(fpkm_fpath, count_fpath, meta_fpath, fpath))]
+    checks = [(name, check) for key, name, check in checks if not args.check or key in args.check]
+    missing = [name for name, _ in checks if not os.path.exists(os.path.join(args.golden_dir, name))]
+    if missing:
+        sys.exit('{} is not in {}, run golden/make_golden.sh where exp2qcdt is installed.'.format(
+            ', '.join(missing), args.golden_dir))
+
+    try:
+        write_fpkm(count_fpath, fpkm_fpath)
+        errors = sum([check(os.path.join(args.golden_dir, name)) for name, check in checks], [])
+    finally:
+        shutil.rmtree(directory)
+    if errors:
+        raise Exception('The engines disagree with exp2qcdt: {}.'.format(', '.join(errors)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+""" Track the import time of the entry points of the plugin
+
+MultiQC imports every plugin module on start-up, so the modules must stay cheap to import.
+Every entry point is imported by `python -X importtime` after the parts of MultiQC which are
+loaded anyway, and only the imports after them are counted. It fails when the median of
+the runs is slower than the baseline, or when a heavy library is imported at module level.
+
+    python benchmarks/importtime.py             # compare with importtime_baseline.json
+    python benchmarks/importtime.py --update    # save the current timings as the baseline
+"""
+
+from __future__ import print_function
+from importlib.metadata import entry_points
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'importtime_baseline.json')
+ENTRY_POINT_GROUPS = ['multiqc.modules.v1', 'multiqc.hooks.v1', 'multiqc.templates.v1', 'multiqc.cli_options.v1']
+# MultiQC has loaded these modules before it loads the plugin
+HOST_IMPORTS = ['multiqc', 'multiqc.modules.base_module', 'multiqc.plots.table', 'multiqc.plots.linegraph',
+                'multiqc.plots.bargraph', 'multiqc.plots.scatter', 'multiqc.plots.heatmap', 'multiqc.utils.report']
+# They should be imported when a figure is made, not when a module is imported
+HEAVY_MODULES = ['pandas', 'plotly', 'plotly.express', 'plotly.figure_factory', 'plotly.io']
+MARKER = 'quartet-rnaseq-report-importtime'
+
+
+def plugin_entry_points():
+    eps = entry_points()
+    found = dict()
+    for group in ENTRY_POINT_GROUPS:
+        selected = eps.select(group=group) if hasattr(eps, 'select') else eps.get(group, [])
+        for ep in selected:
+            if ep.value.startswith('quartet_rnaseq_report'):
+                found['{}:{}'.format(group, ep.name)] = ep.value.split(':')[0]
+    return found
+
+
+def measure(module):
+    """Returns the import time (microseconds) and the modules imported by the module."""
+    code = 'import sys\n{}\nsys.stderr.write("{}\\n")\nimport {}'.format(
+        '\n'.join(['import ' + m for m in HOST_IMPORTS]), MARKER, module)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise Exception('Cannot import {}:\n{}'.format(module, proc.stderr))
+
+    lines = proc.stderr.split(MARKER + '\n', 1)[1].splitlines()
+    total, imported = 0, []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        imported.append(name.strip())
+    return total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Track the import time of the plugin.')
+    parser.add_argument('--runs', type=int, default=5, help='How many times to import every entry point.')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Fail when the import time is more than tolerance * baseline.')
+    parser.add_argument('--slack', type=int, default=20000,
+                        help='The microseconds allowed on top of the tolerance, it absorbs the noise.')
+    parser.add_argument('--update', action='store_true', help='Save the timings as the baseline.')
+    args = parser.parse_args()
+
+    baseline = dict()
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    timings, failures = dict(), []
+    for name, module in sorted(plugin_entry_points().items()):
+        runs = [measure(module) for _ in range(args.runs)]
+        timings[name] = int(statistics.median([total for total, _ in runs]))
+        heavy = sorted(set(HEAVY_MODULES) & set(runs[0][1]))
+        limit = baseline[name] * args.tolerance + args.slack if name in baseline else None
+
+        status = 'ok'
+        if heavy:
+            status = 'imports ' + ', '.join(heavy)
+        elif limit is not None and timings[name] > limit:
+            status = 'slower than {:.1f} ms'.format(limit / 1000)
+        if status != 'ok':
+            failures.append(name)
+        print('{:<70} {:>8.1f} ms  {}'.format(name, timings[name] / 1000, status))
+
+    if args.update:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(timings, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Save the baseline to {}.'.format(BASELINE_FILE))
+    elif failures:
+        print('The import time regresses: {}'.format(', '.join(failures)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
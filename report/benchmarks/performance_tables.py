@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+""" Benchmark the tables of rnaseq_performance_assessment on synthetic files
+
+The former module split the lines of a table by hand into an array of strings, and the
+numbers were converted when they were used. The module now reads a table with its schema
+(see tables.py), the second read of a file is a lookup.
+
+    python benchmarks/performance_tables.py --batches 5000 --genes 30000
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from quartet_rnaseq_report.modules.rnaseq_performance_assessment.tables import read_table
+
+
+def legacy_read(fpath, numeric):
+    """The former list2df, and the numbers as the plots use them."""
+    with open(fpath) as fh:
+        data = fh.read().splitlines()
+    cols = data[0].split('\t')
+    array = []
+    for line in data[1:]:
+        array.append(line.split('\t'))
+    df = pd.DataFrame(np.array(array), columns=cols)
+    for column in numeric:
+        df[column] = df[column].astype(float)
+    return df
+
+
+def write_tables(directory, batches, genes, rng):
+    quality_score = pd.DataFrame({
+        'batch': ['B%d' % i for i in range(batches)],
+        'SNR': np.round(rng.normal(20, 6, batches), 1),
+        'RC': np.round(rng.uniform(0.85, 0.97, batches), 3),
+    })
+    quality_score['total_score'] = np.round(np.sqrt(quality_score.SNR.abs() * quality_score.RC), 3)
+    quality_score['group'] = 'Reference'
+    quality_score['rank'] = np.arange(1, batches + 1)
+    quality_score['performance'] = 'Good'
+    quality_score['scaled_score'] = np.round(rng.uniform(1, 10, batches), 3)
+
+    compares = ['D5/D6', 'F7/D6', 'M8/D6']
+    logfc = pd.DataFrame({
+        'gene': ['ENSG%011d' % i for i in range(genes)] * 3,
+        'compare': np.repeat(compares, genes),
+        'meanlogFC_test': np.round(rng.normal(0, 1, 3 * genes), 3),
+        'meanlogFC_ref': np.round(rng.normal(0, 1, 3 * genes), 3),
+    })
+    logfc['cor'] = '0.950'
+    logfc['gene_num'] = 3 * genes
+
+    paths = dict()
+    for name, df in [('quality_score', quality_score), ('logfc_cor_ref_test', logfc)]:
+        paths[name] = os.path.join(directory, name + '.txt')
+        df.to_csv(paths[name], sep='\t', index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the tables of the performance assessment.')
+    parser.add_argument('--batches', type=int, default=5000, help='The batches in quality_score.txt.')
+    parser.add_argument('--genes', type=int, default=30000, help='The genes of a comparison in logfc_cor_ref_test.txt.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic tables.')
+    args = parser.parse_args()
+
+    numeric = {
+        'quality_score': ['SNR', 'RC', 'total_score', 'rank', 'scaled_score'],
+        'logfc_cor_ref_test': ['meanlogFC_test', 'meanlogFC_ref', 'cor', 'gene_num'],
+    }
+    directory = tempfile.mkdtemp()
+    paths = write_tables(directory, args.batches, args.genes, np.random.RandomState(args.seed))
+
+    for name, fpath in paths.items():
+        print('{}: {:.1f} MB'.format(name, os.path.getsize(fpath) / 1024.0 ** 2))
+        timings = list()
+        for label, fn in [('strings (former)', lambda: legacy_read(fpath, numeric[name])),
+                          ('schema', lambda: read_table(fpath, name)),
+                          ('schema, again', lambda: read_table(fpath, name))]:
+            started = time.perf_counter()
+            df = fn()
+            timings.append((label, time.perf_counter() - started, df))
+        for column in numeric[name]:
+            if not np.allclose(timings[0][2][column].values, timings[1][2][column].values):
+                raise Exception('The former and the schema tables disagree on {}.'.format(column))
+        for label, seconds, _ in timings:
+            print('  {:<18} {:>8.1f} ms'.format(label, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
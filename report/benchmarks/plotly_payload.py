@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+""" Benchmark the payloads of the plotly figures on a synthetic SNR and RC scatter plot
+
+The scatter plot of rnaseq_performance_assessment shows the query batch with all the
+historical reference batches. Prints the size of the payload of the figure in the report
+and the time to encode it for every encoding of modules/plotly.py. The former payload is
+the JSON of plotly < 6, which writes every number with its full repr.
+
+    python benchmarks/plotly_payload.py --reference 20000 --digits 6
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from quartet_rnaseq_report.modules.plotly import PAYLOAD_ENCODINGS, encode_figure, from_typed_array
+
+
+def make_quality_score(reference, rng):
+    """The SNR and RC of the reference batches and of a query batch."""
+    return pd.DataFrame({
+        'SNR': np.append(rng.normal(25, 6, reference), 31.7),
+        'RC': np.append(rng.beta(40, 2, reference), 0.962),
+        'group': ['Reference'] * reference + ['Query'],
+    })
+
+
+def make_figure(quality_score):
+    """The figure of plot_snr_rc_point."""
+    fig = px.scatter(quality_score, x="SNR", y="RC",
+                     symbol='group',
+                     symbol_map={"Reference": 0, "Query": 18},
+                     color="group",
+                     color_discrete_map={"Query": "#bb1616", "Reference": "#2f5c85"},
+                     marginal_x="box",
+                     marginal_y="box",
+                     template="simple_white")
+    fig.update_traces(marker=dict(size=14))
+    return fig
+
+
+def as_lists(obj):
+    """The figure dict with the typed arrays of plotly >= 6 as lists."""
+    if isinstance(obj, dict):
+        if 'bdata' in obj and 'dtype' in obj:
+            return from_typed_array(obj).tolist()
+        return dict((key, as_lists(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return [as_lists(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return obj
+
+
+def former_payload(fig, digits):
+    return json.dumps(as_lists(fig.to_plotly_json()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the payloads of the plotly figures.')
+    parser.add_argument('--reference', type=int, default=20000, help='How many reference batches.')
+    parser.add_argument('--digits', type=int, default=6, help='The significant digits of the numbers.')
+    parser.add_argument('--repeats', type=int, default=3, help='The best time of the repeats is printed.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic scores.')
+    args = parser.parse_args()
+
+    fig = make_figure(make_quality_score(args.reference, np.random.RandomState(args.seed)))
+
+    print('{} reference batches, {} significant digits'.format(args.reference, args.digits))
+    former_size = None
+    for name, fn in [('former', former_payload)] + \
+            [(encoding, lambda fig, digits, encoding=encoding: encode_figure(fig, encoding, digits)[0])
+             for encoding in PAYLOAD_ENCODINGS]:
+        seconds = list()
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            payload = fn(fig, args.digits)
+            seconds.append(time.perf_counter() - started)
+        former_size = former_size or len(payload)
+        print('{:<8} {:>10.1f} KB {:>8.1f}x smaller {:>8.3f} s'.format(
+            name, len(payload) / 1024.0, former_size / float(len(payload)), min(seconds)))
+
+
+if __name__ == '__main__':
+    main()
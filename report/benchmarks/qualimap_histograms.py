@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+""" Benchmark the Qualimap coverage histograms of rnaseq_post_alignment_qc
+
+Deep samples have coverage histograms with hundreds of thousands of depths. The former
+parser built a dict one line at a time, and the median was a loop over the dict. The
+module now reads a histogram into NumPy arrays (see QM_Histogram.py).
+
+The breadth of coverage at the depths of the report was a loop over the depths of every
+sample, it's now one lookup in the histograms of all samples (HistogramStack).
+
+    python benchmarks/qualimap_histograms.py --samples 20 --bins 300000 --stack-samples 2000
+"""
+
+from __future__ import print_function
+import argparse
+import io
+import time
+
+import numpy as np
+
+from quartet_rnaseq_report.modules.rnaseq_post_alignment_qc.QM_Histogram import Histogram, HistogramStack
+
+
+def make_coverage_histogram(bins, rng):
+    """A long tailed coverage histogram, one line per depth."""
+    depths = np.arange(bins)
+    counts = np.floor(1e9 * np.exp(-depths / (bins / 20.0)) * rng.uniform(0.5, 1.5, bins)) + 1
+    lines = ['#Coverage\tNumber of genomic locations'] + \
+        ['{:.1f}\t{:.1f}'.format(d, c) for d, c in zip(depths.tolist(), counts.tolist())]
+    return '\n'.join(lines) + '\n'
+
+
+def legacy_parse(fh):
+    """The former parser of coverage_histogram.txt and its median and mean."""
+    d = dict()
+    for l in fh:
+        if l.startswith('#'):
+            continue
+        coverage, count = l.split(None, 1)
+        coverage = int(round(float(coverage)))
+        count = float(count)
+        d[coverage] = count
+
+    num_counts = sum(d.values())
+    cum_counts = 0
+    median_coverage = None
+    for thiscov, thiscount in d.items():
+        cum_counts += thiscount
+        if cum_counts >= num_counts / 2:
+            median_coverage = thiscov
+            break
+    return d, median_coverage
+
+
+def legacy_thresholds(bases_by_depth, total_size, depth_thresholds):
+    """The former _calculate_bases_within_thresholds of QM_BamQC."""
+    bases_within_threshs = dict((depth, 0) for depth in depth_thresholds)
+    rates_within_threshs = dict((depth, None) for depth in depth_thresholds)
+
+    dt = sorted(depth_thresholds, reverse=True)
+    c = 0
+    for depth in sorted(bases_by_depth.keys(), reverse=True):
+        while depth < dt[c]:
+            c += 1
+            bases_within_threshs[dt[c]] = bases_within_threshs[dt[c - 1]]
+        if depth >= dt[c]:
+            bases_within_threshs[dt[c]] += bases_by_depth[depth]
+    while c + 1 < len(dt):
+        c += 1
+        bases_within_threshs[dt[c]] = total_size
+    for t in dt:
+        if total_size > 0:
+            rates_within_threshs[t] = 100.0 * bases_within_threshs[t] / total_size
+    return rates_within_threshs
+
+
+def legacy_breadth(dicts, depths):
+    """The former max_x and the thresholds, a loop for every sample."""
+    max_x = 0
+    for d in dicts:
+        total = sum(d.values())
+        cumulative = 0
+        for count in sorted(d.keys(), reverse=True):
+            cumulative += d[count]
+            if cumulative / total > 0.01:
+                max_x = max(max_x, count)
+                break
+    return max_x, [legacy_thresholds(d, sum(d.values()), depths) for d in dicts]
+
+
+def stack_breadth(hists, depths):
+    stack = HistogramStack(hists)
+    return int(stack.max_values(0.01).max()), stack.breadth(depths)
+
+
+def histogram_parse(fh):
+    hist = Histogram.from_file(fh)
+    return hist, hist.median()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Qualimap histograms on synthetic files.')
+    parser.add_argument('--samples', type=int, default=20, help='How many histograms to parse.')
+    parser.add_argument('--bins', type=int, default=300000, help='The depths in a histogram.')
+    parser.add_argument('--stack-samples', type=int, default=2000, help='How many samples for the breadth.')
+    parser.add_argument('--stack-bins', type=int, default=5000, help='The depths of a sample for the breadth.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic histograms.')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    files = [make_coverage_histogram(args.bins, rng) for _ in range(args.samples)]
+
+    for text in files[:3]:
+        d, median = legacy_parse(io.StringIO(text))
+        hist, hist_median = histogram_parse(io.StringIO(text))
+        if median != hist_median or d != hist.to_dict():
+            raise Exception('The histogram and the former parser disagree.')
+
+    print('{} histograms, {} depths, {:.1f} MB per histogram'.format(
+        args.samples, args.bins, len(files[0]) / 1024 ** 2))
+    for name, fn in [('dict per line (former)', legacy_parse), ('numpy histogram', histogram_parse)]:
+        started = time.perf_counter()
+        for text in files:
+            fn(io.StringIO(text))
+        seconds = time.perf_counter() - started
+        print('{:<24} {:>8.2f} s {:>8.1f} ms per histogram'.format(name, seconds, seconds / args.samples * 1000))
+
+    # The breadth of coverage is computed from the parsed histograms
+    hists = [Histogram(np.arange(args.stack_bins), rng.poisson(1e6 * np.exp(-np.arange(args.stack_bins) / 250.0)))
+             for _ in range(args.stack_samples)]
+    dicts = [hist.to_dict() for hist in hists]
+    depths = sorted(set(range(0, 1000, 3)) | set([1, 5, 10, 30, 50]))
+    print('{} samples, {} depths, {} thresholds'.format(args.stack_samples, args.stack_bins, len(depths)))
+    for name, fn, data in [('loop per sample (former)', legacy_breadth, dicts),
+                           ('histogram stack', stack_breadth, hists)]:
+        started = time.perf_counter()
+        fn(data, depths)
+        seconds = time.perf_counter() - started
+        print('{:<24} {:>8.2f} s {:>8.1f} ms per sample'.format(name, seconds,
+                                                               seconds / args.stack_samples * 1000))
+
+
+if __name__ == '__main__':
+    main()
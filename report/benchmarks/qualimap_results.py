@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+""" Benchmark the parsing of the Qualimap results files of rnaseq_post_alignment_qc
+
+The synthetic files are the genome_results.txt of BamQC and the rnaseq_qc_results.txt of
+RNASeq (Qualimap 2.2.1). The former parser searched the whole file with a regex for every
+value, and the rnaseq_qc_results.txt was parsed twice (for the general stats and for the
+sections). The module now tokenizes a file once and both parts read the same record.
+
+    python benchmarks/qualimap_results.py --samples 2000
+"""
+
+from __future__ import print_function
+import argparse
+import io
+import os
+import random
+import re
+import tempfile
+import time
+import types
+
+from quartet_rnaseq_report.modules.rnaseq_post_alignment_qc import QM_Results
+
+GENOME_REGEXES = {
+    'total_reads': r"number of reads = ([\d,]+)",
+    'mapped_reads': r"number of mapped reads = ([\d,]+)",
+    'mapped_bases': r"number of mapped bases = ([\d,]+)",
+    'sequenced_bases': r"number of sequenced bases = ([\d,]+)",
+    'mean_insert_size': r"mean insert size = ([\d,\.]+)",
+    'median_insert_size': r"median insert size = ([\d,\.]+)",
+    'mean_mapping_quality': r"mean mapping quality = ([\d,\.]+)",
+    'general_error_rate': r"general error rate = ([\d,\.]+)",
+}
+RNASEQ_REGEXES = {
+    'reads_aligned': r"read(?:s| pairs) aligned\s*=\s*([\d,]+)",
+    'total_alignments': r"total alignments\s*=\s*([\d,]+)",
+    'non_unique_alignments': r"non-unique alignments\s*=\s*([\d,]+)",
+    'reads_aligned_genes': r"aligned to genes\s*=\s*([\d,]+)",
+    'ambiguous_alignments': r"ambiguous alignments\s*=\s*([\d,]+)",
+    'not_aligned': r"not aligned\s*=\s*([\d,]+)",
+    '5_3_bias': r"5'-3' bias\s*=\s*([\d,\.]+)$",
+    'reads_aligned_exonic': r"exonic\s*=\s*([\d,]+)",
+    'reads_aligned_intronic': r"intronic\s*=\s*([\d,]+)",
+    'reads_aligned_intergenic': r"intergenic\s*=\s*([\d,]+)",
+    'reads_aligned_overlapping_exon': r"overlapping exon\s*=\s*([\d,]+)",
+}
+
+
+def number(value, european=False):
+    if european:
+        return '{:,}'.format(value).replace(',', '.')
+    return '{:,}'.format(value)
+
+
+def make_genome_results(name, rng):
+    reads = rng.randint(10 ** 7, 5 * 10 ** 7)
+    mapped = int(reads * rng.uniform(0.8, 0.99))
+    lines = ['BamQC report', '-----------------------------------', '',
+             '>>>>>>> Input', '',
+             '     bam file = /data/{}/{}.bam'.format(name, name),
+             '     outfile = /data/{}/genome_results.txt'.format(name), '', '',
+             '>>>>>>> Reference', '',
+             '     number of bases = 3,099,734,149 bp',
+             '     number of contigs = 195', '', '',
+             '>>>>>>> Globals', '',
+             '     number of windows = 400', '',
+             '     number of reads = {}'.format(number(reads)),
+             '     number of mapped reads = {} ({:.2f}%)'.format(number(mapped), 100.0 * mapped / reads),
+             '     number of secondary alignments = 0', '',
+             '     number of mapped paired reads (first in pair) = {}'.format(number(mapped // 2)),
+             '     number of mapped paired reads (second in pair) = {}'.format(number(mapped // 2)),
+             '     number of mapped paired reads (both in pair) = {}'.format(number(mapped)),
+             '     number of mapped paired reads (singletons) = 0', '',
+             '     number of mapped bases = {} bp'.format(number(mapped * 150)),
+             '     number of sequenced bases = {} bp'.format(number(mapped * 149)),
+             '     number of aligned bases = 0 bp',
+             '     number of duplicated reads (flagged) = {}'.format(number(mapped // 10)), '', '',
+             '>>>>>>> Insert size', '',
+             '     mean insert size = {:.4f}'.format(rng.uniform(200, 400)),
+             '     std insert size = {:.4f}'.format(rng.uniform(50, 100)),
+             '     median insert size = {}'.format(rng.randint(200, 400)), '', '',
+             '>>>>>>> Mapping quality', '',
+             '     mean mapping quality = {:.4f}'.format(rng.uniform(30, 60)), '', '',
+             '>>>>>>> ACTG content', '',
+             "     number of A's = 1,234,567,890 bp (29.2%)",
+             "     number of C's = 987,654,321 bp (20.8%)",
+             "     number of T's = 1,234,567,890 bp (29.2%)",
+             "     number of G's = 987,654,321 bp (20.8%)",
+             "     number of N's = 0 bp (0%)", '',
+             '     GC percentage = 41.6%', '', '',
+             '>>>>>>> Mismatches and indels', '',
+             '    general error rate = {:.4f}'.format(rng.uniform(0.001, 0.01)),
+             '    number of mismatches = 12,345,678',
+             '    number of insertions = 123,456',
+             '    mapped reads with insertion percentage = 1.2%',
+             '    number of deletions = 123,456',
+             '    mapped reads with deletion percentage = 1.2%',
+             '    homopolymer indels = 45.6%', '', '',
+             '>>>>>>> Coverage', '',
+             '     mean coverageData = 12.3456X',
+             '     std coverageData = 45.678X', '']
+    lines += ['     There is a {:.2f}% of reference with a coverageData >= {}X'.format(
+        100.0 / (i + 1), i + 1) for i in range(50)]
+    lines += ['', '', '>>>>>>> Coverage per contig', '']
+    lines += ['\tchr{}\t{}\t{}\t{:.4f}\t{:.4f}'.format(i, 10 ** 8, 10 ** 9, 10.0, 20.0) for i in range(195)]
+    return '\n'.join(lines) + '\n'
+
+
+def make_rnaseq_qc_results(name, rng, european=False):
+    exonic = rng.randint(10 ** 7, 4 * 10 ** 7)
+    intronic = rng.randint(10 ** 6, 5 * 10 ** 6)
+    intergenic = rng.randint(10 ** 5, 10 ** 6)
+    total = exonic + intronic + intergenic
+
+    def percentage(value):
+        text = '{:.2f}%'.format(100.0 * value / total)
+        return text.replace('.', ',') if european else text
+
+    lines = ['RNA-Seq QC report', '-----------------------------------', '',
+             '>>>>>>> Input', '',
+             '    bam file = /data/{}/{}.bam'.format(name, name),
+             '    gff file = /ref/genes.gtf',
+             '    counting algorithm = uniquely-mapped-reads',
+             '    protocol = non-strand-specific', '', '',
+             '>>>>>>> Reads alignment', '',
+             '    reads aligned (left/right) = {} / {}'.format(number(total, european), number(total, european)),
+             '    read pairs aligned  = {}'.format(number(total, european)),
+             '    total alignments = {}'.format(number(total * 2, european)),
+             '    secondary alignments = 0',
+             '    non-unique alignments = {}'.format(number(total // 10, european)),
+             '    aligned to genes  = {}'.format(number(exonic, european)),
+             '    ambiguous alignments = {}'.format(number(total // 100, european)),
+             '    no feature assigned = {}'.format(number(intronic + intergenic, european)),
+             '    not aligned = 0',
+             '    SSP estimation (fwd/rev) = 0.5 / 0.5', '', '',
+             '>>>>>>> Reads genomic origin', '',
+             '    exonic =  {} ({})'.format(number(exonic, european), percentage(exonic)),
+             '    intronic = {} ({})'.format(number(intronic, european), percentage(intronic)),
+             '    intergenic = {} ({})'.format(number(intergenic, european), percentage(intergenic)),
+             '    overlapping exon = {} ({})'.format(number(intronic // 10, european), percentage(intronic // 10)),
+             '', '', '>>>>>>> Transcript coverage profile', '',
+             "    5' bias = 0.5",
+             "    3' bias = 0.6",
+             "    5'-3' bias = {}".format('0.87'.replace('.', ',') if european else '0.87'), '', '',
+             '>>>>>>> Junction analysis', '',
+             '    reads at junctions = {}'.format(number(total // 5, european)), '']
+    lines += ['    {} : {:.2f}%'.format(motif, rng.uniform(0, 50)) for motif in
+              ['ACCT', 'AGGT', 'AGGA', 'TCCT', 'AGGC', 'GCCT', 'AGAC', 'ATCT', 'AGTT', 'CTCT', 'AGGG']]
+    return '\n'.join(lines) + '\n'
+
+
+def legacy_parse(text, regexes, european_fix=False):
+    """The former parser: a regex search on the whole file for every value."""
+    d = dict()
+    bam_file = re.search(r"bam file\s*=\s*(.+)", text, re.MULTILINE)
+    if bam_file:
+        d['bam_file'] = bam_file.group(1)
+    if european_fix and re.search(r"exonic\s*=\s*[\d\.]+ \(\d{1,3},\d+%\)", text, re.MULTILINE):
+        text = text.replace('.', '').replace(',', '.')
+    for k, r in regexes.items():
+        r_search = re.search(r, text, re.MULTILINE)
+        if r_search:
+            try:
+                d[k] = float(r_search.group(1).replace(',', ''))
+            except ValueError:
+                d[k] = r_search.group(1)
+    return d
+
+
+def read(f):
+    with io.open(os.path.join(f['root'], f['fn']), 'r', encoding='utf-8') as fh:
+        return fh.read()
+
+
+def legacy(genome, rnaseq):
+    # find_log_files read the rnaseq_qc_results.txt for the general stats and again for the sections
+    return ([legacy_parse(read(f), GENOME_REGEXES) for f in genome],
+            [legacy_parse(read(f), RNASEQ_REGEXES, True) for f in rnaseq],
+            [legacy_parse(read(f), RNASEQ_REGEXES, True) for f in rnaseq])
+
+
+def tokenized(genome, rnaseq):
+    # The results are cached by the module, a new module is run for every report
+    module = types.SimpleNamespace()
+    return tuple([QM_Results.select(QM_Results.get_results(module, f), keys) for f in files]
+                 for files, keys in [(genome, QM_Results.GENOME_RESULTS_KEYS),
+                                     (rnaseq, QM_Results.RNASEQ_RESULTS_KEYS),
+                                     (rnaseq, QM_Results.RNASEQ_RESULTS_KEYS)])
+
+
+def write(directory, fn, text):
+    os.makedirs(directory, exist_ok=True)
+    with io.open(os.path.join(directory, fn), 'w', encoding='utf-8') as fh:
+        fh.write(text)
+    return {'root': directory, 'fn': fn}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Qualimap results parser on synthetic files.')
+    parser.add_argument('--samples', type=int, default=2000, help='How many samples to parse.')
+    parser.add_argument('--repeats', type=int, default=9, help='The best of the repeats is reported.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic files.')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        genome, rnaseq = list(), list()
+        for i in range(args.samples):
+            sample_dir = os.path.join(tmp_dir, 'S%d' % i)
+            genome.append(write(os.path.join(sample_dir, 'bamqc'), 'genome_results.txt',
+                                make_genome_results('S%d' % i, rng)))
+            rnaseq.append(write(os.path.join(sample_dir, 'rnaseq'), 'rnaseq_qc_results.txt',
+                                make_rnaseq_qc_results('S%d' % i, rng, european=(i % 10 == 0))))
+
+        # Both parsers must find the same values
+        if legacy(genome, rnaseq) != tokenized(genome, rnaseq):
+            raise Exception('The tokenizer and the former parser disagree.')
+
+        size = sum(os.path.getsize(os.path.join(f['root'], f['fn'])) for f in [genome[0], rnaseq[0]])
+        print('{} samples, {:.1f} KB per sample'.format(args.samples, size / 1024))
+        # The parsers take turns, so both see the same load of the machine
+        parsers = [('regex per value (former)', legacy), ('one-pass tokenizer', tokenized)]
+        best = dict()
+        for _ in range(args.repeats):
+            for name, fn in parsers:
+                started = time.perf_counter()
+                fn(genome, rnaseq)
+                seconds = time.perf_counter() - started
+                best[name] = min(best.get(name, seconds), seconds)
+        for name, fn in parsers:
+            print('{:<26} {:>8.3f} s {:>8.1f} us per sample'.format(name, best[name],
+                                                                   best[name] / args.samples * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
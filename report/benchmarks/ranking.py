@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+""" Benchmark the ranking of query batches against the historical batches
+
+The former module looked up QC_test and scanned quality_score.txt with a mask for every
+category and tick, so ranking many query batches meant ranking the whole table again for
+every batch. The RankingIndex sorts the historical batches once, a query batch is then a
+binary search.
+
+    python benchmarks/ranking.py --reference 10000 --queries 50
+"""
+
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from quartet_rnaseq_report.modules.rnaseq_performance_assessment.ranking import RankingIndex, performance_categories
+
+
+def rank_table(reference, total_score, scaled_score):
+    """The table exp2qcdt writes for one query batch, and the former lookups of the module."""
+    df = pd.concat([reference, pd.DataFrame({'batch': ['QC_test'], 'total_score': [total_score],
+                                             'scaled_score': [scaled_score]})], ignore_index=True)
+    df = df.iloc[np.argsort(-df['total_score'].values, kind='stable')].reset_index(drop=True)
+    df['rank'] = np.arange(1, len(df) + 1)
+    df['performance'] = performance_categories(len(df))
+    counts = dict((c, len(df[df['performance'] == c])) for c in ['Bad', 'Fair', 'Good', 'Great'])
+    rank = int(df.loc[df['batch'] == 'QC_test', 'rank'].iloc[0])
+    ticks = [float(df.loc[df['performance'] == c, 'scaled_score'].iloc[0]) for c in ['Bad', 'Fair', 'Good', 'Great']]
+    return rank, counts, ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ranking of query batches.')
+    parser.add_argument('--reference', type=int, default=10000, help='How many historical batches.')
+    parser.add_argument('--queries', type=int, default=50, help='How many query batches.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic scores.')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    reference = pd.DataFrame({'batch': ['B%d' % i for i in range(args.reference)],
+                              'total_score': np.round(rng.uniform(2, 6, args.reference), 3)})
+    reference['scaled_score'] = 1 + 9 * (reference['total_score'] - 2) / 4.0
+    queries = np.round(rng.uniform(2, 6, args.queries), 3)
+
+    started = time.perf_counter()
+    former = [rank_table(reference, q, 1 + 9 * (q - 2) / 4.0) for q in queries]
+    former_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = RankingIndex(reference['total_score'].values, reference['scaled_score'].values)
+    placed = [index.place(q, 1 + 9 * (q - 2) / 4.0) for q in queries]
+    index_seconds = time.perf_counter() - started
+
+    for (rank, counts, ticks), p in zip(former, placed):
+        if rank != p['rank'] or counts != index.counts or \
+                not np.allclose(ticks, [p['first'][c] for c in ['Bad', 'Fair', 'Good', 'Great']]):
+            raise Exception('The index and the former lookups disagree.')
+
+    print('{} query batches against {} historical batches'.format(args.queries, args.reference))
+    print('{:<22} {:>8.1f} ms'.format('table per query', former_seconds * 1000))
+    print('{:<22} {:>8.1f} ms'.format('ranking index', index_seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
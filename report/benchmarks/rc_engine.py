@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+""" Benchmark the RC engine on a synthetic archive of batches
+
+exp2qcdt computes the RC of one batch per R session: the fold-changes are joined with
+the reference fold-changes and correlated. The engine (see assessment/rc.py) aligns the
+fold-changes of every batch on the reference and only keeps the sums of the correlation
+of a batch. The RC of the engine is checked against a join and a correlation per batch.
+Most of the time of a batch is reading its count table, rescore reads the tables with
+--workers processes.
+
+    python benchmarks/rc_engine.py --batches 200 --genes 20000
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from quartet_rnaseq_report.assessment.rc import (COMPARISONS, ReferenceFoldChanges, read_fold_changes,
+                                                relative_correlations, rescore)
+from quartet_rnaseq_report.reference import ReferenceStore
+
+SAMPLES = ['D5', 'D6', 'F7', 'M8']
+
+
+def write_archive(directory, batches, genes, rng):
+    """ The reference fold-changes and a batch sheet of batches of 12 libraries. """
+    gene_ids = np.array(['ENSG%011d' % i for i in range(genes)])
+    base = rng.lognormal(3, 2, genes)
+    effects = dict(zip(SAMPLES, [rng.normal(0, 1, genes) * (rng.uniform(size=genes) < 0.3) for _ in SAMPLES]))
+    effects['D6'] = np.zeros(genes)
+
+    store = ReferenceStore.create(os.path.join(directory, 'store'))
+    selected = [rng.uniform(size=genes) < 0.5 for _ in COMPARISONS]
+    store.append('fc_value', OrderedDict([
+        ('gene', np.concatenate([gene_ids[s] for s in selected])),
+        ('compare', np.concatenate([np.repeat('%s/%s' % c, s.sum()) for c, s in zip(COMPARISONS, selected)])),
+        ('medianP', np.concatenate([rng.uniform(size=s.sum()) for s in selected])),
+        ('meanlogFC', np.concatenate([np.round(effects[c[0]][s], 3) for c, s in zip(COMPARISONS, selected)])),
+        ('DEGtype', np.concatenate([np.repeat('non-DEG', s.sum()) for s in selected])),
+        ('Gene_Name', np.concatenate([np.repeat('', s.sum()) for s in selected])),
+    ]))
+
+    meta = pd.DataFrame({'library': ['%s_%d' % (s, r) for s in SAMPLES for r in range(1, 4)],
+                         'sample': [s for s in SAMPLES for _ in range(3)]})
+    meta['group'] = meta['library']
+    rows = list()
+    for b in range(batches):
+        batch_dir = os.path.join(directory, 'B%d' % b)
+        os.makedirs(batch_dir)
+        noise = rng.uniform(0.1, 1.0)
+        means = base[:, None] * np.exp2(np.column_stack([effects[s] for s in meta['sample']]) +
+                                        rng.normal(0, noise, (genes, 1)))
+        counts = pd.DataFrame(rng.poisson(means * rng.uniform(0.5, 2, 12)), columns=meta['library'])
+        counts.insert(0, 'GENE_ID', gene_ids)
+        counts.to_csv(os.path.join(batch_dir, 'count.csv'), index=False)
+        meta.to_csv(os.path.join(batch_dir, 'metadata.csv'), index=False)
+        rows.append({'batch': 'B%d' % b, 'count': os.path.join(batch_dir, 'count.csv'),
+                     'metadata': os.path.join(batch_dir, 'metadata.csv')})
+    return store, pd.DataFrame(rows)
+
+
+def per_batch(batches, store):
+    """ The RC of every batch as exp2qcdt: a join with the reference and a correlation. """
+    ref = store.frame('fc_value')[['gene', 'compare', 'meanlogFC']]
+    rcs = list()
+    for count, metadata in zip(batches['count'], batches['metadata']):
+        fcs = read_fold_changes(count, metadata)
+        test = pd.concat([pd.DataFrame({'gene': ids, 'compare': compare, 'meanlogFC': logfc})
+                          for compare, (ids, logfc) in fcs.items()])
+        joined = test.merge(ref, on=['gene', 'compare'], suffixes=('_test', '_ref'))
+        rcs.append(np.corrcoef(joined['meanlogFC_test'], joined['meanlogFC_ref'])[0, 1])
+    return np.array(rcs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the RC engine.')
+    parser.add_argument('--batches', type=int, default=200, help='The batches of the archive.')
+    parser.add_argument('--genes', type=int, default=20000, help='The genes of a batch.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic archive.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        store, batches = write_archive(directory, args.batches, args.genes, np.random.RandomState(args.seed))
+        print('{} batches, {} genes, {} reference fold-changes'.format(args.batches, args.genes, store.rows('fc_value')))
+
+        started = time.perf_counter()
+        expected = per_batch(batches, store)
+        print('  {:<24} {:>8.2f} s'.format('join per batch', time.perf_counter() - started))
+        started = time.perf_counter()
+        result = rescore(batches, store, workers=1)
+        seconds = time.perf_counter() - started
+        print('  {:<24} {:>8.2f} s ({:.0f} ms per batch)'.format('engine (1 worker)', seconds, seconds / args.batches * 1000))
+
+        # The correlations of all the batches, once the fold-changes are read
+        reference = ReferenceFoldChanges(store)
+        aligned = np.vstack([reference.align(read_fold_changes(count, metadata))
+                             for count, metadata in zip(batches['count'][:20], batches['metadata'][:20])])
+        aligned = np.tile(aligned, (max(1, args.batches // 20), 1))
+        started = time.perf_counter()
+        relative_correlations(aligned, reference.values)
+        print('  {:<24} {:>8.2f} ms'.format('correlations only', (time.perf_counter() - started) * 1000))
+
+        if not np.allclose(result['RC'].values, np.round(expected, 3)):
+            raise Exception('The engine and the join per batch disagree.')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+""" Benchmark the reference store on the data of exp2qcdt and synthetic batches
+
+The reference data were parsed from the CSV files of exp2qcdt/data on every run. The
+reference store (see reference.py) memory-maps its columns, and a batch is appended
+without rewriting the store.
+
+    python benchmarks/reference_store.py --data-dir ../exp2qcdt/data --batches 50000
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from quartet_rnaseq_report.reference import ReferenceStore, read_csv
+
+
+def synthetic_batches(batches, rng):
+    snr = np.round(rng.normal(20, 6, batches), 1)
+    rc = np.round(rng.uniform(0.85, 0.97, batches), 3)
+    return OrderedDict([
+        ('batch', np.array(['S_LAB_L%d_B1' % i for i in range(batches)])),
+        ('SNR', snr),
+        ('RC', rc),
+        ('total_score', np.round(np.sqrt(np.abs(snr) * rc), 1)),
+        ('MCC_of_refDEG', np.round(rng.uniform(0.4, 0.8, batches), 3)),
+        ('Quality', np.where(rc > 0.9, 'High quality', 'Low quality')),
+    ])
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the reference store.')
+    parser.add_argument('--data-dir', required=True, help='The data directory of exp2qcdt.')
+    parser.add_argument('--batches', type=int, default=50000, help='The synthetic historical batches.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic batches.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        qc_fpath = os.path.join(args.data_dir, 'ref_data_qc_value.csv')
+        fc_fpath = os.path.join(args.data_dir, 'ref_data_fc_value.csv')
+        batches = synthetic_batches(args.batches, np.random.RandomState(args.seed))
+        batches_fpath = os.path.join(directory, 'batches.csv')
+        pd.DataFrame(batches).to_csv(batches_fpath, index=False)
+
+        store = ReferenceStore.create(os.path.join(directory, 'store'))
+        store.append('qc_value', read_csv(qc_fpath, 'qc_value'))
+        store.append('fc_value', read_csv(fc_fpath, 'fc_value'))
+        store.append('qc_value', batches)
+        store.compact()
+
+        print('{} historical batches, {} reference fold-changes'.format(store.rows('qc_value'), store.rows('fc_value')))
+        rows = [
+            ('fc_value: CSV', lambda: pd.read_csv(fc_fpath)['meanlogFC'].values),
+            ('fc_value: store', lambda: ReferenceStore(store.path).column('fc_value', 'meanlogFC')),
+            ('batches: CSV', lambda: pd.read_csv(batches_fpath)['total_score'].values),
+            ('batches: store', lambda: ReferenceStore(store.path).column('qc_value', 'total_score')),
+        ]
+        results = dict()
+        for label, fn in rows:
+            seconds, results[label] = timed(fn)
+            print('  {:<20} {:>8.2f} ms'.format(label, seconds * 1000))
+        if not np.allclose(results['fc_value: CSV'], results['fc_value: store']):
+            raise Exception('The CSV file and the store disagree on the fold-changes.')
+        if not np.allclose(results['batches: store'][-args.batches:], results['batches: CSV']):
+            raise Exception('The CSV file and the store disagree on the total scores.')
+
+        # Appending a batch writes one chunk, whatever the size of the store
+        one = OrderedDict((column, values[:1]) for column, values in synthetic_batches(1, np.random.RandomState(0)).items())
+        one['batch'] = np.array(['S_LAB_NEW_B1'])
+        started = time.perf_counter()
+        store.append('qc_value', one)
+        print('  {:<20} {:>8.2f} ms'.format('append a batch', (time.perf_counter() - started) * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
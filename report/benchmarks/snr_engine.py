@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+""" Benchmark the SNR engine and cross-check it
+
+The SNR of exp2qcdt is computed in R with prcomp (an exact SVD of all components) and a
+table of the distances of all the pairs of libraries. The engine (see assessment/snr.py)
+uses a randomized truncated SVD and a distance matrix. It's checked against an exact
+translation of the R code, on a synthetic batch or on the files of a batch:
+
+    python benchmarks/snr_engine.py --libraries 240 --genes 58000
+    python benchmarks/snr_engine.py -e fpkm.csv -c count.csv -m metadata.csv --r-output pca_with_snr.txt
+
+With --r-output, the pca_with_snr.txt written by exp2qcdt for the same files is compared
+too, the signs of the components are arbitrary so PC1 and PC2 are compared up to a sign.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from quartet_rnaseq_report.assessment.snr import compute_snr
+
+SAMPLES = ['D5', 'D6', 'F7', 'M8']
+
+
+def write_batch(directory, libraries, genes, rng):
+    """ A batch of libraries of the 4 samples, the samples differ on a fraction of the genes. """
+    meta = pd.DataFrame({
+        'library': ['L%d' % i for i in range(libraries)],
+        'sample': [SAMPLES[i % 4] for i in range(libraries)],
+    })
+    meta['group'] = meta['sample'] + '_' + (meta.index // 4 + 1).astype(str)
+    base = rng.lognormal(2, 2.5, genes)
+    effects = rng.normal(0, 1, (genes, 4)) * (rng.uniform(size=(genes, 1)) < 0.2)
+    sample_index = np.arange(libraries) % 4
+    means = base[:, None] * np.exp2(effects[:, sample_index])
+    counts = rng.poisson(means * rng.uniform(0.8, 1.2, libraries))
+    gene_ids = ['ENSG%011d' % i for i in range(genes)]
+    fpkm = counts / counts.sum(axis=0) * 1e6 / rng.uniform(0.5, 5, (genes, 1))
+
+    paths = {'metadata': os.path.join(directory, 'metadata.csv'),
+             'count': os.path.join(directory, 'count.csv'),
+             'fpkm': os.path.join(directory, 'fpkm.csv')}
+    meta[['group', 'library', 'sample']].to_csv(paths['metadata'], index=False)
+    for name, values in [('count', counts), ('fpkm', fpkm)]:
+        df = pd.DataFrame(values, columns=meta['library'])
+        df.insert(0, 'GENE_ID', gene_ids)
+        df.to_csv(paths[name], index=False)
+    return paths
+
+
+def r_translation(fpkm_fpath, count_fpath, meta_fpath):
+    """ output_snr_res, get_pca_list and calc_signoise_ratio of exp2qcdt, line by line. """
+    dt_fpkm = pd.read_csv(fpkm_fpath)
+    dt_counts = pd.read_csv(count_fpath)
+    dt_meta = pd.read_csv(meta_fpath)
+    dt_fpkm_log = np.log2(dt_fpkm.iloc[:, 1:] + 0.01).set_index(dt_fpkm.iloc[:, 0].rename('gene_id'))
+
+    detected = pd.concat([(dt_counts[dt_meta[dt_meta['sample'] == x]['library']] >= 3).sum(axis=1) >= 2
+                          for x in dt_meta['sample'].unique()], axis=1)
+    gene_list_snr = dt_counts.iloc[:, 0][detected.any(axis=1)]
+    dt_fpkm_f = dt_fpkm_log.loc[gene_list_snr, dt_meta['library']]
+    zscore = dt_fpkm_f.sub(dt_fpkm_f.mean(axis=1), axis=0).div(dt_fpkm_f.std(axis=1), axis=0)
+
+    x = zscore.values.T
+    x = x - x.mean(axis=0)
+    u, s, _ = np.linalg.svd(x, full_matrices=False)
+    pcs = pd.DataFrame(u * s, index=dt_meta['library'].values)
+    percent = np.round(s ** 2 / np.sum(s ** 2), 5)
+
+    pairs = pd.DataFrame({'ID.A': np.repeat(pcs.index, len(pcs)), 'ID.B': np.tile(pcs.index, len(pcs))})
+    group = dt_meta.set_index('library')['sample']
+    pairs['Type'] = np.where(pairs['ID.A'] == pairs['ID.B'], 'Same',
+                             np.where(group[pairs['ID.A']].values == group[pairs['ID.B']].values, 'Intra', 'Inter'))
+    pairs['Dist'] = (percent[0] * (pcs.loc[pairs['ID.A'], 0].values - pcs.loc[pairs['ID.B'], 0].values) ** 2 +
+                     percent[1] * (pcs.loc[pairs['ID.A'], 1].values - pcs.loc[pairs['ID.B'], 1].values) ** 2)
+    avg = pairs.groupby('Type')['Dist'].mean()
+    return {
+        'SNR': round(10 * np.log10(avg['Inter'] / avg['Intra']), 3),
+        'ratios': np.round(percent[:3] * 100, 2),
+        'PC1': pcs[0].round(3).sort_index(),
+        'PC2': pcs[1].round(3).sort_index(),
+        'gene_num': len(gene_list_snr),
+    }
+
+
+def compare(label, engine, expected):
+    """ Print the differences of the engine with the expected SNR, ratios and components. """
+    snr = float(engine['SNR'].iloc[0])
+    ratios = engine[['PC1_ratio', 'PC2_ratio', 'PC3_ratio']].iloc[0].values.astype(float)
+    print('{}:'.format(label))
+    print('  SNR {:.3f} / {:.3f}, PC ratios {} / {}, genes {} / {}'.format(
+        snr, expected['SNR'], ratios.tolist(), np.asarray(expected['ratios']).tolist(),
+        engine['gene_num'].iloc[0], expected['gene_num']))
+    for pc in ['PC1', 'PC2']:
+        values = engine.set_index('library')[pc].sort_index().values
+        other = expected[pc].values
+        # The signs of the components are arbitrary
+        diff = min(np.abs(values - other).max(), np.abs(values + other).max())
+        print('  max |{} difference| (up to a sign) {:.3g}'.format(pc, diff))
+    if abs(snr - expected['SNR']) > 0.0015 or not np.allclose(ratios, expected['ratios'], atol=0.011):
+        raise Exception('The engine and {} disagree.'.format(label))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SNR engine.')
+    parser.add_argument('--libraries', type=int, default=240, help='The libraries of the synthetic batch.')
+    parser.add_argument('--genes', type=int, default=58000, help='The genes of the synthetic batch.')
+    parser.add_argument('--seed', type=int, default=1, help='The seed of the synthetic batch.')
+    parser.add_argument('--fpkm', '-e', help='The FPKM table of a batch, instead of a synthetic batch.')
+    parser.add_argument('--count', '-c', help='The count table of the batch.')
+    parser.add_argument('--metadata', '-m', help='The metadata of the batch.')
+    parser.add_argument('--r-output', help='The pca_with_snr.txt of exp2qcdt for the batch.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        if args.fpkm:
+            paths = {'fpkm': args.fpkm, 'count': args.count, 'metadata': args.metadata}
+        else:
+            paths = write_batch(directory, args.libraries, args.genes, np.random.RandomState(args.seed))
+            print('{} libraries, {} genes'.format(args.libraries, args.genes))
+
+        timings = list()
+        for label, fn in [('engine', lambda: compute_snr(paths['fpkm'], paths['count'], paths['metadata'])),
+                          ('R translation', lambda: r_translation(paths['fpkm'], paths['count'], paths['metadata']))]:
+            started = time.perf_counter()
+            result = fn()
+            timings.append((label, time.perf_counter() - started, result))
+        for label, seconds, _ in timings:
+            print('  {:<16} {:>8.2f} s'.format(label, seconds))
+
+        compare('the R translation', timings[0][2], timings[1][2])
+        if args.r_output:
+            r_output = pd.read_csv(args.r_output, sep='\t')
+            compare(args.r_output, timings[0][2], {
+                'SNR': float(r_output['SNR'].iloc[0]),
+                'ratios': r_output[['PC1_ratio', 'PC2_ratio', 'PC3_ratio']].iloc[0].values.astype(float),
+                'PC1': r_output.set_index('library')['PC1'].sort_index(),
+                'PC2': r_output.set_index('library')['PC2'].sort_index(),
+                'gene_num': r_output['gene_num'].iloc[0],
+            })
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
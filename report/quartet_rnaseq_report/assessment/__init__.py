@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+""" The performance assessment of a batch, the engines of the tables of exp2qcdt
+
+The engines read the expression tables and the metadata of a batch, like exp2qcdt.sh,
+and write the tables of performance_assessment/ which the report reads.
+"""
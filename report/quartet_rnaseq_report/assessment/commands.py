@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+""" The command line of the assessment engines
+
+    quartet-rnaseq-assessment snr -e fpkm.csv -c count.csv -m metadata.csv -o results
+    quartet-rnaseq-assessment rc -c count.csv -m metadata.csv -o results
+    quartet-rnaseq-assessment rescore --batches batches.csv --output rc.csv
+"""
+
+from __future__ import print_function
+import logging
+import os
+
+import click
+
+from quartet_rnaseq_report.assessment.rc import compute_rc, rescore as rescore_batches, write_logfc_cor_ref_test
+from quartet_rnaseq_report.assessment.snr import COMPONENTS, compute_snr, write_pca_with_snr
+from quartet_rnaseq_report.reference import DEFAULT_STORE, ReferenceStore
+
+
+@click.group()
+def main():
+    """ The performance assessment of a batch of Quartet RNA-Seq. """
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+
+@main.command('snr')
+@click.option('--fpkm', '-e', required=True, type=click.Path(exists=True, dir_okay=False),
+              help="The FPKM table, a row per gene and a column per library.")
+@click.option('--count', '-c', required=True, type=click.Path(exists=True, dir_okay=False),
+              help="The count table, with the columns of the FPKM table.")
+@click.option('--metadata', '-m', required=True, type=click.Path(exists=True, dir_okay=False),
+              help="The metadata, with the library and the sample columns.")
+@click.option('--result-dir', '-o', required=True, type=click.Path(exists=True, file_okay=False),
+              help="The result directory, pca_with_snr.txt is written to its performance_assessment directory.")
+@click.option('--components', required=False, default=COMPONENTS, show_default=True, type=click.IntRange(min=2),
+              help="The principal components in pca_with_snr.txt.")
+def snr(fpkm, count, metadata, result_dir, components):
+    """ Compute the SNR of a batch, as exp2qcdt. """
+    write_pca_with_snr(compute_snr(fpkm, count, metadata, components), result_dir)
+
+
+@main.command('rc')
+@click.option('--count', '-c', required=True, type=click.Path(exists=True, dir_okay=False),
+              help="The count table, a row per gene and a column per library.")
+@click.option('--metadata', '-m', required=True, type=click.Path(exists=True, dir_okay=False),
+              help="The metadata, with the library and the sample columns.")
+@click.option('--result-dir', '-o', required=True, type=click.Path(exists=True, file_okay=False),
+              help="The result directory, logfc_cor_ref_test.txt is written to its performance_assessment directory.")
+@click.option('--store', required=False, default=DEFAULT_STORE, show_default=True, type=click.Path(file_okay=False),
+              help="The reference store with the reference fold-changes.")
+def rc(count, metadata, result_dir, store):
+    """ Compute the RC of a batch, as exp2qcdt. """
+    write_logfc_cor_ref_test(compute_rc(count, metadata, ReferenceStore(store)), result_dir)
+
+
+@main.command('rescore')
+@click.option('--batches', required=True, type=click.Path(exists=True, dir_okay=False),
+              help="A CSV file with the batch, count and metadata columns, the paths are relative to it.")
+@click.option('--output', '-o', required=True, type=click.Path(dir_okay=False),
+              help="The CSV file of the RC of the batches.")
+@click.option('--store', required=False, default=DEFAULT_STORE, show_default=True, type=click.Path(file_okay=False),
+              help="The reference store with the reference fold-changes.")
+@click.option('--workers', '-w', required=False, default=os.cpu_count(), show_default=True,
+              type=click.IntRange(min=1), help="How many processes read the count tables.")
+def rescore(batches, output, store, workers):
+    """ Compute the RC of the historical batches again, e.g. after the reference fold-changes are updated. """
+    import pandas as pd
+
+    df = pd.read_csv(batches, dtype=str)
+    missing = [column for column in ['batch', 'count', 'metadata'] if column not in df.columns]
+    if missing:
+        raise Exception('{} has no column {}.'.format(batches, ', '.join(missing)))
+    for column in ['count', 'metadata']:
+        df[column] = [os.path.join(os.path.dirname(os.path.abspath(batches)), fpath) for fpath in df[column]]
+
+    result = rescore_batches(df, ReferenceStore(store), workers)
+    result.to_csv(output, index=False)
+    logging.info('The RC of {} batches are written to {}'.format(len(result), output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+""" Read the expression tables and the metadata of a batch
+
+The FPKM and the count tables are merged by the report task (merge-exp-files!), a row
+is a gene and a column is a library, the first column is the gene id. The tables are
+read by chunks of rows and every chunk is reduced (e.g. log-transformed) when it's read,
+so only the libraries of the metadata are kept, as float64.
+"""
+
+from __future__ import print_function
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+CHUNK_ROWS = 20000
+# log2(FPKM + 0.01), as exp2qcdt
+PSEUDO_COUNT = 0.01
+# A gene is detected in a sample if at least 2 replicates have at least 3 reads
+MIN_COUNT = 3
+MIN_REPLICATES = 2
+SEPARATORS = ['\t', ',', ';', ' ']
+
+
+def guess_separator(fpath):
+    """ The separator which splits the header in the most columns, as guess-separator of the task. """
+    with open(fpath) as f:
+        header = f.readline()
+    return max(SEPARATORS, key=lambda sep: len(header.split(sep)))
+
+
+def read_header(fpath):
+    with open(fpath) as f:
+        header = f.readline().rstrip('\r\n').lstrip('\ufeff')
+    return header.split(guess_separator(fpath))
+
+
+def read_metadata(fpath):
+    """ The libraries of the batch, with their sample (D5, D6, F7 or M8). """
+    import pandas as pd
+
+    meta = pd.read_csv(fpath, sep=guess_separator(fpath), dtype=str)
+    missing = [column for column in ['library', 'sample'] if column not in meta.columns]
+    if missing:
+        raise Exception('{} has no column {}.'.format(fpath, ', '.join(missing)))
+    if meta['library'].duplicated().any():
+        raise Exception('The libraries of {} must be unique.'.format(fpath))
+    if meta['sample'].nunique() < 2 and (meta['sample'].value_counts() < 2).all():
+        raise Exception('At least two types of samples are required to calculate SNR')
+    return meta
+
+
+def check_tables(fpkm_fpath, count_fpath, meta):
+    """ exp2qcdt requires the same columns in the FPKM and the count tables. """
+    fpkm_header, count_header = read_header(fpkm_fpath), read_header(count_fpath)
+    if fpkm_header[1:] != count_header[1:]:
+        raise Exception('Please ensure that sample id of fpkm, counts and meta files in the same order')
+    missing = [library for library in meta['library'] if library not in fpkm_header[1:]]
+    if missing:
+        raise Exception('{} has no library {}.'.format(fpkm_fpath, ', '.join(missing)))
+
+
+def read_matrix(fpath, libraries, reduce=None, chunk_rows=CHUNK_ROWS):
+    """ The gene ids and the values of the libraries (in this order) of an expression
+    table, reduce is applied to the values of every chunk. """
+    import pandas as pd
+
+    header = read_header(fpath)
+    gene_column = header[0]
+    dtype = dict((library, 'float64') for library in libraries)
+    dtype[gene_column] = str
+    ids, blocks = list(), list()
+    reader = pd.read_csv(fpath, sep=guess_separator(fpath), usecols=[gene_column] + list(libraries),
+                         dtype=dtype, chunksize=chunk_rows)
+    for chunk in reader:
+        values = chunk[list(libraries)].values
+        ids.append(chunk[gene_column].values)
+        blocks.append(reduce(values) if reduce else values)
+    if not blocks:
+        raise Exception('{} has no genes.'.format(fpath))
+    log.debug('Read {} genes of {}'.format(sum(len(block) for block in ids), fpath))
+    return np.concatenate(ids), np.concatenate(blocks)
+
+
+def log_fpkm(values):
+    return np.log2(values + PSEUDO_COUNT)
+
+
+def read_log_fpkm(fpath, libraries):
+    """ The gene ids and the log2 FPKM of the libraries. """
+    return read_matrix(fpath, libraries, reduce=log_fpkm)
+
+
+def read_detected(fpath, meta, samples):
+    """ The gene ids and whether the genes are detected in every sample (a column per sample). """
+    columns = [np.flatnonzero((meta['sample'] == sample).values) for sample in samples]
+
+    def detect(values):
+        detected = values >= MIN_COUNT
+        return np.column_stack([detected[:, column].sum(axis=1) >= MIN_REPLICATES for column in columns])
+
+    return read_matrix(fpath, list(meta['library']), reduce=detect)
+
+
+def select_genes(ids, values, genes):
+    """ The rows of the genes, in the order of genes (the tables are joined by gene id). """
+    index = dict((gene, i) for i, gene in enumerate(ids))
+    missing = [gene for gene in genes if gene not in index]
+    if missing:
+        raise Exception('The FPKM table has no gene {}.'.format(', '.join(missing[:5])))
+    return values[[index[gene] for gene in genes]]
+
+
+def zscore(values):
+    """ The z-scores of every gene (row) across the libraries, the genes with a constant
+    expression have none and are left out. """
+    mean = values.mean(axis=1, keepdims=True)
+    sd = values.std(axis=1, ddof=1, keepdims=True)
+    constant = (sd == 0).ravel()
+    if constant.any():
+        log.warning('{} genes have the same expression in all libraries, they are left out'.format(constant.sum()))
+    return ((values - mean) / np.where(sd == 0, 1, sd))[~constant]
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+""" The relative correlation (RC) with the reference fold-changes, logfc_cor_ref_test.txt
+
+As make_performance_plot of exp2qcdt: for every comparison (D5/D6, F7/D6 and M8/D6), the
+genes detected in both samples (see expression.py) and with at least 15 reads in the
+libraries of the comparison (filterByExpr) are kept, the libraries are normalized by TMM
+(calcNormFactors) and the log2 fold-change is the difference of the weighted means of the
+log-CPM of the samples, with the precision weights of voom (lmFit on ~group). The RC is
+the Pearson correlation of the fold-changes of all comparisons with the reference
+fold-changes of the reference store.
+
+The mean-variance trend of voom is fitted with a port of lowess (clowess of R), see
+benchmarks/golden for the check against the logfc_cor_ref_test.txt of exp2qcdt.
+
+The fold-changes of a batch are aligned on the reference fold-changes (a missing gene is
+NaN), the sums of the correlation are accumulated batch by batch.
+"""
+
+from __future__ import print_function
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+import numpy as np
+
+from quartet_rnaseq_report.assessment.expression import MIN_COUNT, MIN_REPLICATES, read_matrix, read_metadata
+
+log = logging.getLogger(__name__)
+
+COMPARISONS = [('D5', 'D6'), ('F7', 'D6'), ('M8', 'D6')]
+# filterByExpr(min.count = 0) only keeps the genes with enough reads in total
+MIN_TOTAL_COUNT = 15
+# log-CPM of voom
+PRIOR_COUNT = 0.5
+# calcNormFactors(method = "TMM")
+LOGRATIO_TRIM = 0.3
+SUM_TRIM = 0.05
+# voom(span = 0.5), lowess(iter = 3, delta = 0.01 * diff(range(x)))
+VOOM_SPAN = 0.5
+LOWESS_ITERATIONS = 3
+LOWESS_DELTA = 0.01
+
+
+def average_ranks(values):
+    """ The ranks of R (ties.method = "average"), from 1. """
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    ends = np.r_[starts[1:], len(values)]
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat((starts + ends + 1) / 2.0, ends - starts)
+    return ranks
+
+
+def tmm_factor(obs, ref, obs_size, ref_size):
+    """ The TMM factor of a library against the reference library (.calcFactorTMM). """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_ratio = np.log2((obs / obs_size) / (ref / ref_size))
+        abs_expr = (np.log2(obs / obs_size) + np.log2(ref / ref_size)) / 2
+        variance = (obs_size - obs) / obs_size / obs + (ref_size - ref) / ref_size / ref
+    finite = np.isfinite(log_ratio) & np.isfinite(abs_expr)
+    log_ratio, abs_expr, variance = log_ratio[finite], abs_expr[finite], variance[finite]
+    if len(log_ratio) == 0 or np.max(np.abs(log_ratio)) < 1e-6:
+        return 1.0
+
+    n = len(log_ratio)
+    lo_l = np.floor(n * LOGRATIO_TRIM) + 1
+    lo_s = np.floor(n * SUM_TRIM) + 1
+    ratio_ranks, expr_ranks = average_ranks(log_ratio), average_ranks(abs_expr)
+    keep = ((ratio_ranks >= lo_l) & (ratio_ranks <= n + 1 - lo_l) &
+            (expr_ranks >= lo_s) & (expr_ranks <= n + 1 - lo_s))
+    if not keep.any():
+        return 1.0
+    return 2 ** (np.sum(log_ratio[keep] / variance[keep]) / np.sum(1 / variance[keep]))
+
+
+def tmm_factors(counts):
+    """ The normalization factors of the libraries (columns), with a geometric mean of 1. """
+    lib_sizes = counts.sum(axis=0)
+    upper_quartiles = np.percentile(counts, 75, axis=0) / lib_sizes
+    ref = np.argmin(np.abs(upper_quartiles - upper_quartiles.mean()))
+    factors = np.array([tmm_factor(counts[:, i], counts[:, ref], lib_sizes[i], lib_sizes[ref])
+                        for i in range(counts.shape[1])])
+    return factors / np.exp(np.mean(np.log(factors)))
+
+
+def log_cpm(counts):
+    """ The log-CPM of voom and the library sizes normalized by TMM. """
+    lib_sizes = counts.sum(axis=0) * tmm_factors(counts)
+    return np.log2((counts + PRIOR_COUNT) / (lib_sizes + 1) * 1e6), lib_sizes
+
+
+def _lowest(x, y, xs, nleft, nright, robustness):
+    """ The fitted value at xs of the points nleft to nright (and their ties), lowest of clowess. """
+    h = max(xs - x[nleft], x[nright] - xs)
+    r = np.abs(x[nleft:] - xs)
+    beyond = np.flatnonzero((r > 0.999 * h) & (x[nleft:] > xs))
+    nrt = nleft + (beyond[0] if len(beyond) else len(r))
+    r = r[:nrt - nleft]
+    w = np.where(r <= 0.001 * h, 1.0, (1 - (r / h) ** 3) ** 3) * (r <= 0.999 * h)
+    if robustness is not None:
+        w = w * robustness[nleft:nrt]
+    if w.sum() <= 0:
+        return None
+    w = w / w.sum()
+    xj = x[nleft:nrt]
+    if h > 0:
+        center = np.sum(w * xj)
+        c = np.sum(w * (xj - center) ** 2)
+        if np.sqrt(c) > 0.001 * (x[-1] - x[0]):
+            w = w * ((xs - center) / c * (xj - center) + 1)
+    return np.sum(w * y[nleft:nrt])
+
+
+def lowess(x, y, f=VOOM_SPAN, iterations=LOWESS_ITERATIONS):
+    """ The sorted x and the fitted values of lowess of R, x and y are arrays. """
+    order = np.argsort(x, kind='stable')
+    x, y = np.asarray(x, dtype=float)[order], np.asarray(y, dtype=float)[order]
+    n = len(x)
+    if n < 2:
+        return x, y.copy()
+    delta = LOWESS_DELTA * (x[-1] - x[0])
+    ns = max(2, min(n, int(f * n + 1e-7)))
+    fitted, robustness = np.empty(n), None
+    for iteration in range(iterations + 1):
+        nleft, nright, last, i = 0, ns - 1, -1, 0
+        while True:
+            if nright < n - 1 and x[i] - x[nleft] > x[nright + 1] - x[i]:
+                nleft, nright = nleft + 1, nright + 1
+                continue
+            value = _lowest(x, y, x[i], nleft, nright, robustness)
+            fitted[i] = y[i] if value is None else value
+            if last < i - 1:
+                # The skipped points are interpolated
+                alpha = (x[last + 1:i] - x[last]) / (x[i] - x[last])
+                fitted[last + 1:i] = alpha * fitted[i] + (1 - alpha) * fitted[last]
+            last = i
+            cut = x[last] + delta
+            i = last + 1
+            while i < n and x[i] <= cut:
+                if x[i] == x[last]:
+                    fitted[i] = fitted[last]
+                    last = i
+                i += 1
+            i = max(last + 1, i - 1)
+            if last >= n - 1:
+                break
+
+        residuals = y - fitted
+        if iteration == iterations:
+            break
+        cmad = 6 * np.median(np.abs(residuals))
+        if cmad < 1e-7 * np.mean(np.abs(residuals)):
+            break
+        r = np.abs(residuals)
+        robustness = np.where(r <= 0.001 * cmad, 1.0, np.where(r <= 0.999 * cmad, (1 - (r / cmad) ** 2) ** 2, 0.0))
+    return x, fitted
+
+
+def voom_weights(values, lib_sizes, test_columns):
+    """ The precision weights of voom for a design of two groups, values are the log-CPM. """
+    groups = [np.arange(values.shape[1])[test_columns], np.arange(values.shape[1])[~test_columns]]
+    means = np.zeros(values.shape)
+    for columns in groups:
+        means[:, columns] = values[:, columns].mean(axis=1, keepdims=True)
+    df = values.shape[1] - 2
+    if df < 1 or len(values) < 2:
+        return np.ones(values.shape)
+
+    sigma = np.sqrt(np.sum((values - means) ** 2, axis=1) / df)
+    sx = values.mean(axis=1) + np.mean(np.log2(lib_sizes + 1)) - np.log2(1e6)
+    trend_x, trend_y = lowess(sx, np.sqrt(sigma))
+    # approxfun(rule = 2, ties = list("ordered", mean))
+    xs, inverse = np.unique(trend_x, return_inverse=True)
+    ys = np.bincount(inverse, weights=trend_y) / np.bincount(inverse)
+    fitted_logcount = np.log2(2 ** means * 1e-6 * (lib_sizes + 1))
+    return 1 / np.interp(fitted_logcount, xs, ys) ** 4
+
+
+def fold_changes(ids, counts, meta):
+    """ The genes and their log2 fold-changes of every comparison, counts are the columns
+    of the libraries of meta. """
+    samples = meta['sample'].values
+    result = dict()
+    for test, ref in COMPARISONS:
+        test_columns, ref_columns = np.flatnonzero(samples == test), np.flatnonzero(samples == ref)
+        if len(test_columns) == 0 or len(ref_columns) == 0:
+            raise Exception('The batch has no library of {}, the RC needs the samples {}.'.format(
+                test if len(test_columns) == 0 else ref, ', '.join(sorted(set(sum(COMPARISONS, ()))))))
+        detected = (((counts[:, test_columns] >= MIN_COUNT).sum(axis=1) >= MIN_REPLICATES) &
+                    ((counts[:, ref_columns] >= MIN_COUNT).sum(axis=1) >= MIN_REPLICATES))
+        compared = counts[:, np.r_[test_columns, ref_columns]][detected]
+        kept = compared.sum(axis=1) >= MIN_TOTAL_COUNT
+        values, lib_sizes = log_cpm(compared[kept])
+        is_test = np.arange(values.shape[1]) < len(test_columns)
+        weights = voom_weights(values, lib_sizes, is_test)
+        # The coefficient of ~group fitted by weighted least squares
+        logfc = (np.sum(weights[:, is_test] * values[:, is_test], axis=1) / weights[:, is_test].sum(axis=1) -
+                 np.sum(weights[:, ~is_test] * values[:, ~is_test], axis=1) / weights[:, ~is_test].sum(axis=1))
+        result['{}/{}'.format(test, ref)] = (ids[detected][kept], logfc)
+    return result
+
+
+def read_fold_changes(count_fpath, meta_fpath):
+    meta = read_metadata(meta_fpath)
+    ids, counts = read_matrix(count_fpath, list(meta['library']))
+    return fold_changes(ids, counts, meta)
+
+
+class ReferenceFoldChanges(object):
+    """ The reference fold-changes, the fold-changes of a batch are aligned on them. """
+
+    def __init__(self, store):
+        self.genes = np.asarray(store.column('fc_value', 'gene'))
+        self.compares = np.asarray(store.column('fc_value', 'compare'))
+        self.values = np.asarray(store.column('fc_value', 'meanlogFC'), dtype=float)
+        self.positions = dict()
+        for i, key in enumerate(zip(self.compares.tolist(), self.genes.tolist())):
+            self.positions.setdefault(key, i)
+
+    def align(self, fcs):
+        """ The fold-changes of a batch at the positions of the reference, NaN if a gene is missing. """
+        aligned = np.full(len(self.values), np.nan)
+        for compare, (ids, logfc) in fcs.items():
+            positions = [self.positions.get((compare, gene), -1) for gene in ids.tolist()]
+            positions = np.asarray(positions, dtype=int)
+            found = positions >= 0
+            aligned[positions[found]] = logfc[found]
+        return aligned
+
+
+def correlation_sums(aligned, reference):
+    """ n, sum_x, sum_xx, sum_y, sum_yy and sum_xy of the genes of a batch with the reference. """
+    found = ~np.isnan(aligned)
+    x, y = aligned[found], reference[found]
+    return np.array([found.sum(), x.sum(), x.dot(x), y.sum(), y.dot(y), x.dot(y)])
+
+
+def correlations(sums):
+    """ The Pearson correlations and the numbers of genes of the rows of correlation_sums. """
+    n, sum_x, sum_xx, sum_y, sum_yy, sum_xy = np.atleast_2d(sums).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        return cov / np.sqrt(var_x * var_y), n.astype(int)
+
+
+def relative_correlations(aligned, reference):
+    """ The Pearson correlations of the rows (batches) of aligned with the reference, on the
+    genes of every row, and the numbers of genes. """
+    mask = ~np.isnan(aligned)
+    x = np.where(mask, aligned, 0)
+    weights = mask.astype(float)
+    return correlations(np.column_stack([
+        weights.sum(axis=1), x.sum(axis=1), (x * x).sum(axis=1),
+        weights.dot(reference), weights.dot(reference * reference), x.dot(reference)]))
+
+
+def logfc_cor_ref_test(aligned, reference):
+    """ The table of logfc_cor_ref_test.txt of a batch, in the order of the reference. """
+    import pandas as pd
+
+    cor, n = relative_correlations(aligned[None, :], reference.values)
+    found = ~np.isnan(aligned)
+    return pd.DataFrame({
+        'gene': reference.genes[found],
+        'compare': reference.compares[found],
+        'meanlogFC_test': np.round(aligned[found], 3),
+        'meanlogFC_ref': reference.values[found],
+        'cor': '%.3f' % cor[0],
+        'gene_num': n[0],
+    })
+
+
+def compute_rc(count_fpath, meta_fpath, store):
+    """ The table of logfc_cor_ref_test.txt of a batch, from the files of exp2qcdt.sh. """
+    reference = ReferenceFoldChanges(store)
+    return logfc_cor_ref_test(reference.align(read_fold_changes(count_fpath, meta_fpath)), reference)
+
+
+def write_logfc_cor_ref_test(df, result_dir):
+    """ Write performance_assessment/logfc_cor_ref_test.txt of a result directory, as exp2qcdt. """
+    output_dir = os.path.join(result_dir, 'performance_assessment')
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    fpath = os.path.join(output_dir, 'logfc_cor_ref_test.txt')
+    df.to_csv(fpath, sep='\t', index=False)
+    log.info('RC = {} (N = {}), written to {}'.format(df['cor'].iloc[0], df['gene_num'].iloc[0], fpath))
+    return fpath
+
+
+def rescore(batches, store, workers=1):
+    """ The RC of many batches against the reference of the store, batches is a DataFrame
+    with the batch, count and metadata columns. """
+    import pandas as pd
+
+    reference = ReferenceFoldChanges(store)
+    # Only the sums of a batch are kept, not its fold-changes
+    sums = np.empty((len(batches), 6))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        fcs = executor.map(read_fold_changes, batches['count'], batches['metadata'])
+        for i, (batch, fc) in enumerate(zip(batches['batch'], fcs)):
+            sums[i] = correlation_sums(reference.align(fc), reference.values)
+            log.debug('Read the fold-changes of {}'.format(batch))
+
+    cor, n = correlations(sums)
+    return pd.DataFrame({'batch': batches['batch'].values, 'RC': np.round(cor, 3), 'gene_num': n})
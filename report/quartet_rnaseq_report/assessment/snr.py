@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+""" The signal-to-noise ratio (SNR) of a batch, pca_with_snr.txt of exp2qcdt
+
+As output_snr_res of exp2qcdt: the genes detected in a sample (see expression.py) are
+kept, their log2 FPKM are z-scored across the libraries and the libraries are projected
+on the principal components (prcomp). The SNR is the mean distance between the libraries
+of different samples over the mean distance between the replicates of a sample, on PC1
+and PC2 weighted by their proportions of variance (calc_signoise_ratio), in dB.
+
+The principal components are computed with a randomized truncated SVD, only the first
+components are used, so pca_with_snr.txt has PC1 to PC3 instead of all of them. The
+signs of the components of prcomp depend on the SVD of LAPACK, they have no convention
+to match. Here the largest score of a component is positive, so PC1 and PC2 may have
+the opposite signs of exp2qcdt; the SNR and the ratios don't depend on the signs.
+"""
+
+from __future__ import print_function
+import logging
+import os
+
+import numpy as np
+
+from quartet_rnaseq_report.assessment.expression import (check_tables, read_detected, read_log_fpkm,
+                                                        read_metadata, select_genes, zscore)
+
+log = logging.getLogger(__name__)
+
+COMPONENTS = 3
+OVERSAMPLES = 10
+POWER_ITERATIONS = 8
+SEED = 20220101
+# summary.prcomp rounds the proportions of variance
+PROPORTION_DIGITS = 5
+
+
+def randomized_svd(matrix, components, oversamples=OVERSAMPLES, iterations=POWER_ITERATIONS, seed=SEED):
+    """ The first left singular vectors and singular values of a matrix (Halko et al.), an
+    exact SVD if the matrix is smaller than the sketch. """
+    size = components + oversamples
+    if size >= min(matrix.shape):
+        u, s, _ = np.linalg.svd(matrix, full_matrices=False)
+        return u[:, :components], s[:components]
+
+    rng = np.random.RandomState(seed)
+    q, _ = np.linalg.qr(matrix.dot(rng.normal(size=(matrix.shape[1], size))))
+    for _ in range(iterations):
+        q, _ = np.linalg.qr(matrix.T.dot(q))
+        q, _ = np.linalg.qr(matrix.dot(q))
+    u, s, _ = np.linalg.svd(q.T.dot(matrix), full_matrices=False)
+    return q.dot(u)[:, :components], s[:components]
+
+
+def principal_components(matrix, components=COMPONENTS, randomized=True):
+    """ The scores of the rows (observations) of a matrix on the first principal components
+    and the proportions of variance of the components, as prcomp(matrix, scale = F). """
+    centered = matrix - matrix.mean(axis=0)
+    components = min(components, *centered.shape)
+    if randomized:
+        u, s = randomized_svd(centered, components)
+    else:
+        u, s, _ = np.linalg.svd(centered, full_matrices=False)
+        u, s = u[:, :components], s[:components]
+    # A deterministic sign, the largest score is positive
+    signs = np.sign(u[np.abs(u).argmax(axis=0), np.arange(components)])
+    u *= np.where(signs == 0, 1, signs)
+    proportions = s ** 2 / np.sum(centered ** 2)
+    return u * s, np.round(proportions, PROPORTION_DIGITS)
+
+
+def signal_to_noise(scores, proportions, groups):
+    """ The SNR (dB) of calc_signoise_ratio, groups are the samples of the libraries. """
+    groups = np.asarray(groups)
+    dist = (proportions[0] * (scores[:, 0, None] - scores[None, :, 0]) ** 2 +
+            proportions[1] * (scores[:, 1, None] - scores[None, :, 1]) ** 2)
+    same_group = groups[:, None] == groups[None, :]
+    intra = same_group & ~np.eye(len(groups), dtype=bool)
+    if not intra.any() or same_group.all():
+        raise Exception('The SNR needs replicates of at least two samples.')
+    return 10 * np.log10(dist[~same_group].mean() / dist[intra].mean())
+
+
+def pca_with_snr(values, meta, components=COMPONENTS, randomized=True):
+    """ The table of pca_with_snr.txt, values are the z-scores of the genes (rows) in the
+    libraries of meta (columns). """
+    import pandas as pd
+
+    # The ratios of PC1 to PC3 are in the table
+    scores, proportions = principal_components(values.T, max(components, 3), randomized)
+    snr = signal_to_noise(scores, proportions, meta['sample'].values)
+
+    scores = scores[:, :components]
+    pcs = pd.DataFrame(scores, columns=['PC%d' % (i + 1) for i in range(scores.shape[1])])
+    pcs['PC1'] = pcs['PC1'].round(3)
+    pcs['PC2'] = pcs['PC2'].round(3)
+    pcs.insert(0, 'library', meta['library'].values)
+    # merge(pcs, dt_meta, by = "library") sorts by library
+    df = pcs.merge(meta, on='library').sort_values('library', kind='stable').reset_index(drop=True)
+    for i in range(3):
+        df['PC%d_ratio' % (i + 1)] = round(proportions[i] * 100, 2) if i < len(proportions) else np.nan
+    df['SNR'] = '%.3f' % snr
+    df['gene_num'] = values.shape[0]
+    return df
+
+
+def compute_snr(fpkm_fpath, count_fpath, meta_fpath, components=COMPONENTS):
+    """ The table of pca_with_snr.txt of a batch, from the files of exp2qcdt.sh. """
+    meta = read_metadata(meta_fpath)
+    check_tables(fpkm_fpath, count_fpath, meta)
+
+    samples = list(meta['sample'].unique())
+    count_ids, detected = read_detected(count_fpath, meta, samples)
+    genes = count_ids[detected.any(axis=1)]
+    fpkm_ids, log_fpkm = read_log_fpkm(fpkm_fpath, list(meta['library']))
+    values = zscore(select_genes(fpkm_ids, log_fpkm, genes))
+    log.info('{} of {} genes are detected in a sample'.format(len(genes), len(count_ids)))
+    return pca_with_snr(values, meta, components)
+
+
+def write_pca_with_snr(df, result_dir):
+    """ Write performance_assessment/pca_with_snr.txt of a result directory, as exp2qcdt. """
+    output_dir = os.path.join(result_dir, 'performance_assessment')
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    fpath = os.path.join(output_dir, 'pca_with_snr.txt')
+    df.to_csv(fpath, sep='\t', index=False)
+    log.info('SNR = {} (N = {}), written to {}'.format(df['SNR'].iloc[0], df['gene_num'].iloc[0], fpath))
+    return fpath
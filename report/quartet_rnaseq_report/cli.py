@@ -14,3 +14,25 @@ disable_plugin = click.option(
     'disable_plugin',
     is_flag=True,
     help="Disable the quartet rnaseq report MultiQC plugin on this run")
+
+# Sets config.kwargs['module_workers'], the modules of the plugin are run in parallel if it's more than 1
+module_workers = click.option(
+    '--module-workers',
+    'module_workers',
+    type=int,
+    default=None,
+    help="How many processes run the quartet rnaseq report modules, all CPUs by default, 1 to disable it")
+
+# Sets config.kwargs['no_parse_cache'] to True if specified, the result files are parsed again
+no_parse_cache = click.option(
+    '--no-parse-cache',
+    'no_parse_cache',
+    is_flag=True,
+    help="Don't use the cache of the parsed FastQC reports in ~/.cache/quartet_rnaseq_report")
+
+# Sets config.kwargs['split_output'] to True if specified, the report loads its assets and plot data from files
+split_output = click.option(
+    '--split-output',
+    'split_output',
+    is_flag=True,
+    help="Write the assets and the plot data of the report to files next to it, for a report server")
@@ -6,8 +6,9 @@ using the setuptools plugin hooks.
 """
 
 from __future__ import print_function
-from pkg_resources import get_distribution
+from importlib.metadata import version
 import logging
+import os
 
 from multiqc.utils import config
 
@@ -15,7 +16,7 @@ from multiqc.utils import config
 log = logging.getLogger('multiqc')
 
 # Save this plugin's version number (defined in setup.py) to the MultiQC config
-config.quartet_rnaseq_report_version = get_distribution("quartet_rnaseq_report").version
+config.quartet_rnaseq_report_version = version("quartet_rnaseq_report")
 
 
 # Add default config options for the things that are used in MultiQC_NGI
@@ -48,6 +49,14 @@ def quartet_rnaseq_report_execution_start():
                 }
             })
 
+    if 'rnaseq_data_generation_information/subsample' not in config.sp:
+        config.update_dict(
+            config.sp, {
+                'rnaseq_data_generation_information/subsample': {
+                    'fn': 'subsample.json'
+                }
+            })
+
     # Module-rnaseq_performance_assessment
     if 'rnaseq_performance_assessment/quality_score' not in config.sp:
         config.update_dict(
@@ -149,6 +158,15 @@ def quartet_rnaseq_report_execution_start():
                 }
             })
 
+    # Module-rnaseq_pipeline_profile
+    if 'rnaseq_pipeline_profile/profile' not in config.sp:
+        config.update_dict(
+            config.sp, {
+                'rnaseq_pipeline_profile/profile': {
+                    'fn': 'pipeline_profile.json'
+                }
+            })
+
     # # Some additional filename cleaning
     # config.fn_clean_exts.extend([
     #     '.my_tool_extension',
@@ -165,8 +183,59 @@ def quartet_rnaseq_report_execution_start():
 
     config.module_order = [
         'rnaseq_data_generation_information', 'rnaseq_performance_assessment',
-        'rnaseq_raw_qc', 'rnaseq_post_alignment_qc', 'rnaseq_supplementary'
+        'rnaseq_raw_qc', 'rnaseq_post_alignment_qc', 'rnaseq_pipeline_profile',
+        'rnaseq_supplementary'
     ]
     config.exclude_modules = ['fastqc', 'fastq_screen', 'qualimap']
 
     config.log_filesize_limit = 2000000000
+
+    # The series of a line graph with more points are downsampled, 0 keeps all points
+    if getattr(config, 'linegraph_max_points', None) is None:
+        config.linegraph_max_points = 500
+
+    # The encoding of the plotly figures (json, typed or gzip, see modules/plotly.py) and
+    # the significant digits of their numbers, gzip needs a recent browser
+    if getattr(config, 'plotly_payload', None) is None:
+        config.plotly_payload = 'typed'
+    if getattr(config, 'plotly_significant_digits', None) is None:
+        config.plotly_significant_digits = 6
+
+    # The report is one self-contained HTML file, with --split-output the assets and the
+    # data of the plotly plots are written to files next to it (see split_output.py)
+    if config.kwargs.get('split_output'):
+        config.split_output = True
+    if getattr(config, 'split_output', None) is None:
+        config.split_output = False
+    if getattr(config, 'split_output_dir_name', None) is None:
+        config.split_output_dir_name = 'quartet_report_files'
+    if config.split_output:
+        from quartet_rnaseq_report.split_output import make_tmp_dir
+        make_tmp_dir()
+
+
+def quartet_rnaseq_report_before_modules():
+    """ Run the modules of the plugin in parallel, the files have been found at this point.
+    """
+
+    if config.kwargs.get('disable_plugin', True):
+        return None
+
+    from quartet_rnaseq_report.parallel import run_modules_in_parallel
+
+    workers = config.kwargs.get('module_workers') or os.cpu_count() or 1
+    run_modules_in_parallel(workers)
+
+
+def quartet_rnaseq_report_execution_finish():
+    """ Copy the files of a split output report next to it, the report has been written
+    at this point.
+    """
+
+    if config.kwargs.get('disable_plugin', True) or not getattr(config, 'split_output', False):
+        return None
+
+    from quartet_rnaseq_report.split_output import copy_split_output
+    from quartet_rnaseq_report.templates import default
+
+    copy_split_output(default.template_dir)
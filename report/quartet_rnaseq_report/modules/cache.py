@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+""" An on-disk cache of the parsed result files
+
+A parsed file is saved in a pickle file which is keyed by the content of the file (its
+size, its modification time and the sha1 of the central directory of a zip, or of the
+whole file otherwise) and the version of the parser, not by its path. A changed file, or
+a changed parser, is parsed again, and the same results in another directory are not.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import tempfile
+
+from multiqc import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'quartet_rnaseq_report')
+# The end of central directory record of a zip, and its maximum distance to the end of the file
+EOCD_SIGNATURE = b'PK\x05\x06'
+EOCD_SEARCH = 22 + 65535
+
+
+def zip_central_directory(f, size):
+    """ The central directory of a zip file, it has the names, the sizes and the CRC32 of all
+    members. Returns None if the file is not a zip file. """
+    f.seek(max(0, size - EOCD_SEARCH))
+    tail = f.read()
+    end = tail.rfind(EOCD_SIGNATURE)
+    if end < 0 or len(tail) - end < 22:
+        return None
+    cd_size, cd_offset = struct.unpack('<II', tail[end + 12:end + 20])
+    if cd_offset + cd_size > size:
+        return None
+    f.seek(cd_offset)
+    return f.read(cd_size)
+
+
+def content_digest(fpath):
+    """ The sha1 of the central directory of a zip file, or of the whole file. """
+    sha1 = hashlib.sha1()
+    with open(fpath, 'rb') as f:
+        central_directory = zip_central_directory(f, os.fstat(f.fileno()).st_size)
+        if central_directory is not None:
+            sha1.update(central_directory)
+        else:
+            f.seek(0)
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+    return sha1.hexdigest()
+
+
+class ParseCache:
+    def __init__(self, name, version, cache_dir=None):
+        self.version = version
+        self.cache_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, name)
+        self.enabled = not getattr(config, 'kwargs', {}).get('no_parse_cache', False)
+
+    def key(self, fpath):
+        stat = os.stat(fpath)
+        return (stat.st_size, stat.st_mtime_ns, content_digest(fpath), self.version)
+
+    def entry_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.pickle')
+
+    def get(self, fpath):
+        """Returns the parsed result of the file, or None if it isn't cached or the file is changed."""
+        if not self.enabled:
+            return None
+        try:
+            key = self.key(fpath)
+            with open(self.entry_path(key), 'rb') as f:
+                cached_key, value = pickle.load(f)
+            return value if cached_key == key else None
+        except Exception:
+            return None
+
+    def put(self, fpath, value):
+        if not self.enabled:
+            return
+        try:
+            key = self.key(fpath)
+            entry = self.entry_path(key)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            # Write to a temporary file first, the reports rendered at the same time may share an entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry)
+        except OSError as e:
+            logger.debug('Cannot cache {}: {}'.format(fpath, e))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" Downsample the series of the line graphs
+
+A histogram of a deep sample has thousands of points, and every point of every sample is
+written into the report. A series with more points than config.linegraph_max_points is
+downsampled with Largest-Triangle-Three-Buckets (LTTB), which keeps the shape of the line.
+The peak of a series and the x values given by the module (e.g. the median, the coverage
+thresholds) are always kept.
+"""
+
+import logging
+
+import numpy as np
+
+from multiqc import config
+
+logger = logging.getLogger(__name__)
+
+
+def lttb(x, y, n_out):
+    """ The indices of n_out points of the series which keep its shape, the first and the
+    last points are always kept. x must be sorted. """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # The points between the first and the last one are split into n_out - 2 buckets,
+    # the last point is a bucket of its own
+    edges = (np.floor(np.arange(n_out - 1) * (n - 2) / float(n_out - 2)) + 1).astype(np.int64)
+    edges[-1] = n - 1
+    bounds = np.append(edges, n)
+    sizes = np.diff(bounds)
+    # The third point of a triangle is the mean of the next bucket
+    avg_x = (np.add.reduceat(x, edges) / sizes).tolist()
+    avg_y = (np.add.reduceat(y, edges) / sizes).tolist()
+
+    xs, ys, edges = x.tolist(), y.tolist(), edges.tolist()
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay, nx, ny = xs[a], ys[a], avg_x[i + 1], avg_y[i + 1]
+        if end - start > 32:
+            area = np.abs((ax - nx) * (y[start:end] - ay) - (ax - x[start:end]) * (ny - ay))
+            a = start + int(np.argmax(area))
+        else:
+            # A loop is faster than NumPy for a small bucket
+            best = -1.0
+            for j in range(start, end):
+                area = abs((ax - nx) * (ys[j] - ay) - (ax - xs[j]) * (ny - ay))
+                if area > best:
+                    a, best = j, area
+        selected.append(a)
+    selected.append(n - 1)
+    return np.array(selected, dtype=np.int64)
+
+
+def downsample_series(series, max_points, keep_x=()):
+    """ A {x: y} series with at most max_points points (and the kept points). """
+    if max_points is None or max_points <= 0 or len(series) <= max_points:
+        return series
+
+    keys = sorted(series)
+    x = np.array(keys, dtype=float)
+    y = np.array([series[key] for key in keys], dtype=float)
+
+    # The peak and the nearest points to the x values to keep
+    keep = set([int(np.nanargmax(y))])
+    for value in keep_x:
+        if value is None:
+            continue
+        i = min(int(np.searchsorted(x, value)), len(x) - 1)
+        if i > 0 and abs(x[i - 1] - value) <= abs(x[i] - value):
+            i -= 1
+        keep.add(i)
+
+    selected = set(lttb(x, y, max(max_points - len(keep), 3)).tolist()) | keep
+    return dict((keys[i], series[keys[i]]) for i in sorted(selected))
+
+
+def downsample_plot_data(data, keep_x=None):
+    """ Downsample the series of every sample of a line graph. keep_x is a list of the x
+    values to keep in all series, or a dict of the lists of every sample. """
+    max_points = getattr(config, 'linegraph_max_points', None)
+    result = dict()
+    for s_name, series in data.items():
+        keep = keep_x.get(s_name, ()) if isinstance(keep_x, dict) else (keep_x or ())
+        result[s_name] = downsample_series(series, max_points, keep)
+    before, after = sum(len(s) for s in data.values()), sum(len(s) for s in result.values())
+    if after < before:
+        logger.debug('Downsampled the line graph from {} to {} points.'.format(before, after))
+    return result
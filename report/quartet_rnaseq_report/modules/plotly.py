@@ -1,13 +1,144 @@
 #!/usr/bin/env python
-""" MultiQC functions to use plotly library """
+""" MultiQC functions to use plotly library
+
+The figure of a plot is written into the report as a payload, the encoding is set with
+config.plotly_payload:
+
+* 'json': the JSON of plotly.io.to_json
+* 'typed' (default): the numeric arrays of the traces are base64 typed arrays ({'dtype',
+  'bdata'}, the spec of plotly.js), rounded to config.plotly_significant_digits
+* 'gzip': the 'typed' JSON compressed with gzip, in base64. It's decompressed with the
+  DecompressionStream of the browser (not in Firefox < 113 or Safari < 16.4), so it's
+  only used when it's asked for
+
+With config.split_output the payload is written to a file instead (see split_output.py),
+and a 'typed' payload is written compressed, as a .json.gz file.
+The payload is decoded by loadPlotlyFigure (assets/js/quartet_plotly.js) before the
+figure is given to Plotly.newPlot, when the plot scrolls into view.
+"""
 
-import logging
 import base64
-from plotly.io import to_json
-from multiqc.utils import report
+import gzip
+import logging
+import numbers
+
+import numpy as np
+
+from multiqc.utils import config, report
+
+from quartet_rnaseq_report.split_output import write_section_data
 
 logger = logging.getLogger(__name__)
 
+PAYLOAD_ENCODINGS = ('json', 'typed', 'gzip')
+
+# Shorter arrays are left as they are, the spec would be longer than the numbers
+TYPED_ARRAY_MIN_SIZE = 8
+
+# The significant digits which survive a float32
+FLOAT32_DIGITS = 6
+
+
+def typed_array(values, digits=None):
+    """ The typed array spec of plotly.js of a numeric array (1D or 2D), or None. digits
+    are the significant digits kept by the report, a float32 is enough up to 6. """
+    try:
+        array = np.asarray(values)
+    except ValueError:
+        # A ragged list
+        return None
+    if array.dtype.kind not in 'iuf' or array.ndim not in (1, 2) or array.size < TYPED_ARRAY_MIN_SIZE:
+        return None
+
+    spec = dict()
+    if array.dtype.kind in 'iu' and array.min() >= -2 ** 31 and array.max() < 2 ** 31:
+        array = array.astype('<i4')
+        spec['dtype'] = 'i4'
+    elif digits and digits <= FLOAT32_DIGITS:
+        array = array.astype('<f4')
+        spec['dtype'] = 'f4'
+        spec['digits'] = digits
+    else:
+        array = array.astype('<f8')
+        spec['dtype'] = 'f8'
+        if digits:
+            spec['digits'] = digits
+    spec['bdata'] = base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')
+    if array.ndim == 2:
+        spec['shape'] = '{}, {}'.format(*array.shape)
+    return spec
+
+
+def from_typed_array(spec):
+    """ The array of a typed array spec, plotly >= 6 gives the numpy arrays of a figure as specs. """
+    array = np.frombuffer(base64.b64decode(spec['bdata']), dtype=np.dtype(spec['dtype']).newbyteorder('<'))
+    if spec.get('shape'):
+        array = array.reshape([int(n) for n in str(spec['shape']).split(',')])
+    return array
+
+
+def encode_arrays(obj, digits=None):
+    """ A copy of the dicts and lists of a trace with its numeric arrays as typed arrays. """
+    if isinstance(obj, dict):
+        if isinstance(obj.get('bdata'), (str, bytes)) and 'dtype' in obj:
+            spec = typed_array(from_typed_array(obj), digits)
+            return obj if spec is None else spec
+        return dict((key, encode_arrays(value, digits)) for key, value in obj.items())
+    if isinstance(obj, np.ndarray):
+        spec = typed_array(obj, digits)
+        return obj if spec is None else spec
+    if isinstance(obj, (list, tuple)) and len(obj) > 0:
+        first = obj[0]
+        if isinstance(first, (numbers.Number, list, tuple, np.ndarray)) and len(obj) >= TYPED_ARRAY_MIN_SIZE:
+            spec = typed_array(obj, digits)
+            if spec is not None:
+                return spec
+        if isinstance(first, dict):
+            return [encode_arrays(value, digits) for value in obj]
+    return obj
+
+
+def dumps(obj):
+    """ The JSON of a figure dict, with orjson if it's installed. """
+    try:
+        from plotly.io.json import to_json_plotly
+    except ImportError:
+        # plotly < 5
+        import json
+        from plotly.utils import PlotlyJSONEncoder
+        return json.dumps(obj, cls=PlotlyJSONEncoder)
+
+    try:
+        import orjson  # noqa: F401
+        engine = 'orjson'
+    except ImportError:
+        engine = 'json'
+    return to_json_plotly(obj, engine=engine)
+
+
+def encode_figure(fig, encoding='typed', digits=None, inline=True):
+    """ The payload of a figure and its data-encoding attribute. A gzip payload is in
+    base64 to be inlined in the report, or bytes for a file. """
+    if encoding not in PAYLOAD_ENCODINGS:
+        raise Exception('Unknown plotly payload encoding "{}", use one of {}.'.format(
+            encoding, ', '.join(PAYLOAD_ENCODINGS)))
+
+    if encoding == 'json':
+        from plotly.io import to_json
+        return to_json(fig), 'json'
+
+    fig_dict = fig.to_plotly_json()
+    fig_dict['data'] = [encode_arrays(trace, digits) for trace in fig_dict['data']]
+    json_str = dumps(fig_dict)
+    if encoding == 'typed':
+        return json_str, 'json'
+
+    # mtime=0 keeps the report the same for the same figure
+    compressed = gzip.compress(json_str.encode('utf-8'), mtime=0)
+    if not inline:
+        return compressed, 'gzip'
+    return base64.b64encode(compressed).decode('ascii'), 'gzip'
+
 
 def fig_to_json_html(fig, pconfig):
     if pconfig.get('auto_margin'):
@@ -22,9 +153,26 @@ def fig_to_json_html(fig, pconfig):
     if pconfig.get('title'):
         fig.update_layout(title_text=pconfig['title'], title_x=0.5)
 
-    json_str = to_json(fig)
-    html = '<script id="{id}" type="text/json">{json}</script>'.format(
-        id=pconfig['data_id'], json=json_str)
+    split_output = getattr(config, 'split_output', False)
+    encoding = getattr(config, 'plotly_payload', 'typed')
+    if split_output and encoding == 'typed':
+        # The section files are fetched by the browser, they are sent compressed
+        encoding = 'gzip'
+    payload, encoding = encode_figure(fig,
+                                      encoding,
+                                      getattr(config, 'plotly_significant_digits', None),
+                                      inline=not split_output)
+    if split_output:
+        # The payload is fetched from its file when the plot is rendered
+        src = write_section_data(payload, '.json.gz' if encoding == 'gzip' else '.json')
+        return '<script id="{id}" type="text/plain" data-encoding="{encoding}" data-src="{src}"></script>'.format(
+            id=pconfig['data_id'], encoding=encoding, src=src)
+
+    html = '<script id="{id}" type="{type}" data-encoding="{encoding}">{payload}</script>'.format(
+        id=pconfig['data_id'],
+        type='text/json' if encoding == 'json' else 'text/plain',
+        encoding=encoding,
+        payload=payload)
     return html
 
 
@@ -32,31 +180,14 @@ def plot(fig, pconfig):
     data_html = fig_to_json_html(fig, pconfig)
     html = '''
   <div class="hc-plot-wrapper">
-    <div id="{id}" class="hc-plot not_rendered">
+    <div id="{id}" class="hc-plot plotly-plot not_rendered">
       <small>loading..</small>
     </div>
   </div>
   {data_html}
   <script type="text/javascript">
-    var figure = JSON.parse($("#{data_id}").html());
-    figure.layout.autosize = true
-    Plotly.newPlot("{id}", figure.data, figure.layout);
-
-    // When plotly is working, hide something
-    $("#{id}").removeClass("not_rendered");
-    $("#{id} small").hide();
-
-    // update the layout to expand to the available size
-    // when the window is resized
-    window.onresize = function() {{
-      $(".js-plotly-plot").each(function () {{
-        const id = $(this).attr('id');
-        Plotly.relayout(id, {{
-          "xaxis.autorange": true,
-          "yaxis.autorange": true
-        }});
-      }})
-    }};
+    // Rendered when it scrolls into view, see assets/js/quartet_plotly.js
+    queuePlotlyPlot("{id}", "{data_id}");
   </script>
   '''.format(id=pconfig['id'], data_id=pconfig['data_id'], data_html=data_html)
     return html
@@ -3,15 +3,11 @@
 
 from __future__ import print_function
 from collections import OrderedDict
+import json
 import logging
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.figure_factory as ff
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
-from quartet_rnaseq_report.modules.plotly import plot as plotly_plot
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
@@ -33,6 +29,16 @@ class MultiqcModule(BaseMultiqcModule):
             info=' is an report module to show the basic information about the sequencing data.'
         )
 
+        # The workflow was run on a subsample of reads (rseqc.py workflow --subsample)
+        subsamples = []
+        for f in self.find_log_files(
+                'rnaseq_data_generation_information/subsample'):
+            subsamples.append(json.loads(f['f']))
+            self.add_data_source(f)
+
+        if len(subsamples) != 0:
+            self.plot_subsample_warning('preliminary_report', subsamples)
+
         information = []
         # Find and load any input files for data_generation_information
         for f in self.find_log_files(
@@ -46,6 +52,27 @@ class MultiqcModule(BaseMultiqcModule):
                 'No file matched: data_generation_information - general-info.json'
             )
 
+    def plot_subsample_warning(self, id, subsamples):
+        rows = []
+        for subsample in sorted(subsamples, key=lambda x: x.get('sample', '')):
+            rows.append(
+                "        <li>{}: {:,} of {:,} read pairs ({:.2%}), seed {}</li>".format(
+                    subsample.get('sample', ''), subsample['pairs'],
+                    subsample['total_pairs'],
+                    subsample['pairs'] / max(subsample['total_pairs'], 1),
+                    subsample['seed']))
+
+        html = '''
+    <div class="alert alert-warning">
+      <strong>Preliminary report.</strong> The results are computed from read pairs randomly drawn from the
+      sequencing data, they are only meant for an early go/no-go decision and are not comparable with a full report.
+      <ul>
+{rows}
+      </ul>
+    </div>'''.format(rows='\n'.join(rows))
+
+        self.add_section(name='', anchor=id, description='', plot=html)
+
     def plot_information(self,
                          id,
                          data,
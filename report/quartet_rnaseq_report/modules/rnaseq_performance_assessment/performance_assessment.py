@@ -5,15 +5,13 @@ from __future__ import print_function
 from collections import OrderedDict
 import logging, os
 import random
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.figure_factory as ff
 
 from multiqc.utils import config, report
 from multiqc.plots import scatter, table, heatmap
 from multiqc.modules.base_module import BaseMultiqcModule
 from quartet_rnaseq_report.modules.plotly import plot as plotly_plot
+from .ranking import RankingIndex
+from .tables import read_table
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
@@ -42,26 +40,14 @@ class MultiqcModule(BaseMultiqcModule):
             }
         ########################find log files#################################
         ### Quality Score Table
-        quality_score = []
-        for f in self.find_log_files(
-                'rnaseq_performance_assessment/quality_score'):
-            quality_score = f['f'].splitlines()
-
-        if len(quality_score) != 0:
-            ## Now add each section in order
-            dt_quality_score = self.list2df(quality_score)
-            
-        else:
+        dt_quality_score = self.read_table('quality_score')
+        if dt_quality_score is None:
             log.debug("No file matched: quality_score - quality_score.txt")
 
         # Summary Table1: ALL QC metrics summary
-        qc_metrics_summary = []
-        for f in self.find_log_files('rnaseq_performance_assessment/qc_metrics_summary'):
-            qc_metrics_summary = f['f'].splitlines()
-            
-        if len(qc_metrics_summary) != 0:
+        qc_metrics_summary_df = self.read_table('qc_metrics_summary')
+        if qc_metrics_summary_df is not None and dt_quality_score is not None:
             ## Now add each section in order
-            qc_metrics_summary_df = self.list2df(qc_metrics_summary)
             table_qc_metrics_dic = qc_metrics_summary_df.set_index('qc_metrics').T.to_dict()
             self.plot_qc_metrics_table(id = 'qc_metrics_summary_table',
                                        qc_metrics_summary_list = table_qc_metrics_dic,
@@ -72,41 +58,32 @@ class MultiqcModule(BaseMultiqcModule):
             )
         
         # Plot2: SNR and RC scatter plot
-        self.plot_snr_rc_point('plot_snr_rc_point', dt_quality_score)
+        if dt_quality_score is not None:
+            self.plot_snr_rc_point('plot_snr_rc_point', dt_quality_score)
 
         # Plot3: SNR
-        list_snr = []
-        for f in self.find_log_files('rnaseq_performance_assessment/pca_with_snr'):
-            list_snr = f['f'].splitlines()
-
-        if len(list_snr) != 0:
+        df_snr = self.read_table('pca_with_snr')
+        if df_snr is not None:
             ## Now add each section in order
-            df_snr = self.list2df(list_snr)
             self.plot_snr_pca_point('snr_pca_plot', df_snr)
         else:
             log.debug("No file matched: snr_pca_point - studydesign_snr.txt")
         
         # Plot4: RC correlation
-        list_rc = []
-        for f in self.find_log_files('rnaseq_performance_assessment/logfc_cor_ref_test'):
-            list_rc = f['f'].splitlines()
-            
-        if len(list_rc) != 0:
+        df_rc = self.read_table('logfc_cor_ref_test')
+        if df_rc is not None:
             ## Now add each section in order
-            df_rc = self.list2df(list_rc)
             self.plot_rc_cor_point('rc_cor_plot', df_rc)
         else:
             log.debug(
                 "No file matched: performance_of_relative - logfc_cor_ref_test.txt"
             )
 
-    def list2df(self, data):
-        """Convert string list to dataframe"""
-        cols = data[0].split('\t')
-        array = []
-        for line in data[1:]:
-            array.append(line.split('\t'))
-        df = pd.DataFrame(np.array(array), columns=cols)
+    def read_table(self, name):
+        """The DataFrame of the last file of a table (see tables.py), or None"""
+        df = None
+        for f in self.find_log_files('rnaseq_performance_assessment/' + name, filecontents=False):
+            df = read_table(os.path.join(f['root'], f['fn']), name)
         return df
 
     #######################add section#################################
@@ -116,61 +93,14 @@ class MultiqcModule(BaseMultiqcModule):
                               qc_metrics_summary_list,
                               dt_quality_score):
         
-        # heatmap
-        # progress and arrow
-        total_len = dt_quality_score.shape[0]
-        len_bad = len(dt_quality_score[dt_quality_score["performance"]=='Bad'])
-        len_fair = len(dt_quality_score[dt_quality_score["performance"]=='Fair'])
-        len_good = len(dt_quality_score[dt_quality_score["performance"]=='Good'])
-        len_great = len(dt_quality_score[dt_quality_score["performance"]=='Great'])
-        query_rank = total_len + 1 - int(dt_quality_score.loc[dt_quality_score['batch'] == 'QC_test', 'rank'].iloc[0])
-        bad = "%.2f%s" % (len_bad/total_len * 100, '%')
-        fair = "%.2f%s" % (len_fair/total_len * 100, '%')
-        good = "%.2f%s" % (len_good/total_len * 100, '%')
-        great = "%.2f%s" % (len_great/total_len * 100, '%')
-        if query_rank == 1:
-            queried = "%.2f%s" % (0, '%')
-        elif query_rank == total_len + 1:
-            queried = "%.2f%s" % (200, '%')
-        else:
-            queried = "%.2f%s" % (int(query_rank)/total_len *200, '%')
-        
-        # ticks number
-        snr = dt_quality_score.loc[dt_quality_score['batch'] == 'QC_test', 'scaled_score'].iloc[0]
-        Q0 = "%.1f" % float(dt_quality_score.loc[dt_quality_score['performance'] == 'Bad', 'scaled_score'].iloc[len_bad -1])
-        Q1 = "%.1f" % float(dt_quality_score.loc[dt_quality_score['performance'] == 'Bad', 'scaled_score'].iloc[0])
-        Q2 = "%.1f" % float(dt_quality_score.loc[dt_quality_score['performance'] == 'Fair', 'scaled_score'].iloc[0])
-        Q3 = "%.1f" % float(dt_quality_score.loc[dt_quality_score['performance'] == 'Good', 'scaled_score'].iloc[0])
-        Q4 = "%.1f" % float(dt_quality_score.loc[dt_quality_score['performance'] == 'Great', 'scaled_score'].iloc[0])
-        
-        # Position of ticks
-        tick_Q1 = "%.2f%s" % (len_bad/total_len * 100, '%')
-        tick_Q2 = "%.2f%s" % ((len_bad + len_fair)/total_len * 100, '%')
-        tick_Q3 = "%.2f%s" % ((len_bad + len_fair +  len_good)/total_len * 100, '%')
-        
-        metrics_summary_html = """
-        <!-- Arrow -->
-        <div class="arrow" style="width: {queried}; margin-top:10px; height: 35px;">
-        <svg class="lower-tangle" transform="translate(0, 18)"></svg>
-        <span class="lower-label" style="margin-bottom: 25px;"><b> {snr} </b></span>
-        </div>
-        
-        <!-- Progress bar -->
-        <div class="progress">
-          <div class="progress-bar progress-bar-bad" style="width: {bad}" data-toggle="tooltip" title="" data-original-title="">Bad</div>
-          <div class="progress-bar progress-bar-fair" style="width: {fair}" data-toggle="tooltip" title="" data-original-title="">Fair</div>
-          <div class="progress-bar progress-bar-good" style="width: {good}" data-toggle="tooltip" title="" data-original-title="">Good</div>
-          <div class="progress-bar progress-bar-great" style="width: {great}" data-toggle="tooltip" title="" data-original-title="">Great</div>
-        </div>
-        
-        <!-- Scale interval -->
-        <span style="float:left; left:0%; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q0}</span>
-        <span style="float:left; left:{tick_Q1}; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q1}</span>
-        <span style="float:left; left:{tick_Q2}; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q2}</span>
-        <span style="float:left; left:{tick_Q3}; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q3}</span>
-        <span style="float:left; left:99%; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q4}</span>
-        <br>
-        """.format(bad=bad, fair=fair, good=good, great=great, queried=queried, snr=snr, tick_Q1=tick_Q1, tick_Q2=tick_Q2, tick_Q3=tick_Q3, Q0=Q0, Q1=Q1, Q2=Q2, Q3=Q3, Q4=Q4)
+        # progress and arrow of every query batch, ranked against the historical batches
+        index = RankingIndex.from_quality_score(dt_quality_score)
+        queries = dt_quality_score[dt_quality_score['group'] == 'Query']
+        metrics_summary_html = ''
+        for batch, total_score, scaled_score in zip(queries['batch'], queries['total_score'], queries['scaled_score']):
+            if len(queries) > 1:
+                metrics_summary_html += '<h4>{}</h4>'.format(batch)
+            metrics_summary_html += self.performance_bar_html(index, total_score, scaled_score)
 
         # table
         headers = OrderedDict()
@@ -224,6 +154,61 @@ class MultiqcModule(BaseMultiqcModule):
             plot = metrics_summary_html + '\n' +  metrics_table_html
             )
 
+    def performance_bar_html(self, index, total_score, scaled_score):
+        """The arrow of a query batch over the progress bar of the categories"""
+        placed = index.place(total_score, scaled_score)
+        total_len = index.size
+        len_bad, len_fair, len_good, len_great = [index.counts[c] for c in ['Bad', 'Fair', 'Good', 'Great']]
+        query_rank = total_len + 1 - placed['rank']
+        bad = "%.2f%s" % (len_bad/total_len * 100, '%')
+        fair = "%.2f%s" % (len_fair/total_len * 100, '%')
+        good = "%.2f%s" % (len_good/total_len * 100, '%')
+        great = "%.2f%s" % (len_great/total_len * 100, '%')
+        if query_rank == 1:
+            queried = "%.2f%s" % (0, '%')
+        elif query_rank == total_len + 1:
+            queried = "%.2f%s" % (200, '%')
+        else:
+            queried = "%.2f%s" % (int(query_rank)/total_len *200, '%')
+        
+        # ticks number
+        tick = lambda score: "%.1f" % score if score is not None else ''
+        snr = "%g" % scaled_score
+        Q0 = tick(placed['last'].get('Bad'))
+        Q1 = tick(placed['first'].get('Bad'))
+        Q2 = tick(placed['first'].get('Fair'))
+        Q3 = tick(placed['first'].get('Good'))
+        Q4 = tick(placed['first'].get('Great'))
+        
+        # Position of ticks
+        tick_Q1 = "%.2f%s" % (len_bad/total_len * 100, '%')
+        tick_Q2 = "%.2f%s" % ((len_bad + len_fair)/total_len * 100, '%')
+        tick_Q3 = "%.2f%s" % ((len_bad + len_fair +  len_good)/total_len * 100, '%')
+        
+        return """
+        <!-- Arrow -->
+        <div class="arrow" style="width: {queried}; margin-top:10px; height: 35px;">
+        <svg class="lower-tangle" transform="translate(0, 18)"></svg>
+        <span class="lower-label" style="margin-bottom: 25px;"><b> {snr} </b></span>
+        </div>
+        
+        <!-- Progress bar -->
+        <div class="progress">
+          <div class="progress-bar progress-bar-bad" style="width: {bad}" data-toggle="tooltip" title="" data-original-title="">Bad</div>
+          <div class="progress-bar progress-bar-fair" style="width: {fair}" data-toggle="tooltip" title="" data-original-title="">Fair</div>
+          <div class="progress-bar progress-bar-good" style="width: {good}" data-toggle="tooltip" title="" data-original-title="">Good</div>
+          <div class="progress-bar progress-bar-great" style="width: {great}" data-toggle="tooltip" title="" data-original-title="">Great</div>
+        </div>
+        
+        <!-- Scale interval -->
+        <span style="float:left; left:0%; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q0}</span>
+        <span style="float:left; left:{tick_Q1}; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q1}</span>
+        <span style="float:left; left:{tick_Q2}; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q2}</span>
+        <span style="float:left; left:{tick_Q3}; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q3}</span>
+        <span style="float:left; left:99%; position:relative; margin-top:-20px; color: #9F9FA3; font-size: 14px; text-align: center; display: inline-block">{Q4}</span>
+        <br>
+        """.format(bad=bad, fair=fair, good=good, great=great, queried=queried, snr=snr, tick_Q1=tick_Q1, tick_Q2=tick_Q2, tick_Q3=tick_Q3, Q0=Q0, Q1=Q1, Q2=Q2, Q3=Q3, Q4=Q4)
+
     # Plot2: snr and rc
     def plot_snr_rc_point(
             self,
@@ -232,6 +217,8 @@ class MultiqcModule(BaseMultiqcModule):
             title="SNR and RC",
             description=None,
             helptext=None):
+        import plotly.express as px
+
         fig = px.scatter(quality_score, x="SNR", y="RC",
                          symbol = 'group', 
                          symbol_map = {"Reference": 0, "Query": 18},
@@ -286,10 +273,11 @@ class MultiqcModule(BaseMultiqcModule):
                            title=None,
                            description=None,
                            helptext=None):
-        SNR_value = 'SNR = ' + snr_data_df.iloc[1].at[
-            'SNR'] + ' (N = ' + snr_data_df.iloc[1].at['gene_num'] + ')'
-        PC1_value = 'PC1 (' + snr_data_df.iloc[1].at['PC1_ratio'] + '%)'
-        PC2_value = 'PC2 (' + snr_data_df.iloc[1].at['PC2_ratio'] + '%)'
+        import plotly.express as px
+
+        SNR_value = 'SNR = %.3f (N = %d)' % (snr_data_df.iloc[1].at['SNR'], snr_data_df.iloc[1].at['gene_num'])
+        PC1_value = 'PC1 (%g%%)' % snr_data_df.iloc[1].at['PC1_ratio']
+        PC2_value = 'PC2 (%g%%)' % snr_data_df.iloc[1].at['PC2_ratio']
         fig = px.scatter(snr_data_df,
                          x="PC1",
                          y="PC2",
@@ -360,7 +348,9 @@ class MultiqcModule(BaseMultiqcModule):
             title=None,
             description=None,
             helptext=None):
-        cor_value = 'Correlation = ' + df_rc.iloc[1].at['cor'] + ' (N = ' + df_rc.iloc[1].at['gene_num'] + ')'
+        import plotly.express as px
+
+        cor_value = 'Correlation = %.3f (N = %d)' % (df_rc.iloc[1].at['cor'], df_rc.iloc[1].at['gene_num'])
         fig = px.scatter(df_rc,
                          x="meanlogFC_ref",
                          y="meanlogFC_test",
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" MultiQC Submodule to rank the query batches against the historical batches
+
+The historical (reference) batches of quality_score.txt are sorted once by total score.
+A query batch is ranked among the historical batches and itself, as exp2qcdt ranks
+QC_test, so placing it is a binary search. The performance categories only depend on
+the number of ranked batches:
+
+* Great: rank < N/5
+* Good: N/5 <= rank <= N/2
+* Fair: N/5 < N + 1 - rank <= N/2
+* Bad: N + 1 - rank < N/5
+
+(the later rules win, as in make_performance_plot of exp2qcdt)
+"""
+
+from __future__ import print_function
+import logging
+
+import numpy as np
+
+# Initialise the logger
+log = logging.getLogger(__name__)
+
+CATEGORIES = ['Bad', 'Fair', 'Good', 'Great']
+
+
+def performance_categories(n):
+    """ The category of every rank (1..n) of n ranked batches, None for a gap. """
+    rank = np.arange(1, n + 1)
+    reverse = n + 1 - rank
+    categories = np.full(n, None, dtype=object)
+    categories[rank < n / 5.0] = 'Great'
+    categories[(n / 5.0 <= rank) & (rank <= n / 2.0)] = 'Good'
+    categories[(n / 5.0 < reverse) & (reverse <= n / 2.0)] = 'Fair'
+    categories[reverse < n / 5.0] = 'Bad'
+    return categories
+
+
+class RankingIndex(object):
+    """ The historical batches sorted by total score (best first) and the categories of
+    the ranks of a query batch among them. """
+
+    def __init__(self, total_scores, scaled_scores):
+        total_scores = np.asarray(total_scores, dtype=float)
+        order = np.argsort(-total_scores, kind='stable')
+        self.total_scores = total_scores[order]
+        self.scaled_scores = np.asarray(scaled_scores, dtype=float)[order]
+        # The historical batches and a query batch
+        self.size = len(self.total_scores) + 1
+        self.categories = performance_categories(self.size)
+        self.counts = dict((category, int(np.sum(self.categories == category))) for category in CATEGORIES)
+        # The first (best) rank of every category, as an index
+        self.first = dict((category, int(np.argmax(self.categories == category)))
+                          for category in CATEGORIES if self.counts[category])
+        self.last = dict((category, self.size - 1 - int(np.argmax(self.categories[::-1] == category)))
+                         for category in CATEGORIES if self.counts[category])
+
+    @classmethod
+    def from_quality_score(cls, df):
+        """ The index of the reference batches of quality_score.txt. """
+        reference = df[df['group'] != 'Query']
+        return cls(reference['total_score'].values, reference['scaled_score'].values)
+
+    def position(self, total_score):
+        """ The index of the rank of a query batch, after the historical batches with the
+        same score. """
+        return int(np.searchsorted(-self.total_scores, -total_score, side='right'))
+
+    def rank(self, total_score):
+        return self.position(total_score) + 1
+
+    def scaled_score_at(self, index, position, scaled_score):
+        """ The scaled score of a rank (an index) with the query batch at position. """
+        if index < position:
+            return self.scaled_scores[index]
+        if index == position:
+            return scaled_score
+        return self.scaled_scores[index - 1]
+
+    def place(self, total_score, scaled_score):
+        """ The rank and the category of a query batch, and the scaled scores of the best
+        and the worst ranks of the categories. """
+        position = self.position(total_score)
+        return {
+            'rank': position + 1,
+            'performance': self.categories[position],
+            'first': dict((category, self.scaled_score_at(index, position, scaled_score))
+                          for category, index in self.first.items()),
+            'last': dict((category, self.scaled_score_at(index, position, scaled_score))
+                         for category, index in self.last.items()),
+        }
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+""" MultiQC Submodule to read the tables of the performance assessment
+
+The tables are written by exp2qcdt (make_performance_plot in multiple_group_output.R).
+Every table has a schema of the columns the module uses and their types, the numbers are
+parsed by pandas when the table is read and the columns are checked once. The other
+columns (e.g. PC3.. of pca_with_snr.txt) are read with the types pandas infers.
+
+A table is read once per file, the frames are kept by the path, the size and the
+modification time of the file. Only the last MAX_FRAMES frames are kept, and they are
+cleared after every report (see render.isolated_multiqc), so a process which renders many
+reports doesn't keep the tables of the former ones. The frames are shared, don't modify them.
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+import logging
+import os
+
+# Initialise the logger
+log = logging.getLogger(__name__)
+
+SCHEMAS = {
+    'quality_score': OrderedDict([
+        ('batch', str),
+        ('SNR', 'float64'),
+        ('RC', 'float64'),
+        ('total_score', 'float64'),
+        ('group', str),
+        ('rank', 'int64'),
+        ('performance', str),
+        ('scaled_score', 'float64'),
+    ]),
+    'qc_metrics_summary': OrderedDict([
+        ('qc_metrics', str),
+        ('value', 'float64'),
+        ('historical_value', str),
+        # e.g. 3/22
+        ('rank', str),
+    ]),
+    'pca_with_snr': OrderedDict([
+        ('library', str),
+        ('sample', str),
+        ('PC1', 'float64'),
+        ('PC2', 'float64'),
+        ('PC1_ratio', 'float64'),
+        ('PC2_ratio', 'float64'),
+        ('SNR', 'float64'),
+        ('gene_num', 'int64'),
+    ]),
+    'logfc_cor_ref_test': OrderedDict([
+        ('gene', str),
+        ('compare', str),
+        ('meanlogFC_test', 'float64'),
+        ('meanlogFC_ref', 'float64'),
+        ('cor', 'float64'),
+        ('gene_num', 'int64'),
+    ]),
+}
+
+# The tables of a report
+MAX_FRAMES = len(SCHEMAS)
+
+_frames = OrderedDict()
+
+
+def clear_frames():
+    _frames.clear()
+
+
+def read_table(fpath, name):
+    """ The DataFrame of a table of the performance assessment, name is the key of its schema.
+    The DataFrame is shared by the callers, it must not be modified. """
+    import pandas as pd
+
+    stat = os.stat(fpath)
+    key = (os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns, name)
+    if key in _frames:
+        _frames.move_to_end(key)
+        return _frames[key]
+
+    schema = SCHEMAS[name]
+    header = pd.read_csv(fpath, sep='\t', nrows=0).columns
+    missing = [column for column in schema if column not in header]
+    if missing:
+        raise Exception('{} has no column {}.'.format(fpath, ', '.join(missing)))
+    try:
+        df = pd.read_csv(fpath, sep='\t', dtype=dict(schema))
+    except ValueError as e:
+        raise Exception('Could not read {}: {}'.format(fpath, e))
+
+    _frames[key] = df
+    while len(_frames) > MAX_FRAMES:
+        _frames.popitem(last=False)
+    log.debug('Read {} rows of {}'.format(len(df), fpath))
+    return df
@@ -0,0 +1,3 @@
+from __future__ import absolute_import
+
+from .pipeline_profile import MultiqcModule
\ No newline at end of file
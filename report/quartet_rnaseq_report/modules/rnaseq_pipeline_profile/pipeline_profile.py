@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+""" Quartet RNAseq Report plugin module """
+
+from __future__ import print_function
+from collections import OrderedDict
+import json
+import logging
+
+from multiqc import config
+from multiqc.plots import table
+from multiqc.modules.base_module import BaseMultiqcModule
+from quartet_rnaseq_report.modules.plotly import plot as plotly_plot
+
+# Initialise the main MultiQC logger
+log = logging.getLogger('multiqc')
+
+
+class MultiqcModule(BaseMultiqcModule):
+    def __init__(self):
+
+        # Halt execution if we've disabled the plugin
+        if config.kwargs.get('disable_plugin', True):
+            return None
+
+        # Initialise the parent module Class object
+        super(MultiqcModule, self).__init__(
+            name='Pipeline Profile',
+            target='pipeline_profile',
+            anchor='pipeline_profile',
+            href='https://github.com/chinese-quartet/quartet-rseqc-report',
+            info=' is a module to show where the wall-clock time, cpu time and memory are spent in the RNA-Seq pipeline.'
+        )
+
+        tasks = []
+        for f in self.find_log_files('rnaseq_pipeline_profile/profile'):
+            profile = json.loads(f['f'])
+            s_name = self.clean_s_name(profile.get('sample') or f['s_name'], f['root'])
+            for task in profile.get('tasks', []):
+                task['sample'] = s_name
+                tasks.append(task)
+            self.add_data_source(f, s_name)
+
+        if len(tasks) == 0:
+            log.debug('No file matched: rnaseq_pipeline_profile - pipeline_profile.json')
+            raise UserWarning
+
+        # pandas and plotly are loaded only when there is something to plot
+        import pandas as pd
+
+        tasks = pd.DataFrame(tasks)
+        tasks = tasks[tasks['start'].notna() & tasks['end'].notna()]
+        tasks['start'] = pd.to_datetime(tasks['start'])
+        tasks['end'] = pd.to_datetime(tasks['end'])
+
+        self.plot_gantt('pipeline_profile_gantt', tasks)
+        self.plot_summary_table('pipeline_profile_summary', tasks)
+
+    def plot_gantt(self, id, tasks, title=None, description=None, helptext=None):
+        import plotly.express as px
+
+        tasks = tasks.sort_values(['sample', 'start'])
+        tasks['label'] = tasks['sample'] + ' - ' + tasks['task'] + tasks['shard'].map(
+            lambda shard: '' if shard < 0 else '[%d]' % shard)
+        fig = px.timeline(tasks, x_start='start', x_end='end', y='label', color='task',
+                          hover_data=['sample', 'wall_time', 'cpu_time', 'max_rss', 'cached'],
+                          template='simple_white')
+        fig.update_yaxes(autorange='reversed', title_text='')
+        fig.update_layout(legend_title_text='', height=max(400, 20 * len(tasks)))
+
+        html = plotly_plot(
+            fig, {
+                'id': id + '_plot',
+                'data_id': id + '_data',
+                'title': title,
+                'auto_margin': True
+            })
+
+        self.add_section(
+            name='Timeline',
+            anchor=id + '_anchor',
+            description=description if description else
+            'The start and end of every task, the tasks of all samples are shown in one timeline.',
+            helptext=helptext if helptext else '''
+            The timings are taken from the Cromwell metadata of every workflow. A task which is
+            reused from the call cache is shown with the timings of its cache lookup.
+            ''',
+            plot=html)
+
+    def plot_summary_table(self, id, tasks, description=None, helptext=None):
+        tasks = tasks[~tasks['cached'].astype(bool)]
+        data = OrderedDict()
+        for name, group in tasks.groupby('task', sort=False):
+            wall_time = group['wall_time'].astype(float)
+            cpu_time = group['cpu_time'].astype(float)
+            cpu = group['cpu'].astype(float)
+            data[name] = {
+                'runs': len(group),
+                'median_wall_time': wall_time.median() / 60,
+                'total_wall_time': wall_time.sum() / 3600,
+                'total_cpu_time': cpu_time.sum() / 3600,
+                # How many of the reserved cores are used
+                'cpu_efficiency': (cpu_time / (wall_time * cpu)).mean() * 100,
+                'max_rss': group['max_rss'].astype(float).max() / 1024 ** 3,
+                'memory': group['memory'].astype(float).max() / 1024 ** 3
+            }
+
+        headers = OrderedDict()
+        headers['runs'] = {
+            'title': 'Runs',
+            'description': 'How many times the task is run',
+            'scale': False,
+            'format': '{:,.0f}'
+        }
+        headers['median_wall_time'] = {
+            'title': 'Median Wall Time',
+            'description': 'Median wall-clock time of the task (minutes)',
+            'suffix': ' min',
+            'scale': 'OrRd',
+            'format': '{:,.1f}'
+        }
+        headers['total_wall_time'] = {
+            'title': 'Total Wall Time',
+            'description': 'Total wall-clock time of the task in all samples (hours)',
+            'suffix': ' h',
+            'scale': 'OrRd',
+            'format': '{:,.2f}'
+        }
+        headers['total_cpu_time'] = {
+            'title': 'Total CPU Time',
+            'description': 'Total user and system cpu time of the task in all samples (hours)',
+            'suffix': ' h',
+            'scale': 'OrRd',
+            'format': '{:,.2f}'
+        }
+        headers['cpu_efficiency'] = {
+            'title': 'CPU Efficiency',
+            'description': 'CPU time divided by wall-clock time and the requested cores',
+            'max': 100,
+            'min': 0,
+            'suffix': '%',
+            'scale': 'RdYlGn',
+            'format': '{:,.0f}'
+        }
+        headers['max_rss'] = {
+            'title': 'Peak Memory',
+            'description': 'Peak resident memory of the task (GB)',
+            'suffix': ' GB',
+            'scale': 'Blues',
+            'format': '{:,.2f}'
+        }
+        headers['memory'] = {
+            'title': 'Requested Memory',
+            'description': 'Memory requested by the runtime section of the task (GB)',
+            'suffix': ' GB',
+            'scale': False,
+            'format': '{:,.1f}'
+        }
+        table_config = {
+            'namespace': 'pipeline_profile',
+            'id': id,
+            'table_title': '',
+            'col1_header': 'Task',
+            'no_beeswarm': True,
+            'sortRows': False
+        }
+
+        self.add_section(
+            name='Summary',
+            anchor=id + '_anchor',
+            description=description if description else
+            'The time and memory spent by every task, the tasks reused from the call cache are excluded.',
+            helptext=helptext if helptext else '''
+            The cpu time and the peak memory are recorded by the task wrapper of the Cromwell backend
+            (`rseqc.py task-wrapper`). A low cpu efficiency means the task doesn't use all its cores.
+            ''',
+            plot=table.plot(data, headers, table_config))
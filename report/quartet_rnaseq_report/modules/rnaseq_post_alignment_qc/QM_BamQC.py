@@ -4,12 +4,14 @@
 from __future__ import print_function
 import logging
 import math
-import re
-from collections import OrderedDict
 
 from multiqc import config
 from multiqc.plots import linegraph, table
 
+from quartet_rnaseq_report.modules.downsample import downsample_plot_data
+from . import QM_Results
+from .QM_Histogram import Histogram, HistogramStack, read_table
+
 # Initialise the logger
 log = logging.getLogger(__name__)
 
@@ -20,7 +22,8 @@ def parse_reports(self):
     # General stats - genome_results.txt
     self.qualimap_bamqc_genome_results = dict()
     for f in self.find_log_files(
-            'rnaseq_post_alignment_qc/bam_qc/genome_results'):
+            'rnaseq_post_alignment_qc/bam_qc/genome_results',
+            filecontents=False):
         parse_genome_results(self, f)
     self.qualimap_bamqc_genome_results = self.ignore_samples(
         self.qualimap_bamqc_genome_results)
@@ -87,25 +90,8 @@ def parse_reports(self):
 
 def parse_genome_results(self, f):
     """ Parse the contents of the Qualimap BamQC genome_results.txt file """
-    regexes = {
-        'bam_file': r"bam file = (.+)",
-        'total_reads': r"number of reads = ([\d,]+)",
-        'mapped_reads': r"number of mapped reads = ([\d,]+)",
-        'mapped_bases': r"number of mapped bases = ([\d,]+)",
-        'sequenced_bases': r"number of sequenced bases = ([\d,]+)",
-        'mean_insert_size': r"mean insert size = ([\d,\.]+)",
-        'median_insert_size': r"median insert size = ([\d,\.]+)",
-        'mean_mapping_quality': r"mean mapping quality = ([\d,\.]+)",
-        'general_error_rate': r"general error rate = ([\d,\.]+)",
-    }
-    d = dict()
-    for k, r in regexes.items():
-        r_search = re.search(r, f['f'], re.MULTILINE)
-        if r_search:
-            try:
-                d[k] = float(r_search.group(1).replace(',', ''))
-            except ValueError:
-                d[k] = r_search.group(1)
+    d = QM_Results.select(QM_Results.get_results(self, f),
+                          QM_Results.GENOME_RESULTS_KEYS)
     # Check we have an input filename
     if 'bam_file' not in d:
         log.debug(
@@ -143,46 +129,22 @@ def parse_coverage(self, f):
     # Typical path: <sample name>/raw_data_qualimapReport/coverage_histogram.txt
     s_name = self.get_s_name(f)
 
-    d = dict()
-    for l in f['f']:
-        if l.startswith('#'):
-            continue
-        coverage, count = l.split(None, 1)
-        coverage = int(round(float(coverage)))
-        count = float(count)
-        d[coverage] = count
-
-    if len(d) == 0:
+    hist = Histogram.from_file(f['f'])
+    if len(hist) == 0:
         log.debug(
             "Couldn't parse contents of coverage histogram file {}".format(
                 f['fn']))
         return None
 
-    # Find median and mean without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    total_cov = 0
-    median_coverage = None
-    for thiscov, thiscount in d.items():
-        cum_counts += thiscount
-        total_cov += thiscov * thiscount
-        if cum_counts >= num_counts / 2:
-            median_coverage = thiscov
-            break
-    try:
-        self.general_stats_data[s_name][
-            'mean_coverage'] = total_cov / num_counts
-    except ZeroDivisionError:
-        self.general_stats_data[s_name]['mean_coverage'] = 0
-
-    self.general_stats_data[s_name]['median_coverage'] = median_coverage
+    self.general_stats_data[s_name]['mean_coverage'] = hist.mean()
+    self.general_stats_data[s_name]['median_coverage'] = hist.median()
 
     # Save results
     if s_name in self.qualimap_bamqc_coverage_hist:
         log.debug(
             "Duplicate coverage histogram sample name found! Overwriting: {}".
             format(s_name))
-    self.qualimap_bamqc_coverage_hist[s_name] = d
+    self.qualimap_bamqc_coverage_hist[s_name] = hist
     self.add_data_source(f, s_name=s_name, section='coverage_histogram')
 
 
@@ -192,37 +154,19 @@ def parse_insert_size(self, f):
     # Typical path: <sample name>/raw_data_qualimapReport/insert_size_histogram.txt
     s_name = self.get_s_name(f)
 
-    d = dict()
-    zero_insertsize = 0
-    for l in f['f']:
-        if l.startswith('#'):
-            continue
-        insertsize, count = l.split(None, 1)
-        insertsize = int(round(float(insertsize)))
-        count = float(count) / 1000000
-        if (insertsize == 0):
-            zero_insertsize = count
-        else:
-            d[insertsize] = count
-
-    # Find median without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    median_insert_size = None
-    for thisins, thiscount in d.items():
-        cum_counts += thiscount
-        if cum_counts >= num_counts / 2:
-            median_insert_size = thisins
-            break
+    # The fragments without an insert size are left out
+    hist = Histogram.from_file(f['f'], scale=1000000)
+    hist = hist.select(hist.values != 0)
+
     # Add the median insert size to the general stats table
-    self.general_stats_data[s_name]['median_insert_size'] = median_insert_size
+    self.general_stats_data[s_name]['median_insert_size'] = hist.median()
 
     # Save results
     if s_name in self.qualimap_bamqc_insert_size_hist:
         log.debug(
             "Duplicate insert size histogram sample name found! Overwriting: {}"
             .format(s_name))
-    self.qualimap_bamqc_insert_size_hist[s_name] = d
+    self.qualimap_bamqc_insert_size_hist[s_name] = hist
     self.add_data_source(f, s_name=s_name, section='insert_size_histogram')
 
 
@@ -232,36 +176,25 @@ def parse_gc_dist(self, f):
     # Typical path: <sample name>/raw_data_qualimapReport/mapped_reads_gc-content_distribution.txt
     s_name = self.get_s_name(f)
 
-    d = dict()
+    comments, rows = read_table(f['f'])
     reference_species = None
-    reference_d = dict()
-    avg_gc = 0
-    for l in f['f']:
-        if l.startswith('#'):
-            sections = l.strip("\n").split("\t", 3)
-            if len(sections) > 2:
-                reference_species = sections[2]
-            continue
+    for l in comments:
         sections = l.strip("\n").split("\t", 3)
-        gc = int(round(float(sections[0])))
-        content = float(sections[1])
-        avg_gc += gc * content
-        d[gc] = content
         if len(sections) > 2:
-            reference_content = float(sections[2])
-            reference_d[gc] = reference_content
+            reference_species = sections[2]
+    hist = Histogram(rows[:, 0], rows[:, 1])
 
     # Add average GC to the general stats table
-    self.general_stats_data[s_name]['avg_gc'] = avg_gc
+    self.general_stats_data[s_name]['avg_gc'] = hist.weighted_sum()
 
     # Save results
     if s_name in self.qualimap_bamqc_gc_content_dist:
         log.debug(
             "Duplicate Mapped Reads GC content distribution sample name found! Overwriting: {}"
             .format(s_name))
-    self.qualimap_bamqc_gc_content_dist[s_name] = d
-    if reference_species and reference_species not in self.qualimap_bamqc_gc_by_species:
-        self.qualimap_bamqc_gc_by_species[reference_species] = reference_d
+    self.qualimap_bamqc_gc_content_dist[s_name] = hist
+    if reference_species and rows.shape[1] > 2 and reference_species not in self.qualimap_bamqc_gc_by_species:
+        self.qualimap_bamqc_gc_by_species[reference_species] = Histogram(rows[:, 0], rows[:, 2])
     self.add_data_source(f, s_name=s_name, section='mapped_gc_distribution')
 
 
@@ -336,41 +269,52 @@ def report_sections(self):
     # Append to self.sections list
 
     if len(self.qualimap_bamqc_coverage_hist) > 0:
+        s_names = list(self.qualimap_bamqc_coverage_hist.keys())
+        hists = list(self.qualimap_bamqc_coverage_hist.values())
+        stack = HistogramStack(hists)
+
         # Chew back on histogram to prevent long flat tail
         # (find a sensible max x - lose 1% of longest tail)
-        max_x = 0
-        total_bases_by_sample = dict()
-        for s_name, d in self.qualimap_bamqc_coverage_hist.items():
-            total_bases_by_sample[s_name] = sum(d.values())
-            cumulative = 0
-            for count in sorted(d.keys(), reverse=True):
-                cumulative += d[count]
-                if cumulative / total_bases_by_sample[s_name] > 0.01:
-                    max_x = max(max_x, count)
-                    break
-
-        rates_within_threshs = dict()
-        for s_name, hist in self.qualimap_bamqc_coverage_hist.items():
-            total = total_bases_by_sample[s_name]
-            # Make a range of depths that isn't stupidly huge for high coverage expts
-            depth_range = list(
-                range(0, max_x + 1,
-                      math.ceil(float(max_x) / 400.0) if max_x > 0 else 1))
-            # Check that we have our specified coverages in the list
-            for c in self.covs:
-                if int(c) not in depth_range:
-                    depth_range.append(int(c))
-            # Calculate the coverage rates for this range of coverages
-            rates_within_threshs[s_name] = _calculate_bases_within_thresholds(
-                hist, total, depth_range)
-            # Add requested coverage levels to the General Statistics table
-            for c in self.covs:
-                if int(c) in rates_within_threshs[s_name]:
-                    self.general_stats_data[s_name]['{}_x_pc'.format(
-                        c)] = rates_within_threshs[s_name][int(c)]
-                else:
-                    self.general_stats_data[s_name]['{}_x_pc'.format(c)] = 0
-            # Now add each section in order
+        max_x = int(stack.max_values(0.01).max())
+
+        # Make a range of depths that isn't stupidly huge for high coverage expts
+        plot_range = list(
+            range(0, max_x + 1,
+                  math.ceil(float(max_x) / 400.0) if max_x > 0 else 1))
+        # Check that we have our specified coverages in the list
+        depth_range = sorted(set(plot_range) | set(int(c) for c in self.covs))
+
+        # Calculate the coverage rates of all samples for this range of coverages
+        rates = stack.breadth(depth_range)
+
+        # Add requested coverage levels to the General Statistics table
+        for c in self.covs:
+            column = rates[:, depth_range.index(int(c))].tolist()
+            for s_name, rate in zip(s_names, column):
+                self.general_stats_data[s_name]['{}_x_pc'.format(c)] = None if math.isnan(rate) else rate
+
+        # Section 1 - Cumulative genome coverage
+        plot_columns = [depth_range.index(depth) for depth in plot_range]
+        rates_within_threshs = dict(
+            (s_name, dict((depth, rate) for depth, rate in zip(plot_range, row) if not math.isnan(rate)))
+            for s_name, row in zip(s_names, rates[:, plot_columns].tolist()))
+        self.add_section(
+            name='Cumulative genome coverage',
+            anchor='qualimap-cumulative-genome-fraction-coverage',
+            description='Percentage of the reference genome with at least the given depth of coverage.',
+            helptext=genome_fraction_helptext,
+            plot=linegraph.plot(
+                downsample_plot_data(rates_within_threshs, keep_x=[int(c) for c in self.covs]), {
+                    'id': 'qualimap_genome_fraction',
+                    'title': 'Qualimap BamQC: Genome fraction covered by at least X reads',
+                    'ylab': 'Fraction of reference (%)',
+                    'xlab': 'Coverage (X)',
+                    'ymax': 100,
+                    'ymin': 0,
+                    'xmin': 0,
+                    'xmax': max_x,
+                    'tt_label': '<b>{point.x}X</b>: {point.y:.2f}%',
+                }))
 
     # Section 1 - GC-content distribution
     if len(self.qualimap_bamqc_gc_content_dist) > 0:
@@ -397,7 +341,7 @@ def report_sections(self):
                 sorted(self.qualimap_bamqc_gc_by_species.items())):
             extra_series.append({
                 'name': species_name,
-                'data': list(species_data.items()),
+                'data': list(species_data.to_dict().items()),
                 'dashStyle': 'Dash',
                 'lineWidth': 1,
                 'color': ['#000000', '#E89191'][i % 2],
@@ -428,7 +372,9 @@ def report_sections(self):
                          description=desc,
                          helptext=gc_content_helptext,
                          plot=linegraph.plot(
-                             self.qualimap_bamqc_gc_content_dist, lg_config))
+                             downsample_plot_data(
+                                 dict((s_name, hist.to_dict()) for s_name, hist in
+                                      self.qualimap_bamqc_gc_content_dist.items())), lg_config))
 
     # Section 1 - Insert size histogram
     if len(self.qualimap_bamqc_insert_size_hist) > 0:
@@ -480,7 +426,11 @@ def report_sections(self):
             'Distribution of estimated insert sizes of mapped reads.',
             helptext=insert_size_helptext,
             plot=linegraph.plot(
-                self.qualimap_bamqc_insert_size_hist, {
+                downsample_plot_data(
+                    dict((s_name, hist.to_dict()) for s_name, hist in
+                         self.qualimap_bamqc_insert_size_hist.items()),
+                    keep_x=dict((s_name, [hist.median()]) for s_name, hist in
+                                self.qualimap_bamqc_insert_size_hist.items())), {
                     'id': 'qualimap_insert_size',
                     'title': 'Qualimap BamQC: Insert size histogram',
                     'ylab': 'Fraction of reads',
@@ -584,31 +534,3 @@ def general_stats_headers(self):
         'shared_key': 'read_count',
         'hidden': True
     }
-
-
-def _calculate_bases_within_thresholds(bases_by_depth, total_size,
-                                       depth_thresholds):
-    bases_within_threshs = OrderedDict(
-        (depth, 0) for depth in depth_thresholds)
-    rates_within_threshs = OrderedDict(
-        (depth, None) for depth in depth_thresholds)
-
-    dt = sorted(depth_thresholds, reverse=True)
-    c = 0
-    for depth in sorted(bases_by_depth.keys(), reverse=True):
-        while depth < dt[c]:
-            c += 1
-            bases_within_threshs[dt[c]] = bases_within_threshs[dt[c - 1]]
-        if depth >= dt[c]:
-            bases_within_threshs[dt[c]] += bases_by_depth[depth]
-    while c + 1 < len(dt):
-        c += 1
-        bases_within_threshs[dt[c]] = total_size
-    for t in dt:
-        bs = bases_within_threshs[t]
-        if total_size > 0:
-            rate = 100.0 * bases_within_threshs[t] / total_size
-            assert rate <= 100, 'Error: rate is > 1: rate = ' + str(
-                rate) + ', bases = ' + str(bs) + ', size = ' + str(total_size)
-            rates_within_threshs[t] = rate
-    return rates_within_threshs
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+""" MultiQC Submodule to read the Qualimap histograms
+
+The coverage, insert size, GC content and gene coverage files of Qualimap are tables of a
+value and its count (or fraction). A file is read in bulk into a Histogram, which keeps the
+values and the counts as NumPy arrays sorted by value, so the summary statistics are array
+operations instead of loops over every bin.
+"""
+
+from __future__ import print_function
+import io
+import logging
+
+import numpy as np
+
+# Initialise the logger
+log = logging.getLogger(__name__)
+
+
+def read_table(fh):
+    """ Returns the comment lines and the numbers of a Qualimap table as a 2D array. """
+
+    text = fh.read()
+    lines = text.split('\n')
+    comments = [l for l in lines if l.startswith('#')]
+    if not any(l.strip() and not l.startswith('#') for l in lines):
+        return comments, np.zeros((0, 2))
+
+    # The numbers are parsed by NumPy, a row which isn't numbers or has another number of
+    # columns raises a ValueError
+    table = np.loadtxt(io.StringIO(text), dtype=float, comments='#', ndmin=2)
+    return comments, table
+
+
+class Histogram(object):
+    """ The counts of the values of a histogram. The values are rounded to integers like
+    the former dicts of the module (and, as for a dict, the last count of a value wins). """
+
+    def __init__(self, values, counts):
+        values = np.rint(np.asarray(values, dtype=float)).astype(np.int64)
+        counts = np.asarray(counts, dtype=float)
+        if len(values) > 1 and not np.all(values[1:] > values[:-1]):
+            # The index of the last count of every value
+            last = len(values) - 1 - np.unique(values[::-1], return_index=True)[1]
+            values, counts = values[last], counts[last]
+        self.values = values
+        self.counts = counts
+
+    @classmethod
+    def from_file(cls, fh, scale=1.0):
+        """ The histogram of the first two columns of a Qualimap table. """
+        table = read_table(fh)[1]
+        return cls(table[:, 0], table[:, 1] / scale if scale != 1.0 else table[:, 1])
+
+    def __len__(self):
+        return len(self.values)
+
+    def select(self, mask):
+        """ The histogram of the bins in the boolean mask. """
+        return Histogram(self.values[mask], self.counts[mask])
+
+    def cumulative(self):
+        """ The counts of the values up to every value. """
+        return np.cumsum(self.counts)
+
+    def reverse_cumulative(self):
+        """ The counts of the values from every value, e.g. the bases with at least a depth. """
+        return np.cumsum(self.counts[::-1])[::-1]
+
+    def total(self):
+        # The sum in the order of the values, like the former loops of the module
+        return float(self.cumulative()[-1]) if len(self) > 0 else 0.0
+
+    def weighted_sum(self):
+        return float(np.dot(self.values, self.counts))
+
+    def mean(self):
+        total = self.total()
+        return self.weighted_sum() / total if total else 0
+
+    def quantile(self, q):
+        """ The first value where the cumulative count reaches q of the total. """
+        if len(self) == 0:
+            return None
+        cumulative = self.cumulative()
+        index = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+        return int(self.values[min(index, len(self) - 1)])
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def to_dict(self):
+        """ {value: count} for the plots. """
+        return dict(zip(self.values.tolist(), self.counts.tolist()))
+
+
+class HistogramStack(object):
+    """ Histograms laid end to end in one array, so a statistic of all the histograms is
+    one array operation. The values of a histogram are moved past the values of the ones
+    before it, so the array stays sorted. """
+
+    def __init__(self, hists):
+        sizes = np.array([len(hist) for hist in hists], dtype=np.int64)
+        self.values = np.concatenate([hist.values for hist in hists]) if len(hists) else np.zeros(0, np.int64)
+        counts = np.concatenate([hist.counts for hist in hists]) if len(hists) else np.zeros(0)
+        self.span = int(self.values.max()) + 1 if len(self.values) else 1
+        self.offsets = np.arange(len(hists), dtype=np.int64) * self.span
+        self.keys = self.values + np.repeat(self.offsets, sizes)
+        self.ends = np.cumsum(sizes)
+        self.starts = self.ends - sizes
+
+        # The counts from every bin to the end of the array
+        self.from_bin = np.append(np.cumsum(counts[::-1])[::-1], 0)
+        self.totals = self.from_bin[self.starts] - self.from_bin[self.ends]
+
+    def max_values(self, fraction):
+        """ The largest value of every histogram with more than the fraction of its total
+        count at or above it, or 0. """
+        sizes = self.ends - self.starts
+        above = self.from_bin[:-1] - self.from_bin[np.repeat(self.ends, sizes)] > fraction * np.repeat(self.totals, sizes)
+        last = np.where(above, np.arange(len(above)), -1)
+        result = np.zeros(len(self.starts), dtype=np.int64)
+        filled = self.ends > self.starts
+        if filled.any():
+            last = np.maximum.reduceat(last, self.starts[filled])
+            result[filled] = np.where(last >= 0, self.values[np.maximum(last, 0)], 0)
+        return result
+
+    def breadth(self, depths):
+        """ The percentages of the counts with at least each depth, a row for every
+        histogram and a column for every depth (NaN for an empty histogram). """
+        depths = np.minimum(np.asarray(depths, dtype=np.int64), self.span)
+        first = np.searchsorted(self.keys, self.offsets[:, None] + depths[None, :], side='left')
+        bases = self.from_bin[first] - self.from_bin[self.ends][:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.minimum(100.0 * bases / self.totals[:, None], 100.0)
+        rates[self.totals <= 0] = np.nan
+        return rates
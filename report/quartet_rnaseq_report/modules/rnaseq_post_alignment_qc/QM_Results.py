@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+""" MultiQC Submodule to read the Qualimap results files
+
+The results files of Qualimap (genome_results.txt of BamQC and rnaseq_qc_results.txt of
+RNASeq) are lists of `key = value` lines. A file is read once into a QualimapResults
+which is kept by the module, so all the parts of the module which use the file read the
+same keys and values.
+"""
+
+from __future__ import print_function
+import io
+import logging
+import os
+import re
+
+# Initialise the logger
+log = logging.getLogger(__name__)
+
+# e.g. "exonic = 12.345.678 (80,55%)"
+EUROPEAN_NUMBER = re.compile(r"[\d\.]+ \(\d{1,3},\d+%\)")
+
+# The names used by the module and the keys in the results files
+GENOME_RESULTS_KEYS = [
+    ('bam_file', ['bam file']),
+    ('total_reads', ['number of reads']),
+    ('mapped_reads', ['number of mapped reads']),
+    ('mapped_bases', ['number of mapped bases']),
+    ('sequenced_bases', ['number of sequenced bases']),
+    ('mean_insert_size', ['mean insert size']),
+    ('median_insert_size', ['median insert size']),
+    ('mean_mapping_quality', ['mean mapping quality']),
+    ('general_error_rate', ['general error rate']),
+]
+RNASEQ_RESULTS_KEYS = [
+    ('bam_file', ['bam file']),
+    ('reads_aligned', ['reads aligned', 'read pairs aligned']),
+    ('total_alignments', ['total alignments']),
+    ('non_unique_alignments', ['non-unique alignments']),
+    ('reads_aligned_genes', ['aligned to genes']),
+    ('ambiguous_alignments', ['ambiguous alignments']),
+    ('not_aligned', ['not aligned']),
+    ('5_3_bias', ["5'-3' bias"]),
+    ('reads_aligned_exonic', ['exonic']),
+    ('reads_aligned_intronic', ['intronic']),
+    ('reads_aligned_intergenic', ['intergenic']),
+    ('reads_aligned_overlapping_exon', ['overlapping exon']),
+]
+
+
+class QualimapResults(object):
+    """ The `key = value` lines of a Qualimap results file. The keys have single spaces,
+    the value of a key is the first one in the file. A value which starts with a number is
+    a float, others are strings; they are converted when they are read. """
+
+    def __init__(self, text):
+        # Every chunk ends with a key and the next one starts with its value. The tables and
+        # lines like "There is a 95% of reference with a coverageData >= 1X" have no " = ".
+        self.values = dict()
+        chunks = text.split(' = ')
+        for i in range(1, len(chunks)):
+            key = chunks[i - 1].rpartition('\n')[2].strip()
+            if '  ' in key:
+                key = ' '.join(key.split())
+            if key not in self.values:
+                self.values[key] = chunks[i].partition('\n')[0]
+
+        # Check for and 'fix' European style decimal places / thousand separators
+        self.european = EUROPEAN_NUMBER.match(self.values.get('exonic', '').strip()) is not None
+        self.typed = dict()
+
+    def get(self, key):
+        try:
+            return self.typed[key]
+        except KeyError:
+            pass
+
+        value = self.values.get(key)
+        if value is not None:
+            value = value.strip()
+            # The number is the first word, e.g. "1,234 bp" or "18,000 (80%)"
+            number = value.split(None, 1)[0] if value else ''
+            if number[:1].isdigit():
+                if self.european:
+                    number = number.replace('.', '').replace(',', '.')
+                try:
+                    value = float(number.replace(',', ''))
+                except ValueError:
+                    pass
+        self.typed[key] = value
+        return value
+
+
+def get_results(self, f):
+    """ The QualimapResults of a file found by find_log_files(..., filecontents=False),
+    the file is read and tokenized only the first time. """
+
+    fpath = os.path.join(f['root'], f['fn'])
+    if not hasattr(self, 'qualimap_results'):
+        self.qualimap_results = dict()
+    if fpath not in self.qualimap_results:
+        with io.open(fpath, 'r', encoding='utf-8') as fh:
+            self.qualimap_results[fpath] = QualimapResults(fh.read())
+        if self.qualimap_results[fpath].european:
+            log.debug("Trying to fix European comma style syntax in Qualimap report {}".format(fpath))
+    return self.qualimap_results[fpath]
+
+
+def select(results, names):
+    """ Returns a dict of the names (see GENOME_RESULTS_KEYS) and the values of the first
+    of their keys in the results. The bam file is a string, the others are numbers. """
+
+    d = dict()
+    for name, keys in names:
+        for key in keys:
+            value = results.get(key)
+            if value is not None and (name == 'bam_file' or isinstance(value, float)):
+                d[name] = value
+                break
+    return d
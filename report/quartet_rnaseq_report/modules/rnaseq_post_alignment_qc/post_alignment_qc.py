@@ -5,12 +5,15 @@ from __future__ import print_function
 from collections import defaultdict, OrderedDict
 import logging
 import os
-import re
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
 from multiqc.plots import bargraph, linegraph, table
 
+from quartet_rnaseq_report.modules.downsample import downsample_plot_data
+from . import QM_Results
+from .QM_Histogram import Histogram
+
 # Initialise the logger
 log = logging.getLogger(__name__)
 
@@ -83,58 +86,27 @@ class MultiqcModule(BaseMultiqcModule):
                          plot=table.plot(self.general_stats_data,
                                          self.general_stats_headers))
 
+    def rnaseq_results(self, f):
+        """ The numbers of a Qualimap RNASeq rnaseq_qc_results.txt file """
+
+        d = QM_Results.select(QM_Results.get_results(self, f),
+                              QM_Results.RNASEQ_RESULTS_KEYS)
+        if 'bam_file' not in d:
+            log.warn(
+                "Couldn't find an input filename in genome_results file {}/{}"
+                .format(f['root'], f['fn']))
+            return None
+        return d
+
     def add_qm_rnaseq_stats_data(self):
 
-        regexes = {
-            'reads_aligned': r"read(?:s| pairs) aligned\s*=\s*([\d,]+)",
-            'total_alignments': r"total alignments\s*=\s*([\d,]+)",
-            'non_unique_alignments': r"non-unique alignments\s*=\s*([\d,]+)",
-            'reads_aligned_genes': r"aligned to genes\s*=\s*([\d,]+)",
-            'ambiguous_alignments': r"ambiguous alignments\s*=\s*([\d,]+)",
-            'not_aligned': r"not aligned\s*=\s*([\d,]+)",
-            '5_3_bias': r"5'-3' bias\s*=\s*([\d,\.]+)$",
-            'reads_aligned_exonic': r"exonic\s*=\s*([\d,]+)",
-            'reads_aligned_intronic': r"intronic\s*=\s*([\d,]+)",
-            'reads_aligned_intergenic': r"intergenic\s*=\s*([\d,]+)",
-            'reads_aligned_overlapping_exon': r"overlapping exon\s*=\s*([\d,]+)",
-        }
         for f in self.find_log_files(
-                'rnaseq_post_alignment_qc/rnaseq_qc/rnaseq_qc_results'):
-            d = dict()
-
-            # Get the sample name
-            s_name_regex = re.search(r"bam file\s*=\s*(.+)", f['f'],
-                                     re.MULTILINE)
-            if s_name_regex:
-                d['bam_file'] = s_name_regex.group(1)
-                s_name = self.clean_s_name(d['bam_file'], f['root'])
-            else:
-                log.warn(
-                    "Couldn't find an input filename in genome_results file {}/{}"
-                    .format(f['root'], f['fn']))
+                'rnaseq_post_alignment_qc/rnaseq_qc/rnaseq_qc_results',
+                filecontents=False):
+            d = self.rnaseq_results(f)
+            if d is None:
                 return None
-
-            # Check for and 'fix' European style decimal places / thousand separators
-            comma_regex = re.search(r"exonic\s*=\s*[\d\.]+ \(\d{1,3},\d+%\)",
-                                    f['f'], re.MULTILINE)
-            if comma_regex:
-                log.debug(
-                    "Trying to fix European comma style syntax in Qualimap report {}/{}"
-                    .format(f['root'], f['fn']))
-                f['f'] = f['f'].replace('.', '')
-                f['f'] = f['f'].replace(',', '.')
-
-            # Go through all numeric regexes
-            for k, r in regexes.items():
-                r_search = re.search(r, f['f'], re.MULTILINE)
-                if r_search:
-                    try:
-                        d[k] = float(r_search.group(1).replace(',', ''))
-                    except UnicodeEncodeError:
-                        # Qualimap reports infinity (\u221e) when 3' bias denominator is zero
-                        pass
-                    except ValueError:
-                        d[k] = r_search.group(1)
+            s_name = self.clean_s_name(d['bam_file'], f['root'])
 
             try:
                 total_read = d['reads_aligned_exonic'] + d['reads_aligned_intronic'] + d['reads_aligned_intergenic']
@@ -183,56 +155,13 @@ class MultiqcModule(BaseMultiqcModule):
         """ Find Qualimap RNASeq reports and parse their data """
 
         self.qualimap_rnaseq_genome_results = dict()
-        regexes = {
-            'reads_aligned': r"read(?:s| pairs) aligned\s*=\s*([\d,]+)",
-            'total_alignments': r"total alignments\s*=\s*([\d,]+)",
-            'non_unique_alignments': r"non-unique alignments\s*=\s*([\d,]+)",
-            'reads_aligned_genes': r"aligned to genes\s*=\s*([\d,]+)",
-            'ambiguous_alignments': r"ambiguous alignments\s*=\s*([\d,]+)",
-            'not_aligned': r"not aligned\s*=\s*([\d,]+)",
-            '5_3_bias': r"5'-3' bias\s*=\s*([\d,\.]+)$",
-            'reads_aligned_exonic': r"exonic\s*=\s*([\d,]+)",
-            'reads_aligned_intronic': r"intronic\s*=\s*([\d,]+)",
-            'reads_aligned_intergenic': r"intergenic\s*=\s*([\d,]+)",
-            'reads_aligned_overlapping_exon': r"overlapping exon\s*=\s*([\d,]+)",
-        }
         for f in self.find_log_files(
-                'rnaseq_post_alignment_qc/rnaseq_qc/rnaseq_qc_results'):
-            d = dict()
-
-            # Get the sample name
-            s_name_regex = re.search(r"bam file\s*=\s*(.+)", f['f'],
-                                     re.MULTILINE)
-            if s_name_regex:
-                d['bam_file'] = s_name_regex.group(1)
-                s_name = self.clean_s_name(d['bam_file'], f['root'])
-            else:
-                log.warn(
-                    "Couldn't find an input filename in genome_results file {}/{}"
-                    .format(f['root'], f['fn']))
+                'rnaseq_post_alignment_qc/rnaseq_qc/rnaseq_qc_results',
+                filecontents=False):
+            d = self.rnaseq_results(f)
+            if d is None:
                 return None
-
-            # Check for and 'fix' European style decimal places / thousand separators
-            comma_regex = re.search(r"exonic\s*=\s*[\d\.]+ \(\d{1,3},\d+%\)",
-                                    f['f'], re.MULTILINE)
-            if comma_regex:
-                log.debug(
-                    "Trying to fix European comma style syntax in Qualimap report {}/{}"
-                    .format(f['root'], f['fn']))
-                f['f'] = f['f'].replace('.', '')
-                f['f'] = f['f'].replace(',', '.')
-
-            # Go through all numeric regexes
-            for k, r in regexes.items():
-                r_search = re.search(r, f['f'], re.MULTILINE)
-                if r_search:
-                    try:
-                        d[k] = float(r_search.group(1).replace(',', ''))
-                    except UnicodeEncodeError:
-                        # Qualimap reports infinity (\u221e) when 3' bias denominator is zero
-                        pass
-                    except ValueError:
-                        d[k] = r_search.group(1)
+            s_name = self.clean_s_name(d['bam_file'], f['root'])
 
             # Save results
             if s_name in self.qualimap_rnaseq_genome_results:
@@ -250,16 +179,8 @@ class MultiqcModule(BaseMultiqcModule):
                 'rnaseq_post_alignment_qc/rnaseq_qc/coverage',
                 filehandles=True):
             s_name = self.get_s_name(f)
-            d = dict()
-            for l in f['f']:
-                if l.startswith('#'):
-                    continue
-                coverage, count = l.split(None, 1)
-                coverage = int(round(float(coverage)))
-                count = float(count)
-                d[coverage] = count
-
-            if len(d) == 0:
+            hist = Histogram.from_file(f['f'])
+            if len(hist) == 0:
                 log.debug(
                     "Couldn't parse contents of coverage histogram file {}".
                     format(f['fn']))
@@ -270,7 +191,7 @@ class MultiqcModule(BaseMultiqcModule):
                 log.debug(
                     "Duplicate coverage histogram sample name found! Overwriting: {}"
                     .format(s_name))
-            self.qualimap_rnaseq_cov_hist[s_name] = d
+            self.qualimap_rnaseq_cov_hist[s_name] = hist
             self.add_data_source(f,
                                  s_name=s_name,
                                  section='rna_coverage_histogram')
@@ -367,7 +288,9 @@ class MultiqcModule(BaseMultiqcModule):
                 'Mean distribution of coverage depth across the length of all mapped transcripts.',
                 helptext=coverage_profile_helptext,
                 plot=linegraph.plot(
-                    self.qualimap_rnaseq_cov_hist, {
+                    downsample_plot_data(
+                        dict((s_name, hist.to_dict()) for s_name, hist in
+                             self.qualimap_rnaseq_cov_hist.items())), {
                         'id': 'qualimap_gene_coverage_profile',
                         'title':
                         'Qualimap RNAseq: Coverage Profile Along Genes (total)',
@@ -4,24 +4,26 @@
 from __future__ import print_function
 from collections import OrderedDict
 import logging
-import pandas as pd
-import numpy as np
 import os
 import zipfile
-import re
 import json
 from collections import defaultdict
-import plotly.express as px
-import plotly.figure_factory as ff
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 from multiqc import config
 from multiqc.plots import scatter, linegraph, table
 from multiqc.modules.base_module import BaseMultiqcModule
-from quartet_rnaseq_report.modules.plotly import plot as plotly_plot
+from quartet_rnaseq_report.modules.cache import ParseCache
 
 # Initialise the main MultiQC logger
 log = logging.getLogger('multiqc')
 
+# Change it when parse_fastqc_data returns something else, the cached reports are parsed again.
+FASTQC_PARSER_VERSION = 2
+# The sections kept as tables, the statuses of all sections are kept
+FASTQC_TABLES = ['per_base_sequence_quality']
+
 
 class MultiqcModule(BaseMultiqcModule):
     def __init__(self):
@@ -48,33 +50,34 @@ class MultiqcModule(BaseMultiqcModule):
                                        os.path.dirname(f['root']))
             self.parse_fastqc_report(f['f'], s_name, f)
 
-        # Find and parse zipped FastQC reports
+        # Find and parse zipped FastQC reports, the zips are read by a pool of threads
+        zip_files = list()
+        seen = set(self.fastqc_data.keys())
         for f in self.find_log_files('rnaseq_raw_qc/zip', filecontents=False):
             s_name = f['fn']
             if s_name.endswith('_fastqc.zip'):
                 s_name = s_name[:-11]
-            # Skip if we already have this report - parsing zip files is slow..
-            if s_name in self.fastqc_data.keys():
+            # Skip if we already have this report, or another zip of this sample
+            if s_name in seen:
                 log.debug("Skipping '{}' as already parsed '{}'".format(
                     f['fn'], s_name))
                 continue
-            try:
-                fqc_zip = zipfile.ZipFile(os.path.join(f['root'], f['fn']))
-            except Exception as e:
-                log.warning("Couldn't read '{}' - Bad zip file".format(
-                    f['fn']))
-                log.debug("Bad zip file error:\n{}".format(e))
-                continue
-            # FastQC zip files should have just one directory inside, containing report
-            d_name = fqc_zip.namelist()[0]
-            try:
-                with fqc_zip.open(os.path.join(d_name,
-                                               'fastqc_data.txt')) as fh:
-                    r_data = fh.read().decode('utf8')
-                    self.parse_fastqc_report(r_data, s_name, f)
-            except KeyError:
-                log.warning(
-                    "Error - can't find fastqc_raw_data.txt in {}".format(f))
+            seen.add(s_name)
+            zip_files.append((f, s_name))
+        cache = ParseCache('fastqc', FASTQC_PARSER_VERSION)
+        with ThreadPoolExecutor() as executor:
+            results = executor.map(lambda z: load_fastqc_zip(os.path.join(z[0]['root'], z[0]['fn']), cache),
+                                   zip_files)
+            for (f, s_name), (status, result) in zip(zip_files, results):
+                if status == 'bad_zip':
+                    log.warning("Couldn't read '{}' - Bad zip file".format(
+                        f['fn']))
+                    log.debug("Bad zip file error:\n{}".format(result))
+                elif status == 'missing':
+                    log.warning(
+                        "Error - can't find fastqc_raw_data.txt in {}".format(f))
+                else:
+                    self.add_fastqc_report(result, s_name, f)
 
         # Filter to strip out ignored sample names
         self.fastqc_data = self.ignore_samples(self.fastqc_data)
@@ -112,10 +115,11 @@ class MultiqcModule(BaseMultiqcModule):
         # Filter to strip out ignored sample names
         self.fq_screen_data = self.ignore_samples(self.fq_screen_data)
 
+        # The quick look (rseqc.py quicklook) only makes fastqc_data.txt files
         if len(self.fq_screen_data) == 0:
-            raise UserWarning
-
-        log.info("Found {} reports".format(len(self.fq_screen_data)))
+            log.debug('No file matched: rnaseq_raw_qc - *_screen.txt')
+        else:
+            log.info("Found {} reports".format(len(self.fq_screen_data)))
 
         # Check whether we have a consistent number of organisms across all samples
         num_orgs = set([len(orgs) for orgs in self.fq_screen_data.values()])
@@ -162,86 +166,21 @@ class MultiqcModule(BaseMultiqcModule):
 
     def parse_fastqc_report(self, file_contents, s_name=None, f=None):
         """ Takes contents from a fastq_data.txt file and parses out required
-        statistics and data. Returns a dict with keys 'stats' and 'data'.
-        Data is for plotting graphs, stats are for top table. """
+        statistics and data. """
+        self.add_fastqc_report(parse_fastqc_data(file_contents), s_name, f)
+
+    def add_fastqc_report(self, parsed, s_name=None, f=None):
+        """ Add a report parsed by parse_fastqc_data """
 
         # Make the sample name from the input filename if we find it
-        fn_search = re.search(r"Filename\s+(.+)", file_contents)
-        if fn_search:
-            s_name = self.clean_s_name(fn_search.group(1), f['root'])
+        if parsed['filename']:
+            s_name = self.clean_s_name(parsed['filename'], f['root'])
 
         if s_name in self.fastqc_data.keys():
             log.debug(
                 "Duplicate sample name found! Overwriting: {}".format(s_name))
         self.add_data_source(f, s_name)
-        self.fastqc_data[s_name] = {'statuses': dict()}
-
-        # Parse the report
-        section = None
-        s_headers = None
-        self.dup_keys = []
-        for l in file_contents.splitlines():
-            if l == '>>END_MODULE':
-                section = None
-                s_headers = None
-            elif l.startswith('>>'):
-                (section, status) = l[2:].split("\t", 1)
-                section = section.lower().replace(' ', '_')
-                self.fastqc_data[s_name]['statuses'][section] = status
-            elif section is not None:
-                if l.startswith('#'):
-                    s_headers = l[1:].split("\t")
-                    # Special case: Total Deduplicated Percentage header line
-                    if s_headers[0] == 'Total Deduplicated Percentage':
-                        self.fastqc_data[s_name]['basic_statistics'].append({
-                            'measure':
-                            'total_deduplicated_percentage',
-                            'value':
-                            float(s_headers[1])
-                        })
-                    else:
-                        # Special case: Rename dedup header in old versions of FastQC (v10)
-                        if s_headers[1] == 'Relative count':
-                            s_headers[1] = 'Percentage of total'
-                        s_headers = [
-                            s.lower().replace(' ', '_') for s in s_headers
-                        ]
-                        self.fastqc_data[s_name][section] = list()
-
-                elif s_headers is not None:
-                    s = l.split("\t")
-                    row = dict()
-                    for (i, v) in enumerate(s):
-                        v.replace('NaN', '0')
-                        try:
-                            v = float(v)
-                        except ValueError:
-                            pass
-                        row[s_headers[i]] = v
-                    self.fastqc_data[s_name][section].append(row)
-                    # Special case - need to remember order of duplication keys
-                    if section == 'sequence_duplication_levels':
-                        try:
-                            self.dup_keys.append(float(s[0]))
-                        except ValueError:
-                            self.dup_keys.append(s[0])
-
-        # Tidy up the Basic Stats
-        self.fastqc_data[s_name]['basic_statistics'] = {
-            d['measure']: d['value']
-            for d in self.fastqc_data[s_name]['basic_statistics']
-        }
-
-        # Calculate the average sequence length (Basic Statistics gives a range)
-        length_bp = 0
-        total_count = 0
-        for d in self.fastqc_data[s_name].get('sequence_length_distribution',
-                                              {}):
-            length_bp += d['count'] * self.avg_bp_from_range(d['length'])
-            total_count += d['count']
-        if total_count > 0:
-            self.fastqc_data[s_name]['basic_statistics'][
-                'avg_sequence_length'] = length_bp / total_count
+        self.fastqc_data[s_name] = parsed['data']
 
     def pre_aligment_stats(self):
         """ Add some single-number stats to the basic statistics
@@ -314,11 +253,8 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    self.avg_bp_from_range(d['base']): d['mean']
-                    for d in self.fastqc_data[s_name]
-                    ['per_base_sequence_quality']
-                }
+                quality = self.fastqc_data[s_name]['per_base_sequence_quality']
+                data[s_name] = dict(zip(quality['position'].tolist(), quality['mean'].tolist()))
             except KeyError:
                 pass
         if len(data) == 0:
@@ -378,18 +314,7 @@ class MultiqcModule(BaseMultiqcModule):
             plot=linegraph.plot(data, pconfig))
 
     def avg_bp_from_range(self, bp):
-        """" Helper function - FastQC often gives base pair ranges (eg. 10-15)
-        which are not helpful when plotting. This returns the average from such
-        ranges as an int, which is helpful. If not a range, just returns the int. """
-
-        try:
-            if '-' in bp:
-                maxlen = float(bp.split("-", 1)[1])
-                minlen = float(bp.split("-", 1)[0])
-                bp = ((maxlen - minlen) / 2) + minlen
-        except TypeError:
-            pass
-        return (int(bp))
+        return avg_bp_from_range(bp)
 
     def get_status_cols(self, section):
         """ Helper function - returns a list of colours according to the FastQC
@@ -498,3 +423,136 @@ class MultiqcModule(BaseMultiqcModule):
                 except KeyError:
                     pass
         return totals
+
+
+def avg_bp_from_range(bp):
+    """" Helper function - FastQC often gives base pair ranges (eg. 10-15)
+    which are not helpful when plotting. This returns the average from such
+    ranges as an int, which is helpful. If not a range, just returns the int. """
+
+    try:
+        if '-' in bp:
+            maxlen = float(bp.split("-", 1)[1])
+            minlen = float(bp.split("-", 1)[0])
+            bp = ((maxlen - minlen) / 2) + minlen
+    except TypeError:
+        pass
+    return (int(bp))
+
+
+def parse_fastqc_table(lines, text_columns=('base', 'length')):
+    """ Takes the lines of a section (the header first) and returns a dict of NumPy
+    columns, the numbers are floats and the others (and the text_columns, e.g. the
+    ranges of bases) are strings. """
+
+    headers = [h.lower().replace(' ', '_') for h in lines[0][1:].split('\t')]
+    rows = np.array([l.split('\t') for l in lines[1:]], dtype=str).reshape(-1, len(headers))
+    table = dict()
+    for i, header in enumerate(headers):
+        try:
+            if header not in text_columns:
+                table[header] = rows[:, i].astype(np.float64)
+                continue
+        except ValueError:
+            pass
+        # A new array as wide as its longest string, a slice would keep all rows alive
+        table[header] = np.array(rows[:, i].tolist())
+    return table
+
+
+def parse_fastqc_data(file_contents):
+    """ Takes contents from a fastq_data.txt file and parses out the statistics and the
+    sections used by the report in one pass, the other sections are skipped. Returns a dict
+    with the filename in the report and the data: the statuses, the basic statistics and the
+    tables in FASTQC_TABLES. """
+
+    fastqc_data = {'statuses': dict(), 'basic_statistics': dict()}
+    filename = None
+    avg_sequence_length = None
+    # The sections are found by the '\n>>' before them
+    file_contents = '\n' + file_contents
+    pos = 0
+    while True:
+        pos = file_contents.find('\n>>', pos)
+        if pos == -1:
+            break
+        line_end = file_contents.find('\n', pos + 1)
+        header = file_contents[pos + 3:line_end if line_end != -1 else None]
+        pos = line_end if line_end != -1 else len(file_contents)
+        if header == 'END_MODULE' or '\t' not in header:
+            continue
+
+        (section, status) = header.split('\t', 1)
+        section = section.lower().replace(' ', '_')
+        fastqc_data['statuses'][section] = status
+
+        module_end = file_contents.find('\n>>END_MODULE', pos)
+        if module_end == -1:
+            module_end = len(file_contents)
+        if section not in ('basic_statistics', 'sequence_length_distribution', 'sequence_duplication_levels') \
+                and section not in FASTQC_TABLES:
+            pos = module_end
+            continue
+
+        lines = file_contents[pos + 1:module_end].splitlines()
+        pos = module_end
+        if section == 'basic_statistics':
+            for l in lines[1:]:
+                measure, value = l.split('\t', 1)
+                if measure == 'Filename':
+                    filename = value
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+                fastqc_data['basic_statistics'][measure] = value
+        elif section == 'sequence_duplication_levels':
+            # Special case: Total Deduplicated Percentage header line
+            if lines and lines[0].startswith('#Total Deduplicated Percentage'):
+                fastqc_data['basic_statistics']['total_deduplicated_percentage'] = float(lines[0].split('\t')[1])
+        elif section == 'sequence_length_distribution':
+            # Calculate the average sequence length (Basic Statistics gives a range)
+            table = parse_fastqc_table(lines)
+            total_count = table['count'].sum()
+            if total_count > 0:
+                lengths = np.array([avg_bp_from_range(l) for l in table['length']])
+                avg_sequence_length = float((table['count'] * lengths).sum() / total_count)
+        else:
+            table = parse_fastqc_table(lines)
+            if 'base' in table:
+                table['position'] = np.array([avg_bp_from_range(b) for b in table['base']])
+            fastqc_data[section] = table
+
+    if avg_sequence_length is not None:
+        fastqc_data['basic_statistics']['avg_sequence_length'] = avg_sequence_length
+
+    return {
+        'filename': filename,
+        'data': fastqc_data
+    }
+
+
+def load_fastqc_zip(fpath, cache):
+    """ Read and parse the fastqc_data.txt in a FastQC zip, or load it from the cache.
+    Returns (status, result), the status is one of ok, bad_zip and missing. """
+
+    parsed = cache.get(fpath)
+    if parsed is not None:
+        return 'ok', parsed
+
+    try:
+        fqc_zip = zipfile.ZipFile(fpath)
+    except Exception as e:
+        return 'bad_zip', e
+
+    with fqc_zip:
+        # FastQC zip files should have just one directory inside, containing report
+        d_name = fqc_zip.namelist()[0]
+        try:
+            r_data = fqc_zip.read(os.path.join(d_name, 'fastqc_data.txt')).decode('utf8')
+        except KeyError:
+            return 'missing', None
+
+    parsed = parse_fastqc_data(r_data)
+    cache.put(fpath, parsed)
+    return 'ok', parsed
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+""" Run the modules of the report in parallel
+
+MultiQC runs the modules one after another, but the modules of this plugin only read
+their own files. Before the modules are run, the plugin modules are run in forked
+worker processes, and then MultiQC loads the results in its own order: every module is
+replaced by a stub which returns the module object made by the worker, so the sections,
+the data sources and the plots are merged in the order of config.module_order.
+"""
+
+from __future__ import print_function
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import logging
+import multiprocessing
+import time
+import traceback
+import types
+
+from multiqc.utils import config, report
+
+log = logging.getLogger('multiqc')
+
+# The modules are started in this order, the long ones first
+LONG_MODULES = ['rnaseq_raw_qc', 'rnaseq_post_alignment_qc']
+# MultiQC reads these attributes of a module after it's run, the parsed data stays in the worker
+MODULE_ATTRIBUTES = ['name', 'anchor', 'href', 'info', 'comment', 'extra', 'mname', 'intro', 'sections', 'css', 'js']
+
+
+def _report_state():
+    return dict((key, value) for key, value in vars(report).items()
+                if not key.startswith('__') and not isinstance(value, (types.ModuleType, types.FunctionType, type))
+                and key not in ('files', 'searchfiles', 'file_search_stats', 'runtimes', 'logger'))
+
+
+def _config_state():
+    # The plots set a few options of the config when they are made, e.g. the number formats of the tables
+    return dict((key, value) for key, value in vars(config).items()
+                if not key.startswith('__') and (value is None or isinstance(value, (str, int, float, bool))))
+
+
+def _plain(value):
+    """Convert the nested defaultdicts (their factories are lambdas) to dicts, so they can be pickled."""
+    if isinstance(value, dict):
+        return dict((k, _plain(v)) for k, v in value.items())
+    return value
+
+
+def _changes(before, after):
+    """The items a module adds to the report state."""
+    changes = dict()
+    for key, value in after.items():
+        old = before.get(key)
+        if isinstance(value, list):
+            added = value[len(old or []):]
+            if added:
+                changes[key] = added
+        elif isinstance(value, dict):
+            added = dict((k, _plain(v)) for k, v in value.items() if k not in (old or {}))
+            if added:
+                changes[key] = added
+        elif isinstance(value, int) and not isinstance(value, bool):
+            if value != (old or 0):
+                changes[key] = value - (old or 0)
+        elif value != old:
+            changes[key] = value
+    return changes
+
+
+def _merge_dict(current, value):
+    for k, v in value.items():
+        if isinstance(v, dict) and (isinstance(current.get(k), dict) or isinstance(current, defaultdict)):
+            _merge_dict(current[k], v)
+        else:
+            current[k] = v
+
+
+def _merge(changes):
+    for key, value in changes.items():
+        current = getattr(report, key, None)
+        if isinstance(current, list):
+            current.extend(value)
+        elif isinstance(current, dict):
+            _merge_dict(current, value)
+        elif isinstance(current, int) and not isinstance(current, bool):
+            setattr(report, key, current + value)
+        else:
+            setattr(report, key, value)
+
+
+def _portable(module):
+    """A copy of the module with the attributes used by MultiQC, they can be sent back to MultiQC."""
+    copied = module.__class__.__new__(module.__class__)
+    for key in MODULE_ATTRIBUTES:
+        if hasattr(module, key):
+            setattr(copied, key, getattr(module, key))
+    return copied
+
+
+def _run_module(name):
+    """Run a module in a worker, returns (status, output, (report changes, config changes), seconds)."""
+    started = time.time()
+    before = dict((key, copy.copy(value)) for key, value in _report_state().items())
+    config_before = _config_state()
+    try:
+        entry_point = config.avail_modules[name]
+        mod = entry_point.load()
+        mod.mod_cust_config = {}
+        output = mod()
+        output = [_portable(m) for m in output] if isinstance(output, list) else _portable(output)
+        status = 'ok'
+    except UserWarning:
+        output, status = None, 'warning'
+    except Exception:
+        output, status = traceback.format_exc(), 'error'
+    changes, config_changes = dict(), dict()
+    if status == 'ok':
+        changes = _changes(before, _report_state())
+        config_changes = dict((key, value) for key, value in _config_state().items()
+                              if key not in config_before or config_before[key] != value)
+    return status, output, (changes, config_changes), time.time() - started
+
+
+class PrecomputedModule:
+    """It looks like an entry point of MultiQC, and its module returns the output of a worker."""
+
+    def __init__(self, name, result):
+        self.name = name
+        self.result = result
+
+    def load(self):
+        return self
+
+    def __call__(self):
+        status, output, changes, seconds = self.result
+        if status == 'warning':
+            raise UserWarning
+        if status == 'error':
+            raise Exception('The module {} failed in a worker:\n{}'.format(self.name, output))
+
+        report_changes, config_changes = changes
+        _merge(report_changes)
+        for key, value in config_changes.items():
+            setattr(config, key, value)
+        return output
+
+
+def selected_modules():
+    """The plugin modules which MultiQC will run."""
+    names = [list(m.keys())[0] if isinstance(m, dict) else m for m in config.module_order]
+    names = [name for name in names if name.startswith('rnaseq_') and name in config.avail_modules]
+    if len(getattr(config, 'run_modules', [])) > 0:
+        names = [name for name in names if name in config.run_modules]
+    return [name for name in names if name not in getattr(config, 'exclude_modules', [])]
+
+
+def run_modules_in_parallel(workers):
+    """Run the plugin modules in a pool of forked workers and put the results in config.avail_modules."""
+    names = selected_modules()
+    if workers < 2 or len(names) < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        return
+
+    started = time.time()
+    order = sorted(names, key=lambda name: LONG_MODULES.index(name) if name in LONG_MODULES else len(LONG_MODULES))
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=min(workers, len(names)), mp_context=context) as executor:
+        futures = dict((name, executor.submit(_run_module, name)) for name in order)
+        for name in names:
+            try:
+                result = futures[name].result()
+            except Exception:
+                # e.g. the output cannot be pickled, MultiQC runs it again in this process.
+                log.debug('Cannot run {} in a worker:\n{}'.format(name, traceback.format_exc()))
+                continue
+            config.avail_modules[name] = PrecomputedModule(name, result)
+            log.debug('{} is run in a worker in {:.2f} seconds.'.format(name, result[3]))
+
+    log.info('Run {} modules with {} workers in {:.2f} seconds.'.format(len(names), min(workers, len(names)),
+                                                                         time.time() - started))
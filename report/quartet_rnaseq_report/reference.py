@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+""" The reference store of the historical batches
+
+The historical batches (ref_data_qc_value.csv of exp2qcdt) and the reference fold-changes
+(ref_data_fc_value.csv) are kept in a columnar store which is memory-mapped, instead of
+being parsed from CSV on every run. A store is a directory:
+
+* manifest.json: the format, the version of the store, the chunks of every table and
+  the chunks retired by the last compact
+* <table>/<chunk>/<column>.npy: a column of a chunk, numbers as float64 and strings as
+  fixed-width unicode, both can be memory-mapped by numpy
+
+Newly accepted batches are appended as a new chunk, the store is not rewritten. The
+chunk is written first and the manifest is replaced after it, so a reader sees either
+the former or the new version. `compact` merges the chunks of a store which has grown
+by many appends. The merged chunks are only retired in the manifest, as the readers of
+the former version may still load them, and are removed by the next compact.
+
+    quartet-rnaseq-reference import --qc-value ref_data_qc_value.csv --fc-value ref_data_fc_value.csv
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sys
+
+import click
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+LOCK = '.lock'
+# The Dockerfile builds the store of exp2qcdt/data into the conda environment
+DEFAULT_STORE = os.environ.get('QUARTET_REFERENCE_STORE',
+                               os.path.join(sys.prefix, 'share', 'quartet_rnaseq_report', 'reference'))
+
+SCHEMAS = {
+    'qc_value': OrderedDict([
+        ('batch', 'str'),
+        ('SNR', 'float64'),
+        ('RC', 'float64'),
+        ('total_score', 'float64'),
+        ('MCC_of_refDEG', 'float64'),
+        ('Quality', 'str'),
+    ]),
+    'fc_value': OrderedDict([
+        ('gene', 'str'),
+        ('compare', 'str'),
+        ('medianP', 'float64'),
+        ('meanlogFC', 'float64'),
+        ('DEGtype', 'str'),
+        ('Gene_Name', 'str'),
+    ]),
+}
+# A row is appended once
+KEYS = {
+    'qc_value': ['batch'],
+    'fc_value': ['gene', 'compare'],
+}
+
+
+def read_csv(fpath, name):
+    """ The columns of a CSV file of exp2qcdt/data, name is the key of its schema. """
+    import pandas as pd
+
+    schema = SCHEMAS[name]
+    # The numbers of ref_data_qc_value.csv have trailing spaces
+    df = pd.read_csv(fpath, dtype=dict((column, str) for column in schema))
+    missing = [column for column in schema if column not in df.columns]
+    if missing:
+        raise Exception('{} has no column {}.'.format(fpath, ', '.join(missing)))
+
+    columns = OrderedDict()
+    for column, dtype in schema.items():
+        values = df[column].fillna('').str.strip()
+        if dtype == 'str':
+            columns[column] = np.asarray(values.tolist(), dtype=str)
+        else:
+            try:
+                columns[column] = pd.to_numeric(values.replace('', np.nan)).values.astype(dtype)
+            except ValueError as e:
+                raise Exception('Could not read the column {} of {}: {}'.format(column, fpath, e))
+    return columns
+
+
+def row_keys(columns, name):
+    return set(zip(*[columns[column].tolist() for column in KEYS[name]]))
+
+
+class ReferenceStore(object):
+    """ A store opened for reading, the columns are memory-mapped when they are used. """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        manifest_fpath = os.path.join(path, MANIFEST)
+        if not os.path.exists(manifest_fpath):
+            raise Exception('{} is not a reference store, create it with `quartet-rnaseq-reference import`.'.format(path))
+        with open(manifest_fpath) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != FORMAT_VERSION:
+            raise Exception('The reference store {} has the format {}, {} is supported.'.format(
+                path, self.manifest.get('format'), FORMAT_VERSION))
+        self._columns = dict()
+
+    @classmethod
+    def create(cls, path=DEFAULT_STORE):
+        """ An empty store, or the store at path if there is one. """
+        if not os.path.exists(os.path.join(path, MANIFEST)):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            write_manifest(path, {
+                'format': FORMAT_VERSION,
+                'version': 0,
+                'tables': dict((name, {'columns': schema, 'chunks': []}) for name, schema in SCHEMAS.items()),
+            })
+        return cls(path)
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    def rows(self, name):
+        return sum(chunk['rows'] for chunk in self.manifest['tables'][name]['chunks'])
+
+    def column(self, name, column):
+        """ The values of a column, a memory-mapped array if the table has one chunk. """
+        key = (name, column)
+        if key not in self._columns:
+            if column not in SCHEMAS[name]:
+                raise Exception('The table {} has no column {}.'.format(name, column))
+            chunks = [np.load(os.path.join(self.path, name, chunk['id'], column + '.npy'), mmap_mode='r')
+                      for chunk in self.manifest['tables'][name]['chunks']]
+            if not chunks:
+                self._columns[key] = np.array([], dtype=SCHEMAS[name][column])
+            elif len(chunks) == 1:
+                self._columns[key] = chunks[0]
+            else:
+                self._columns[key] = np.concatenate(chunks)
+        return self._columns[key]
+
+    def columns(self, name):
+        return OrderedDict((column, self.column(name, column)) for column in SCHEMAS[name])
+
+    def frame(self, name):
+        """ The table as a DataFrame, like the CSV file read by read_ref_data of exp2qcdt. """
+        import pandas as pd
+
+        return pd.DataFrame(self.columns(name))
+
+    def append(self, name, columns):
+        """ Add the rows of a table as a new chunk, returns the new version of the store. """
+        rows = set(len(values) for values in columns.values())
+        if len(rows) != 1:
+            raise Exception('The columns of {} have different lengths.'.format(name))
+        rows = rows.pop()
+        if rows == 0:
+            return self.version
+
+        with open(os.path.join(self.path, LOCK), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have appended to the store since it was opened
+            self.__init__(self.path)
+            duplicated = row_keys(columns, name) & row_keys(self.columns(name), name)
+            if duplicated:
+                raise Exception('The reference store {} has the rows {} of {} already.'.format(
+                    self.path, ', '.join('/'.join(key) for key in sorted(duplicated)[:5]), name))
+
+            version = self.version + 1
+            chunk_id = '{:06d}'.format(version)
+            write_chunk(os.path.join(self.path, name), chunk_id, columns, SCHEMAS[name])
+            self.manifest['tables'][name]['chunks'].append({'id': chunk_id, 'rows': rows})
+            self.manifest['version'] = version
+            write_manifest(self.path, self.manifest)
+            self._columns = dict()
+
+        log.info('Appended {} rows of {} to {} (version {})'.format(rows, name, self.path, version))
+        return version
+
+    def compact(self):
+        """ Merge the chunks of every table into one, returns the new version of the store.
+
+        The chunks retired by the former compact are removed, the chunks merged now are
+        retired: a reader of the former version loads the columns when they are used.
+        """
+        with open(os.path.join(self.path, LOCK), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.__init__(self.path)
+            version = self.version + 1
+            chunk_id = '{:06d}'.format(version)
+            removed = self.manifest.get('retired', [])
+            retired = list()
+            for name, table in self.manifest['tables'].items():
+                if len(table['chunks']) < 2:
+                    continue
+                write_chunk(os.path.join(self.path, name), chunk_id, self.columns(name), SCHEMAS[name])
+                retired.extend({'table': name, 'id': chunk['id'], 'version': version} for chunk in table['chunks'])
+                table['chunks'] = [{'id': chunk_id, 'rows': self.rows(name)}]
+            if not retired and not removed:
+                return self.version
+            self.manifest['version'] = version
+            self.manifest['retired'] = retired
+            write_manifest(self.path, self.manifest)
+            self._columns = dict()
+
+            for chunk in removed:
+                shutil.rmtree(os.path.join(self.path, chunk['table'], chunk['id']), ignore_errors=True)
+        return version
+
+
+def write_chunk(table_dir, chunk_id, columns, schema):
+    """ The columns are written to a temporary directory which is renamed when it's complete.
+
+    The chunk ids are the versions after the version of the manifest, so a chunk with the
+    same id is left by a writer which failed before the manifest was replaced.
+    """
+    tmp_dir = os.path.join(table_dir, '.' + chunk_id)
+    chunk_dir = os.path.join(table_dir, chunk_id)
+    for orphan in [tmp_dir, chunk_dir]:
+        if os.path.exists(orphan):
+            log.warning('Remove {}, it was left by a failed write.'.format(orphan))
+            shutil.rmtree(orphan)
+    os.makedirs(tmp_dir)
+    for column, dtype in schema.items():
+        np.save(os.path.join(tmp_dir, column + '.npy'), np.asarray(columns[column], dtype=dtype))
+    os.rename(tmp_dir, chunk_dir)
+
+
+def write_manifest(path, manifest):
+    tmp_fpath = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp_fpath, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_fpath, os.path.join(path, MANIFEST))
+
+
+@click.group()
+def main():
+    """ The reference store of the historical batches. """
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+
+@main.command('import')
+@click.option('--qc-value', required=False, type=click.Path(exists=True, dir_okay=False),
+              help="The scores of the historical batches, like ref_data_qc_value.csv of exp2qcdt.")
+@click.option('--fc-value', required=False, type=click.Path(exists=True, dir_okay=False),
+              help="The reference fold-changes, like ref_data_fc_value.csv of exp2qcdt.")
+@click.option('--store', required=False, default=DEFAULT_STORE, show_default=True, type=click.Path(file_okay=False),
+              help="The reference store, it's created if it doesn't exist.")
+def import_csv(qc_value, fc_value, store):
+    """ Append the rows of CSV files to the store, e.g. the newly accepted batches. """
+    reference = ReferenceStore.create(store)
+    for name, fpath in [('qc_value', qc_value), ('fc_value', fc_value)]:
+        if fpath:
+            reference.append(name, read_csv(fpath, name))
+
+
+@main.command('info')
+@click.option('--store', required=False, default=DEFAULT_STORE, show_default=True, type=click.Path(file_okay=False),
+              help="The reference store.")
+def info(store):
+    """ Show the version and the tables of the store. """
+    reference = ReferenceStore(store)
+    print('Version: {}'.format(reference.version))
+    for name, table in sorted(reference.manifest['tables'].items()):
+        print('{}: {} rows in {} chunks'.format(name, reference.rows(name), len(table['chunks'])))
+
+
+@main.command('compact')
+@click.option('--store', required=False, default=DEFAULT_STORE, show_default=True, type=click.Path(file_okay=False),
+              help="The reference store.")
+def compact(store):
+    """ Merge the chunks of the store. """
+    ReferenceStore(store).compact()
+
+
+if __name__ == '__main__':
+    main()
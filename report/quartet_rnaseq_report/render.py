@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+""" Render a Quartet RNA-Seq report in the current process
+
+It's the python version of the quartet-rseqc-report jar (see src/quartet_rseqc_report/task.clj):
+collect the results of the workflow, run exp2qcdt and then MultiQC. MultiQC keeps its
+state in module globals, so the state is reset before and after every report, which
+allows one warm process to render many reports one after another.
+"""
+
+from __future__ import print_function
+from datetime import datetime
+from contextlib import contextmanager
+from importlib.metadata import version
+import copy
+import csv
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import threading
+import types
+from distutils import dir_util
+
+import pandas as pd
+import multiqc
+from multiqc.utils import config, report
+from multiqc.utils import log as multiqc_log
+
+from quartet_rnaseq_report.modules.rnaseq_performance_assessment.tables import clear_frames
+
+logger = logging.getLogger(__name__)
+
+# (the call directory of a task, the pattern of the files to keep, the destination directory)
+COPY_RULES = [
+    ('call-ballgown', r'.*\.txt', 'ballgown'),
+    ('call-count', r'.*gene_count_matrix\.csv', 'count'),
+    ('call-qualimapBAMqc', r'.*tar\.gz', 'results/post_alignment_qc/bam_qc'),
+    ('call-qualimapRNAseq', r'.*tar\.gz', 'results/post_alignment_qc/rnaseq_qc'),
+    ('call-fastqc', r'.*\.zip', 'results/rawqc/fastqc'),
+    ('call-fastqscreen', r'.*\.txt', 'results/rawqc/fastq_screen'),
+]
+# The optional files in the root of a workflow, every workflow has its own copy.
+WORKFLOW_FILES = [('pipeline_profile.json', 'results/pipeline_profile'),
+                  ('subsample.json', 'results/subsample')]
+
+_lock = threading.Lock()
+
+
+def _snapshot(module):
+    state = dict()
+    for key, value in vars(module).items():
+        if key.startswith('__') or isinstance(value, (types.ModuleType, types.FunctionType, type)):
+            continue
+        try:
+            state[key] = copy.deepcopy(value)
+        except Exception:
+            # e.g. loggers and file handles, they are not changed by a run
+            state[key] = value
+    return state
+
+
+def _restore(module, state):
+    for key in list(vars(module).keys()):
+        value = vars(module)[key]
+        if key not in state and not key.startswith('__') \
+                and not isinstance(value, (types.ModuleType, types.FunctionType, type)):
+            delattr(module, key)
+
+    for key, value in state.items():
+        try:
+            setattr(module, key, copy.deepcopy(value))
+        except Exception:
+            setattr(module, key, value)
+
+
+# The state of MultiQC before any report is rendered in this process
+_pristine_state = [(module, _snapshot(module)) for module in [config, report, multiqc_log]]
+
+
+@contextmanager
+def isolated_multiqc():
+    """Run MultiQC with a fresh copy of its global config and report state."""
+    with _lock:
+        multiqc_logger = logging.getLogger('multiqc')
+        handlers = list(multiqc_logger.handlers)
+        for module, state in _pristine_state:
+            _restore(module, state)
+        # copy_tree remembers the directories it made, they are removed when a report is overwritten.
+        if hasattr(getattr(dir_util, '_path_created', None), 'clear'):
+            dir_util._path_created.clear()
+        elif hasattr(dir_util.mkpath, 'cache_clear'):
+            dir_util.mkpath.cache_clear()
+        try:
+            yield
+        finally:
+            # MultiQC adds the console and the file handlers in every run
+            for handler in list(multiqc_logger.handlers):
+                if handler not in handlers:
+                    multiqc_logger.removeHandler(handler)
+                    handler.close()
+            for module, state in _pristine_state:
+                _restore(module, state)
+            # The tables read by the report, the next reports read other result directories
+            clear_frames()
+
+
+def run_multiqc(analysis_dir, output_dir, title='Quartet RNA report', **kwargs):
+    """Run MultiQC in the current process, returns the path of the report."""
+    options = dict(outdir=output_dir,
+                   title=title,
+                   report_comment='',
+                   filename='multiqc_report.html',
+                   template='quartet_rnaseq_report',
+                   force=True,
+                   kwargs={'disable_plugin': False})
+    options.update(kwargs)
+    with isolated_multiqc():
+        try:
+            result = multiqc.run(analysis_dir, **options)
+        except SystemExit as e:
+            raise Exception('MultiQC exits with the code {} when rendering {}.'.format(e.code, analysis_dir))
+
+    if result['sys_exit_code'] != 0:
+        raise Exception('MultiQC exits with the code {} when rendering {}.'.format(result['sys_exit_code'],
+                                                                                   analysis_dir))
+    return os.path.join(output_dir, options['filename'])
+
+
+def guess_separator(filepath):
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        header = f.readline()
+    return max(['\t', ',', ';', ' '], key=lambda sep: len(header.split(sep)))
+
+
+def filter_files(path, pattern):
+    if not os.path.exists(path):
+        return []
+    if os.path.isfile(path):
+        return [path] if re.fullmatch(pattern, path) else []
+
+    files = []
+    for root, dirs, filenames in os.walk(path):
+        dirs.sort()
+        files.extend([os.path.join(root, f) for f in sorted(filenames)
+                      if re.fullmatch(pattern, os.path.join(root, f))])
+    return files
+
+
+def copy_files(files, dest_dir):
+    os.makedirs(dest_dir, exist_ok=True)
+    for f in files:
+        # Keep the modification time, the parsed files are cached by it
+        shutil.copy2(f, os.path.join(dest_dir, os.path.basename(f)))
+
+
+def collect_results(data_dir, dest_dir):
+    """Copy the results of every workflow in the data directory."""
+    subdirs = sorted([os.path.join(data_dir, d) for d in os.listdir(data_dir)
+                      if os.path.isdir(os.path.join(data_dir, d))])
+    for subdir in subdirs:
+        for call, pattern, new_dir in COPY_RULES:
+            files = filter_files(os.path.join(subdir, call), pattern)
+            if len(files) == 0:
+                logger.warning('Cannot find any files with pattern {} in {}, please check your data.'.format(
+                    pattern, os.path.join(subdir, call)))
+            copy_files(files, os.path.join(dest_dir, new_dir))
+
+        for filename, new_dir in WORKFLOW_FILES:
+            if os.path.isfile(os.path.join(subdir, filename)):
+                copy_files([os.path.join(subdir, filename)],
+                           os.path.join(dest_dir, new_dir, os.path.basename(subdir)))
+
+
+def merge_exp_files(files, output_file):
+    """Merge the expression tables of all samples by GENE_ID."""
+    tables = [pd.read_csv(f, sep=guess_separator(f), dtype=str).set_index('GENE_ID') for f in files]
+    if len(tables) == 0:
+        raise Exception('Cannot find any expression files to make {}.'.format(output_file))
+
+    merged = pd.concat(tables, axis=1, join='outer')
+    merged = merged.loc[:, ~merged.columns.duplicated(keep='last')]
+    merged = merged[sorted(merged.columns)].sort_index()
+    merged.to_csv(output_file, index_label='GENE_ID')
+
+
+def write_metadata(metadata_file, output_file):
+    with open(metadata_file, 'r', encoding='utf-8-sig') as f:
+        rows = list(csv.reader(f, delimiter=guess_separator(metadata_file)))
+
+    with open(output_file, 'w', newline='') as f:
+        csv.writer(f, delimiter='\t').writerows(rows)
+
+
+def call_exp2qcdt(exp_file, count_file, metadata_file, result_dir):
+    env = dict(os.environ, LC_ALL='en_US.utf-8', LANG='en_US.utf-8')
+    if os.path.exists('/venv/etc/Rprofile'):
+        env['R_PROFILE_USER'] = '/venv/etc/Rprofile'
+
+    proc = subprocess.run(['exp2qcdt.sh', '-e', exp_file, '-c', count_file, '-m', metadata_file, '-o', result_dir],
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+    if proc.returncode != 0:
+        raise Exception('exp2qcdt failed:\n{}'.format(proc.stdout.decode('utf-8', errors='replace')))
+
+
+def prepare_report(data_dir, metadata_file, output_dir, name='report', description='Quality control report'):
+    """Collect the results and make the input files of MultiQC, returns the result directory."""
+    result_dir = os.path.join(output_dir, 'results')
+    os.makedirs(result_dir, exist_ok=True)
+
+    collect_results(data_dir, output_dir)
+    exp_fpkm_file = os.path.join(output_dir, 'fpkm.csv')
+    exp_count_file = os.path.join(output_dir, 'count.csv')
+    merge_exp_files(filter_files(os.path.join(output_dir, 'ballgown'), r'.*'), exp_fpkm_file)
+    merge_exp_files(filter_files(os.path.join(output_dir, 'count'), r'.*'), exp_count_file)
+
+    metadata_copy = os.path.join(result_dir, 'metadata.csv')
+    write_metadata(metadata_file, metadata_copy)
+
+    for qc_dir in ['results/post_alignment_qc/bam_qc', 'results/post_alignment_qc/rnaseq_qc']:
+        for tar_file in filter_files(os.path.join(output_dir, qc_dir), r'.*tar\.gz'):
+            with tarfile.open(tar_file) as tar:
+                tar.extractall(os.path.dirname(tar_file))
+
+    call_exp2qcdt(exp_fpkm_file, exp_count_file, metadata_copy, result_dir)
+
+    with open(os.path.join(result_dir, 'general-info.json'), 'w') as f:
+        json.dump({
+            'Report Name': name,
+            'Description': description,
+            'Report Tool': 'quartet-rseqc-report-{}'.format(version('quartet_rnaseq_report')),
+            'Team': 'Quartet Team',
+            'Date': datetime.now().strftime('%Y-%m-%d')
+        }, f)
+
+    return result_dir
+
+
+def render_report(result_dir, metadata_file, output_dir, name='report', description='Quality control report'):
+    """Make a report from the results of the RNA-Seq workflow, returns the path of the report.
+
+    It can be called many times in one process, but the reports are rendered one by one,
+    use a process pool to render reports in parallel.
+    """
+    analysis_dir = prepare_report(result_dir, metadata_file, output_dir, name=name, description=description)
+    return run_multiqc(analysis_dir, output_dir)
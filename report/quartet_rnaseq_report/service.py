@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+""" A long-lived service which renders Quartet RNA-Seq reports
+
+The workers import MultiQC, pandas, plotly and the report modules once, and render the
+jobs one after another (see render.py for how the state of MultiQC is reset between
+reports). Jobs are submitted over HTTP on a local port or a Unix socket:
+
+    POST /jobs          {"result_dir": ..., "metadata_file": ..., "output_dir": ..., "name": ..., "description": ...}
+                        or {"analysis_dir": ..., "output_dir": ..., "title": ...} to only run MultiQC
+    GET  /jobs          all jobs
+    GET  /jobs/<id>     the status and the timings of a job
+    GET  /health        the number of workers and jobs
+
+A job is Queued until a worker picks it up, then Running until it's Succeeded or Failed.
+The finished jobs are kept for JOB_TTL seconds, and at most MAX_JOBS of them.
+
+The service and its client are the quartet-rnaseq-report command, e.g. the tservice plugin
+renders the results it prepared with `quartet-rnaseq-report multiqc`, which submits them to
+the service if it's running, or runs MultiQC in its own process otherwise.
+"""
+
+from __future__ import print_function
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+
+import click
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELDS = ['result_dir', 'metadata_file', 'output_dir']
+# A job of the results prepared by the client, only MultiQC is run
+MULTIQC_JOB_FIELDS = ['analysis_dir', 'output_dir']
+# The same service as `rseqc.py report`
+DEFAULT_ADDRESS = 'unix://' + os.path.join(os.path.expanduser('~'), '.cache', 'rseqc', 'report.sock')
+DEFAULT_TITLE = 'Quartet RNA report'
+JOB_TTL = 24 * 3600
+MAX_JOBS = 1000
+
+# The queue on which a worker reports the jobs it picks up, see _warm_worker
+_started_jobs = None
+
+
+def _warm_worker(started_jobs=None):
+    """Import everything used by a report before the first job comes."""
+    global _started_jobs
+    _started_jobs = started_jobs
+    import plotly.express  # noqa: F401
+    from quartet_rnaseq_report import render  # noqa: F401
+    from quartet_rnaseq_report.modules import (  # noqa: F401
+        rnaseq_data_generation_information, rnaseq_performance_assessment, rnaseq_raw_qc,
+        rnaseq_post_alignment_qc, rnaseq_pipeline_profile, rnaseq_supplementary)
+
+
+def _render(job):
+    from quartet_rnaseq_report.render import prepare_report, run_multiqc
+
+    started = time.time()
+    if _started_jobs is not None:
+        _started_jobs.put((job['id'], started))
+    if job.get('analysis_dir'):
+        report = run_multiqc(job['analysis_dir'], job['output_dir'], title=job.get('title', DEFAULT_TITLE), quiet=True)
+        return {'report': report, 'started': started, 'timings': {'multiqc': time.time() - started}}
+
+    analysis_dir = prepare_report(job['result_dir'], job['metadata_file'], job['output_dir'],
+                                  name=job.get('name', 'report'),
+                                  description=job.get('description', 'Quality control report'))
+    prepared = time.time()
+    report = run_multiqc(analysis_dir, job['output_dir'], quiet=True)
+    return {
+        'report': report,
+        'started': started,
+        'timings': {
+            'prepare': prepared - started,
+            'multiqc': time.time() - prepared
+        }
+    }
+
+
+class ReportService:
+    def __init__(self, workers=2, job_ttl=JOB_TTL, max_jobs=MAX_JOBS):
+        self.workers = workers
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.started_jobs = multiprocessing.Queue()
+        self.executor = self._new_executor()
+        self.jobs = dict()
+        self.lock = threading.Lock()
+        self.watcher = threading.Thread(target=self._watch, daemon=True)
+        self.watcher.start()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                   initargs=(self.started_jobs,))
+
+    def _watch(self):
+        """Mark the jobs which are picked up by the workers as Running."""
+        while True:
+            item = self.started_jobs.get()
+            if item is None:
+                return
+            job_id, started = item
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job and job['status'] == 'Queued':
+                    job.update(status='Running', started=started)
+
+    def _evict(self):
+        """Forget the finished jobs after job_ttl seconds, and the oldest ones beyond max_jobs."""
+        now = time.time()
+        finished = sorted([job for job in self.jobs.values() if job['finished']], key=lambda job: job['finished'])
+        for job in finished:
+            if now - job['finished'] > self.job_ttl or len(self.jobs) > self.max_jobs:
+                del self.jobs[job['id']]
+
+    def warm_up(self):
+        """Start all workers now, so the first jobs don't pay for the imports."""
+        for future in [self.executor.submit(time.sleep, 0) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, job):
+        fields = MULTIQC_JOB_FIELDS if job.get('analysis_dir') else JOB_FIELDS
+        missing = [field for field in fields if not job.get(field)]
+        if missing:
+            raise ValueError('{} must be specified.'.format(', '.join(missing)))
+
+        job = dict((key, job[key]) for key in fields + ['name', 'description', 'title'] if key in job)
+        job.update({
+            'id': uuid.uuid4().hex,
+            'status': 'Queued',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'report': None,
+            'error': None,
+            'timings': {}
+        })
+        with self.lock:
+            self._evict()
+            self.jobs[job['id']] = job
+            executor = self.executor
+
+        try:
+            future = executor.submit(_render, job)
+        except BrokenProcessPool:
+            # A worker was killed (e.g. out of memory), the jobs of the broken pool fail
+            # and the new jobs go to a new pool.
+            with self.lock:
+                if self.executor is executor:
+                    logger.warning('The workers are broken, start {} new workers.'.format(self.workers))
+                    self.executor = self._new_executor()
+                executor = self.executor
+            future = executor.submit(_render, job)
+        future.add_done_callback(lambda f: self._finish(job['id'], f))
+        return job
+
+    def _finish(self, job_id, future):
+        with self.lock:
+            job = self.jobs[job_id]
+            job['finished'] = time.time()
+            try:
+                result = future.result()
+                job.update(status='Succeeded', report=result['report'], started=result['started'])
+                job['timings'].update(result['timings'])
+            except Exception as e:
+                job.update(status='Failed', error=str(e))
+            if job['started']:
+                job['timings']['queue'] = job['started'] - job['submitted']
+            job['timings']['total'] = job['finished'] - job['submitted']
+            logger.info('Job {} is {} in {:.1f} seconds.'.format(job_id, job['status'].lower(),
+                                                                  job['timings']['total']))
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.started_jobs.put(None)
+        self.watcher.join()
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _reply(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            jobs = self.service.list()
+            self._reply(200, {'workers': self.service.workers,
+                              'queued': len([job for job in jobs if job['status'] == 'Queued']),
+                              'running': len([job for job in jobs if job['status'] == 'Running']),
+                              'jobs': len(jobs)})
+        elif self.path == '/jobs':
+            self._reply(200, self.service.list())
+        elif self.path.startswith('/jobs/'):
+            job = self.service.get(self.path[len('/jobs/'):])
+            if job:
+                self._reply(200, job)
+            else:
+                self._reply(404, {'error': 'No such job.'})
+        else:
+            self._reply(404, {'error': 'Not found.'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._reply(404, {'error': 'Not found.'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = self.service.submit(json.loads(self.rfile.read(length) or b'{}'))
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        self._reply(202, job)
+
+    def address_string(self):
+        # The client address of a Unix socket is an empty string
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            # Remove the socket left by a service which was killed
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def serve(address, workers=2):
+    """Serve the reports on a Unix socket (unix:///path/to/socket) or a local port (http://127.0.0.1:8765)."""
+    service = ReportService(workers=workers)
+    handler = type('Handler', (ReportRequestHandler,), {'service': service})
+    if address.startswith('unix://'):
+        path = address[len('unix://'):]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        server = UnixHTTPServer(path, handler)
+    else:
+        host, port = address.replace('http://', '').rsplit(':', 1)
+        server = ThreadingHTTPServer((host, int(port)), handler)
+
+    service.warm_up()
+    logger.info('The report service is listening on {} with {} workers.'.format(address, workers))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.shutdown()
+        if isinstance(server.server_address, str) and os.path.exists(server.server_address):
+            os.remove(server.server_address)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def request(address, method, path, data=None, timeout=10):
+    """Send a request to the service, returns the decoded response."""
+    if address.startswith('unix://'):
+        conn = UnixHTTPConnection(address[len('unix://'):], timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(address.replace('http://', '').rstrip('/'), timeout=timeout)
+    try:
+        body = json.dumps(data) if data is not None else None
+        conn.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        result = json.loads(response.read().decode('utf-8'))
+    finally:
+        conn.close()
+
+    if response.status >= 400:
+        raise Exception('The report service returns {}: {}'.format(response.status, result.get('error')))
+    return result
+
+
+def is_alive(address):
+    try:
+        request(address, 'GET', '/health')
+        return True
+    except (OSError, ValueError, http.client.HTTPException):
+        return False
+
+
+def wait(address, job_id, interval=1):
+    """Wait for a job to be Succeeded or Failed, returns the job."""
+    while True:
+        job = request(address, 'GET', '/jobs/{}'.format(job_id))
+        if job['status'] in ('Succeeded', 'Failed'):
+            return job
+        time.sleep(interval)
+
+
+@click.group()
+def main():
+    """ Render Quartet RNA-Seq reports, by a long-lived service if it's running. """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+
+@main.command('serve')
+@click.option('--address', '-a', required=False, default=DEFAULT_ADDRESS, show_default=True,
+              envvar='RSEQC_REPORT_SERVICE',
+              help="A Unix socket (unix:///path/to/socket) or a local port (http://127.0.0.1:8765).")
+@click.option('--workers', '-w', required=False, default=2, show_default=True, type=click.IntRange(min=1),
+              help="How many reports can be rendered at the same time.")
+def serve_command(address, workers):
+    """ Run the report service. """
+    try:
+        serve(address, workers=workers)
+    except KeyboardInterrupt:
+        logger.info('The report service is stopped.')
+
+
+@main.command('multiqc')
+@click.argument('analysis_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--output-dir', '-o', required=True, type=click.Path(file_okay=False),
+              help="A directory which will store the output report.")
+@click.option('--title', '-t', required=False, default=DEFAULT_TITLE, show_default=True,
+              help="The title of the report.")
+@click.option('--service', required=False, default=DEFAULT_ADDRESS, show_default=True,
+              envvar='RSEQC_REPORT_SERVICE',
+              help="The address of the report service, MultiQC is run by this command if it's not running.")
+def multiqc_command(analysis_dir, output_dir, title, service):
+    """ Render the report of a directory of prepared results (e.g. the results of exp2qcdt). """
+    if is_alive(service):
+        job = request(service, 'POST', '/jobs', {'analysis_dir': os.path.abspath(analysis_dir),
+                                                 'output_dir': os.path.abspath(output_dir),
+                                                 'title': title})
+        logger.info('Submit the job {} to the report service {}.'.format(job['id'], service))
+        job = wait(service, job['id'])
+        if job['status'] != 'Succeeded':
+            raise Exception('The report job {} is {}: {}'.format(job['id'], job['status'].lower(), job['error']))
+        report = job['report']
+    else:
+        from quartet_rnaseq_report.render import run_multiqc
+
+        report = run_multiqc(analysis_dir, output_dir, title=title)
+    logger.info('The report is saved to {}.'.format(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+""" Write a split output report
+
+The report is one self-contained HTML file by default, which can be sent by email. With
+--split-output (config.split_output) the report is a light HTML file, and the files it
+loads are written to a directory next to it (config.split_output_dir_name):
+
+* assets/: the scripts, stylesheets, fonts and images of the template, which the browser
+  caches across reports
+* sections/: the data of the plotly plots, fetched when a plot scrolls into view. They
+  are gzip files (.json.gz), unless config.plotly_payload is 'json'. A server which sends
+  them with Content-Encoding: gzip lets the browser decompress them, otherwise they are
+  decompressed by the DecompressionStream of the browser (see quartet_plotly.js)
+
+The files of the sections are named by their content, so the reports in a directory can
+share one files directory. The report has to be opened from a web server, browsers don't
+fetch files of a report opened from the disk.
+"""
+
+from __future__ import print_function
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from multiqc.utils import config
+
+log = logging.getLogger('multiqc')
+
+SECTIONS_DIR = 'sections'
+ASSETS_DIR = 'assets'
+
+
+def make_tmp_dir():
+    """ The section files are written here by the modules (and their workers) until the
+    report is written. """
+    config.split_output_tmp_dir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(config.split_output_tmp_dir, SECTIONS_DIR))
+
+
+def write_section_data(payload, ext):
+    """ Save the data of a section, returns its URL relative to the report. """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    fn = hashlib.sha1(payload).hexdigest()[:20] + ext
+    with open(os.path.join(config.split_output_tmp_dir, SECTIONS_DIR, fn), 'wb') as fh:
+        fh.write(payload)
+    return '/'.join([config.split_output_dir_name, SECTIONS_DIR, fn])
+
+
+def copy_split_output(template_dir):
+    """ Copy the assets of the template and the section files next to the report. """
+    output_dir = os.path.join(os.path.dirname(config.output_fn), config.split_output_dir_name)
+    shutil.copytree(os.path.join(template_dir, ASSETS_DIR), os.path.join(output_dir, ASSETS_DIR),
+                    dirs_exist_ok=True)
+    shutil.copytree(os.path.join(config.split_output_tmp_dir, SECTIONS_DIR), os.path.join(output_dir, SECTIONS_DIR),
+                    dirs_exist_ok=True)
+    shutil.rmtree(config.split_output_tmp_dir)
+    log.info("Files       : {}".format(os.path.relpath(output_dir)))
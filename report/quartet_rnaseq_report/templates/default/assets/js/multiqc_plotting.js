@@ -61,20 +61,21 @@ $(function () {
     }
   });
 
-  // Render plots on page load
-  $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').each(function(){
+  // Render plots on page load, the plotly plots are rendered when they scroll into view
+  // (quartet_plotly.js)
+  $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds):not(.plotly-plot)').each(function(){
     var target = $(this).attr('id');
     // Only one point per dataset, so multiply limit by arbitrary number.
     var max_num = mqc_config['num_datasets_plot_limit'] * 50;
     // Deferring each plot call prevents browser from locking up
     setTimeout(function(){
         plot_graph(target, undefined, max_num);
-        if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+        if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds):not(.plotly-plot)').length == 0){
           $('.mqc_loading_warning').hide();
         }
     }, 50);
   });
-  if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+  if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds):not(.plotly-plot)').length == 0){
     $('.mqc_loading_warning').hide();
   }
 
@@ -0,0 +1,201 @@
+////////////////////////////////////////////////
+// Plotly figure payloads Javascript Code
+////////////////////////////////////////////////
+
+// The typed arrays of the {dtype, bdata} spec of plotly.js
+var PLOTLY_DTYPES = {
+  'f8': Float64Array,
+  'f4': Float32Array,
+  'i4': Int32Array,
+  'u4': Uint32Array,
+  'i2': Int16Array,
+  'u2': Uint16Array,
+  'i1': Int8Array,
+  'u1': Uint8Array,
+  'u1c': Uint8ClampedArray
+};
+
+function base64ToBytes(text) {
+  var binary = atob(text);
+  var bytes = new Uint8Array(binary.length);
+  for (var i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return bytes;
+}
+
+// A plain array of a typed array spec, rounded to its significant digits
+function decodeTypedArray(spec) {
+  var bytes = base64ToBytes(spec.bdata);
+  var values = Array.prototype.slice.call(new PLOTLY_DTYPES[spec.dtype](bytes.buffer));
+  if (spec.digits) {
+    for (var i = 0; i < values.length; i++) {
+      if (isFinite(values[i])) {
+        values[i] = parseFloat(values[i].toPrecision(spec.digits));
+      }
+    }
+  }
+  if (spec.shape) {
+    var shape = String(spec.shape).split(',').map(Number);
+    if (shape.length == 2) {
+      var rows = [];
+      for (var r = 0; r < shape[0]; r++) {
+        rows.push(values.slice(r * shape[1], (r + 1) * shape[1]));
+      }
+      values = rows;
+    }
+  }
+  return values;
+}
+
+// The plotly.js of the report is older than the typed array spec, so the specs are decoded
+function decodeTypedArrays(obj) {
+  if (Array.isArray(obj)) {
+    for (var i = 0; i < obj.length; i++) {
+      obj[i] = decodeTypedArrays(obj[i]);
+    }
+  } else if (obj !== null && typeof obj === 'object') {
+    if (typeof obj.bdata === 'string' && typeof obj.dtype === 'string') {
+      return decodeTypedArray(obj);
+    }
+    for (var key in obj) {
+      if (obj.hasOwnProperty(key)) {
+        obj[key] = decodeTypedArrays(obj[key]);
+      }
+    }
+  }
+  return obj;
+}
+
+function gunzipBytes(bytes) {
+  if (typeof DecompressionStream === 'undefined') {
+    return Promise.reject(new Error('this browser can not decompress the figure, please use a recent browser.'));
+  }
+  var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+  return new Response(stream).text();
+}
+
+// The payload file of a split output report (see split_output.py)
+function fetchPayload(src) {
+  return fetch(src).then(function (response) {
+    if (!response.ok) {
+      throw new Error('could not load ' + src + ' (' + response.status + ')');
+    }
+    return response.arrayBuffer();
+  }).then(function (buffer) {
+    var bytes = new Uint8Array(buffer);
+    // The server may have decompressed a .gz file already (Content-Encoding: gzip)
+    if (bytes[0] == 0x1f && bytes[1] == 0x8b) {
+      return gunzipBytes(bytes);
+    }
+    return new TextDecoder().decode(bytes);
+  });
+}
+
+// A promise of the figure in the payload script (see modules/plotly.py)
+function loadPlotlyFigure(data_id) {
+  var element = document.getElementById(data_id);
+  var text = element.textContent;
+  var json;
+  if (element.getAttribute('data-src')) {
+    json = fetchPayload(element.getAttribute('data-src'));
+  } else if (element.getAttribute('data-encoding') == 'gzip') {
+    json = gunzipBytes(base64ToBytes(text.trim()));
+  } else {
+    json = Promise.resolve(text);
+  }
+  return json.then(function (text) {
+    return decodeTypedArrays(JSON.parse(text));
+  });
+}
+
+////////////////////////////////////////////////
+// Lazy rendering of the plotly plots
+////////////////////////////////////////////////
+
+// The payload of every plot which is not rendered yet, by the id of the plot
+var plotly_queue = {};
+// The plots in the viewport, and the plots resized while they were out of it
+var plotly_visible = {};
+var plotly_stale = {};
+var plotly_observer = null;
+
+function renderPlotlyPlot(id) {
+  var data_id = plotly_queue[id];
+  if (data_id === undefined) {
+    return;
+  }
+  delete plotly_queue[id];
+  loadPlotlyFigure(data_id).then(function (figure) {
+    figure.layout.autosize = true;
+    return Plotly.newPlot(id, figure.data, figure.layout);
+  }).then(function () {
+    // When plotly is working, hide something
+    $("#" + id).removeClass("not_rendered");
+    $("#" + id + " small").hide();
+  }).catch(function (err) {
+    $("#" + id + " small").text("Could not render the plot: " + err.message);
+  });
+}
+
+// update the layout to expand to the available size
+function relayoutPlotlyPlot(id) {
+  delete plotly_stale[id];
+  Plotly.relayout(id, {
+    "xaxis.autorange": true,
+    "yaxis.autorange": true
+  });
+}
+
+function observePlotlyPlots(entries) {
+  entries.forEach(function (entry) {
+    var id = entry.target.id;
+    if (!entry.isIntersecting) {
+      delete plotly_visible[id];
+      return;
+    }
+    plotly_visible[id] = true;
+    if (plotly_queue[id] !== undefined) {
+      renderPlotlyPlot(id);
+    } else if (plotly_stale[id]) {
+      relayoutPlotlyPlot(id);
+    }
+  });
+}
+
+// Called by the stub of modules/plotly.py, the plot is rendered when it scrolls into view
+function queuePlotlyPlot(id, data_id) {
+  plotly_queue[id] = data_id;
+  if (typeof IntersectionObserver === 'undefined') {
+    renderPlotlyPlot(id);
+    return;
+  }
+  if (plotly_observer === null) {
+    // Start a little before the plot is on the screen
+    plotly_observer = new IntersectionObserver(observePlotlyPlots, { rootMargin: '200px 0px' });
+  }
+  plotly_observer.observe(document.getElementById(id));
+}
+
+// Debounce the resize events, only the visible plots are relaid out
+var plotly_resize_timer = null;
+$(window).on('resize', function () {
+  clearTimeout(plotly_resize_timer);
+  plotly_resize_timer = setTimeout(function () {
+    $(".js-plotly-plot").each(function () {
+      var id = $(this).attr('id');
+      if (plotly_visible[id] || plotly_observer === null) {
+        relayoutPlotlyPlot(id);
+      } else {
+        plotly_stale[id] = true;
+      }
+    });
+  }, 150);
+});
+
+// Render all plots from header
+$(function () {
+  $('#mqc-render-all-plots').click(function () {
+    Object.keys(plotly_queue).forEach(renderPlotlyPlot);
+  });
+});
@@ -23,18 +23,31 @@ setup(
     include_package_data=True,
     install_requires=['multiqc==1.11', 'plotly>=4.9.0', 'pandas>=1.1.0'],
     entry_points={
+        'console_scripts': [
+            'quartet-rnaseq-reference = quartet_rnaseq_report.reference:main',
+            'quartet-rnaseq-assessment = quartet_rnaseq_report.assessment.commands:main',
+            'quartet-rnaseq-report = quartet_rnaseq_report.service:main'
+        ],
         'multiqc.modules.v1': [
             'rnaseq_data_generation_information = quartet_rnaseq_report.modules.rnaseq_data_generation_information:MultiqcModule',
             'rnaseq_performance_assessment = quartet_rnaseq_report.modules.rnaseq_performance_assessment:MultiqcModule',
             'rnaseq_raw_qc = quartet_rnaseq_report.modules.rnaseq_raw_qc:MultiqcModule',
             'rnaseq_post_alignment_qc = quartet_rnaseq_report.modules.rnaseq_post_alignment_qc:MultiqcModule',
+            'rnaseq_pipeline_profile = quartet_rnaseq_report.modules.rnaseq_pipeline_profile:MultiqcModule',
             'rnaseq_supplementary = quartet_rnaseq_report.modules.rnaseq_supplementary:MultiqcModule'
             # 'rnaseq_qc = quartet_rnaseq_report.modules.rnaseq_qc:MultiqcModule'
         ],
         'multiqc.cli_options.v1':
-        ['disable_plugin = quartet_rnaseq_report.cli:disable_plugin'],
+        [
+            'disable_plugin = quartet_rnaseq_report.cli:disable_plugin',
+            'module_workers = quartet_rnaseq_report.cli:module_workers',
+            'no_parse_cache = quartet_rnaseq_report.cli:no_parse_cache',
+            'split_output = quartet_rnaseq_report.cli:split_output'
+        ],
         'multiqc.hooks.v1': [
-            'execution_start = quartet_rnaseq_report.custom_code:quartet_rnaseq_report_execution_start'
+            'execution_start = quartet_rnaseq_report.custom_code:quartet_rnaseq_report_execution_start',
+            'before_modules = quartet_rnaseq_report.custom_code:quartet_rnaseq_report_before_modules',
+            'execution_finish = quartet_rnaseq_report.custom_code:quartet_rnaseq_report_execution_finish'
         ],
         'multiqc.templates.v1':
         ['quartet_rnaseq_report = quartet_rnaseq_report.templates.default']
@@ -221,6 +221,16 @@
            (remote-fs/with-conn protocol (remote-fs/list-objects bucket prefix false))))
     (map #(str (.getAbsolutePath %) "/") (filter #(fs-lib/directory? %) (fs-lib/list-dir path)))))
 
+(defn exists?
+  "Whether a local file or an object of a fs service exists."
+  [path]
+  (if (fs-service? path)
+    (let [{:keys [protocol bucket prefix]} (parse-path path)]
+      (->> (remote-fs/with-conn protocol (remote-fs/list-objects bucket prefix false))
+           (filter #(= (:key %) prefix))
+           (not-empty?)))
+    (.exists (io/file path))))
+
 (defn make-pattern-fn
   [patterns]
   (map #(re-pattern %) patterns))
@@ -342,6 +352,35 @@
         (call-command! command env)
         (call-command! command)))))
 
+(defn render-report!
+  "Render the report of the prepared results by quartet-rnaseq-report (see report/quartet_rnaseq_report/service.py).
+   The report is rendered by the report service when it's running (quartet-rnaseq-report serve or rseqc.py serve),
+   so Python and MultiQC are not loaded again for every report, or by MultiQC in a new process otherwise.
+   The address of the service is RSEQC_REPORT_SERVICE, or the default socket of quartet-rnaseq-report.
+
+  Required:
+  analysis-dir: The results prepared by exp2qcdt, e.g. the results directory of the task
+  outdir: Create report in the specified output directory.
+
+  Options:
+  | key                | description |
+  | -------------------|-------------|
+  | :title             | Report title. |
+  | :env               | An environemnt map for running quartet-rnaseq-report, such as {:PATH (get-path-variable)} |"
+  [analysis-dir outdir {:keys [title env]
+                        :or   {title "Quartet RNA report"}}]
+  (let [service (System/getenv "RSEQC_REPORT_SERVICE")
+        service-arg (if service (str "--service " service) "")
+        report-command (filter #(> (count %) 0) ["quartet-rnaseq-report" "multiqc"
+                                                 service-arg
+                                                 "--title" (format "'%s'" title)
+                                                 "--output-dir" outdir
+                                                 analysis-dir])
+        command (clj-str/join " " report-command)]
+    (if env
+      (call-command! command env)
+      (call-command! command))))
+
 (defn is-localpath?
   [filepath]
   (re-matches #"^file:\/\/.*" filepath))
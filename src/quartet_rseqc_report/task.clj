@@ -85,10 +85,18 @@
   (filter-mkdir-copy (format "%s%s" data-dir "call-qualimapBAMqc") [".*tar.gz"] dest-dir "results/post_alignment_qc/bam_qc")
   (filter-mkdir-copy (format "%s%s" data-dir "call-qualimapRNAseq") [".*tar.gz"] dest-dir "results/post_alignment_qc/rnaseq_qc")
   (filter-mkdir-copy (format "%s%s" data-dir "call-fastqc") [".*.zip"] dest-dir "results/rawqc/fastqc")
-  (filter-mkdir-copy (format "%s%s" data-dir "call-fastqscreen") [".*.txt"] dest-dir "results/rawqc/fastq_screen"))
+  (filter-mkdir-copy (format "%s%s" data-dir "call-fastqscreen") [".*.txt"] dest-dir "results/rawqc/fastq_screen")
+  ;; The profile is optional, it's missing in the results of the old versions.
+  (when (rseqc/exists? (format "%s%s" data-dir "pipeline_profile.json"))
+    (filter-mkdir-copy (format "%s%s" data-dir "pipeline_profile.json") [".*pipeline_profile.json"]
+                       dest-dir (format "results/pipeline_profile/%s" (fs-lib/base-name data-dir))))
+  ;; The workflow was run on a subsample of reads, the report is preliminary.
+  (when (rseqc/exists? (format "%s%s" data-dir "subsample.json"))
+    (filter-mkdir-copy (format "%s%s" data-dir "subsample.json") [".*subsample.json"]
+                       dest-dir (format "results/subsample/%s" (fs-lib/base-name data-dir)))))
 
 (defn make-report!
-  "Chaining Pipeline: filter-files -> copy-files -> merge_exp_file -> exp2qcdt -> multiqc."
+  "Chaining Pipeline: filter-files -> copy-files -> merge_exp_file -> exp2qcdt -> multiqc (by the report service if it's running)."
   [{:keys [data-dir parameters metadata dest-dir task-id]}]
   (log/info "Generate quartet rnaseq report: " data-dir parameters metadata dest-dir)
   (let [metadata-file (fs-lib/join-paths dest-dir
@@ -137,9 +145,8 @@
                                            {:status "Success" :msg ""})
                                          (fn []
                                            (update-process! task-id 80)
-                                           (rseqc/multiqc result-dir dest-dir {:template "quartet_rnaseq_report"
-                                                                               :title "Quartet RNA report"
-                                                                               :env {:PATH (add-env-to-path "quartet-rseqc-report")}}))]
+                                           (rseqc/render-report! result-dir dest-dir {:title "Quartet RNA report"
+                                                                                      :env {:PATH (add-env-to-path "quartet-rseqc-report")}}))]
                                         (fn [result] (= (:status result) "Success")))
             status (:status (last results))
             msg (apply str (map :msg results))